@@ -1,20 +1,34 @@
 import re
 
-from js.parser import parse_str, parse_file, symbol_table
+from js.parser import parse_str, parse_file, parse_body, symbol_table, \
+	binary_chain
+from js.optimizer import optimize
 
 def block(s):
 	if s.endswith(';'):
 		s = s[:-1]
 	return '{'+s+'}'
 
+def precedence(s):
+	# a call binds as tightly as member access once it has been parsed
+	return s.id == '(' and 160 or s.lbp
+
 def paren(s, first):
-	use_paren = first.lbp and first.lbp < s.lbp
+	use_paren = first.lbp and precedence(first) < precedence(s)
 	return ('(%s)' if use_paren else '%s') % compress(first)
 
+def sign_separated(operator, right):
+	# a - -1 isn't a--1
+	return ' ' + right if right[:1] in '+-' and right[:1] == operator[-1] \
+		else right
+
 def alphabetic_operator_righthand(s, right):
 	right = right and compress(right) or ''
 	return s.id + \
-		(' ' if right and re.match(r'[a-zA-Z_$]', right[0]) else '') + right
+		(' ' if right and re.match(r'[a-zA-Z0-9_$]', right[0]) else '') + right
+
+binary_ids = set(['/', '*', '%', '+', '-', '<', '>', '<=', '>=',
+	'==', '!=', '===', '!==', '||', '&&'])
 
 def compress(s):
 
@@ -56,14 +70,17 @@ def compress(s):
 	## Left-Hand Expressions
 
 	elif s.id == '.':
-		return paren(s, s.first) + '.' + paren(s, s.second)
+		first = paren(s, s.first)
+		if s.first.id == '(number)' and first.isdigit():
+			first = '(%s)' % first # 3.toString() reads as a bad number
+		return first + '.' + paren(s, s.second)
 	elif s.id == '[': # property
 		return paren(s, s.first) + '[' + compress(s.second) + ']'
 
 	elif s.id == 'new':
 		return alphabetic_operator_righthand(s, s.first) + ('(' + \
 			','.join(compress(arg) for arg in s.params) + ')'
-				if hasattr(s, 'params') else '')
+				if s.params is not None else '')
 
 	elif s.id == '(':
 		return paren(s, s.first) + '(' + ','.join(compress(t) for t in s.params) + ')'
@@ -71,18 +88,25 @@ def compress(s):
 	## Unary Operators
 	elif s.id in ('typeof', 'void', 'delete'):
 		return alphabetic_operator_righthand(s, s.first)
-	elif s.id in ('+', '-', '++', '--') and hasattr(s, 'arity'): # unary
-		return s.id + paren(s, s.first)
+	elif s.id in ('+', '-', '++', '--') and s.arity is not None: # unary
+		return s.id + sign_separated(s.id, paren(s, s.first))
 	elif s.id in ('~', '!'):
 		return s.id + paren(s, s.first)
 
-	## Assignment Operator, Multiplicative Operators, Additive Operators
-	## Relational Operators, Equality Operators
-	elif s.id in ('=', '+=', '-=', '*=', '/=',
-			'/', '*', '%', '+', '-', '<', '>', '<=', '>=',
-			'==', '!=', '!==', '!===', '||', '&&'):
+	## Assignment Operator
+	elif s.id in ('=', '+=', '-=', '*=', '/='):
 		return paren(s, s.first) + s.id + paren(s, s.second)
 
+	## Multiplicative Operators, Additive Operators
+	## Relational Operators, Equality Operators
+	elif s.id in binary_ids:
+		# long chains like a + b + c are walked in a loop
+		first, chain = binary_chain(s, binary_ids)
+		return paren(chain[0], first) + ''.join(
+			operator.id + sign_separated(operator.id,
+				paren(operator, operator.second))
+			for operator in chain)
+
 	## Comma Operator
 	elif s.id == ',':
 		return '%s,%s' % (compress(s.first), compress(s.second))
@@ -121,7 +145,7 @@ def compress(s):
 			str += block(compress(s.block))
 		else:
 			str += compress(s.block)
-		if hasattr(s, 'elseblock'):
+		if s.elseblock is not None:
 			str += 'else' + block(compress(s.elseblock))
 		return str
 	elif s.id == 'do':
@@ -129,13 +153,13 @@ def compress(s):
 	elif s.id == 'while':
 		return 'while(%s)%s' % (compress(s.first), block(compress(s.block)))
 	elif s.id == 'for':
-		if hasattr(s, 'iterator'):
+		if s.iterator is not None:
 			for_loop = '%s in %s' % (compress(s.iterator), compress(s.object))
 		else:
 			for_loop = '%s;%s;%s' % (
-				compress(s.initializer) if hasattr(s, 'initializer') else '',
-				compress(s.condition) if hasattr(s, 'condition') else '',
-				compress(s.counter) if hasattr(s, 'counter') else '')
+				compress(s.initializer) if s.initializer is not None else '',
+				compress(s.condition) if s.condition is not None else '',
+				compress(s.counter) if s.counter is not None else '')
 		return 'for(%s)%s' % (for_loop, block(compress(s.block)))
 
 	elif s.id in ('continue', 'break'):
@@ -148,11 +172,12 @@ def compress(s):
 		pass
 	elif s.id == 'try':
 		catch = 'catch(%s){%s}' % (compress(s.e), compress(s.catchblock)) \
-			if hasattr(s, 'catchblock') else ''
+			if s.catchblock is not None else ''
 		final = 'finally{%s}' % compress(s.finallyblock) \
-			if hasattr(s, 'finallyblock') else ''
+			if s.finallyblock is not None else ''
 		return 'try{%s}%s%s' % (compress(s.block), catch, final)
 	elif s.id == 'function':
+		parse_body(s)
 		return 'function%s(%s)%s' % (
 			' ' + compress(s.name) if s.name else '',
 			','.join(compress(param) for param in s.params),
@@ -244,7 +269,7 @@ def populate_scope(parent, s, scope):
 			populate_scope(s, v, scope)
 	elif s.id in ('new', '('):
 		populate_scope(s, s.first, scope)
-		if hasattr(s, 'params'):
+		if s.params is not None:
 			for ast in s.params:
 				populate_scope(s, ast, scope)
 	elif s.id == 'var':
@@ -253,10 +278,10 @@ def populate_scope(parent, s, scope):
 	elif s.id == 'if':
 		populate_scope(s, s.first, scope)
 		populate_scope(s, s.block, scope)
-		if hasattr(s, 'elseblock'):
+		if s.elseblock is not None:
 			populate_scope(s, s.elseblock, scope)
 	elif s.id == 'for':
-		if hasattr(s, 'iterator'):
+		if s.iterator is not None:
 			populate_scope(s, s.iterator, scope)
 			populate_scope(s, s.object, scope)
 		else:
@@ -266,24 +291,30 @@ def populate_scope(parent, s, scope):
 		populate_scope(s, s.block, scope)
 	elif s.id == 'try':
 		populate_scope(s, s.block, scope)
-		if hasattr(s, 'catchblock'):
+		if s.catchblock is not None:
 			catch_scope = LexicalScope(scope, params=[s.e])
 			populate_scope(s, s.catchblock, catch_scope)
-		if hasattr(s, 'finallyblock'):
+		if s.finallyblock is not None:
 			populate_scope(s, s.finallyblock, scope)
 	elif s.id == 'function':
+		parse_body(s)
 		function_scope = LexicalScope(scope, s.vars, s.params, s.functions)
 		if s.name:
 			populate_scope(s, s.name, s.is_decl and function_scope or scope)
 		for param in s.params:
 			populate_scope(s, param, function_scope)
 		populate_scope(s, s.block, function_scope)
+	elif s.id in binary_ids and s.arity is None:
+		first, chain = binary_chain(s, binary_ids)
+		populate_scope(chain[0], first, scope)
+		for operator in chain:
+			populate_scope(operator, operator.second, scope)
 	else:
 		if s.first:
 			populate_scope(s, s.first, scope)
 		if s.second:
 			populate_scope(s, s.second, scope)
-		if hasattr(s, 'block'):
+		if s.block is not None:
 			populate_scope(s, s.block, scope)
 
 if __name__ == '__main__':
@@ -296,7 +327,7 @@ if __name__ == '__main__':
 	#js = '/Users/paul/Code/pyjs/test/for.js'
 	#js = '/Users/paul/Code/pyjs/test/try.js'
 
-	ast = parse_file(js)
+	ast = optimize(parse_file(js))
 	#print ast
 
 	rename_vars(ast)
@@ -1,4 +1,4 @@
-import parser, interpreter
 
-__all__ = ['parser', 'interpreter']
+import parser, interpreter, transpiler, bytecode
 
+__all__ = ['parser', 'interpreter', 'transpiler', 'bytecode']
@@ -0,0 +1,1213 @@
+"""A bytecode compiler and virtual machine for parsed JavaScript.
+
+The symbol tree is compiled into `Code` objects, a flat array of
+(opcode, argument) integer pairs with pools for constants, names and the
+code of nested functions, which are executed by a single dispatch loop
+over an explicit operand stack. Values, objects and scopes are those of
+the interpreter so the two engines can call each other's functions.
+
+Code objects hold no reference to the symbol tree or to a realm, so they
+can be cached, serialized with `dumps` and shared between global objects.
+"""
+
+import marshal
+from array import array
+
+from parser import parse_str, parse_body, binary_chain
+from interpreter import JavaScriptException, JavaScriptFunction, \
+	JavaScriptObject, JavaScriptArray, Activation, ArgumentsObject, \
+	ExecutionContext, Scope, GlobalObject, null, operators, typeof, \
+	toBoolean, toNumber, toString, toObject, toInt32, lessThan, equal, \
+	strictlyEqual, engines, call_stack_exceeded, recursion_limit
+
+
+## Instructions
+
+opnames = [
+	'CONST', 'UNDEFINED', 'NULL', 'TRUE', 'FALSE', 'THIS',
+	'LOAD_NAME', 'LOAD_NAME_THIS', 'STORE_NAME', 'TYPEOF_NAME', 'DELETE_NAME',
+	'GET_PROP', 'SET_PROP', 'DELETE_PROP', 'LOAD_METHOD',
+	'GET_ITEM', 'SET_ITEM', 'DELETE_ITEM', 'LOAD_METHOD_ITEM',
+	'BINARY', 'UNARY', 'TO_NUMBER',
+	'POP', 'DUP', 'DUP2', 'PICK', 'ROT3', 'ROT4',
+	'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_TRUE',
+	'JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP',
+	'CALL', 'NEW', 'RETURN', 'THROW', 'REFERENCE_ERROR',
+	'FUNCTION', 'ARRAY', 'OBJECT',
+	'SET_RESULT', 'LOAD_RESULT',
+	'ENTER_WITH', 'ENTER_CATCH', 'LEAVE_SCOPE', 'SETUP_TRY', 'POP_TRY',
+	'FOR_IN', 'FOR_IN_NEXT',
+]
+for i, name in enumerate(opnames):
+	globals()[name] = i
+
+def less_than(l, r):
+	return lessThan(l, r) or False
+
+def greater_than(l, r):
+	return lessThan(r, l) or False
+
+def less_than_or_equal(l, r):
+	v = lessThan(r, l)
+	return False if v == None else not v
+
+def greater_than_or_equal(l, r):
+	v = lessThan(l, r)
+	return False if v == None else not v
+
+binary_ids = ['/', '*', '%', '+', '-', '<<', '>>', '>>>', '&', '^', '|',
+	'<', '>', '<=', '>=', '==', '!=', '===', '!==']
+binary_operators = tuple([operators[id] for id in binary_ids[:11]] + [
+	less_than, greater_than, less_than_or_equal, greater_than_or_equal,
+	equal, lambda l, r: not equal(l, r),
+	strictlyEqual, lambda l, r: not strictlyEqual(l, r)])
+
+def typeof_value(value):
+	type = typeof(value)
+	if type == 'object' and hasattr(value, 'call'):
+		return 'function'
+	return type
+
+unary_ids = ['-', '+', '!', '~', 'typeof', 'void']
+unary_operators = (
+	lambda v: -toNumber(v),
+	toNumber,
+	lambda v: not toBoolean(v),
+	lambda v: float(~int(toInt32(v))),
+	typeof_value,
+	lambda v: None,
+)
+
+
+class Code(object):
+	"""compiled JavaScript, either a program or the body of a function"""
+	__slots__ = ['instructions', 'constants', 'names', 'functions',
+		'name', 'params', 'vars', 'declarations', 'named_expression',
+		'arguments']
+
+	def __init__(self, instructions, constants, names, functions,
+			name=None, params=(), vars=(), declarations=(),
+			named_expression=False, arguments=True):
+		self.instructions = instructions
+		self.constants = constants
+		self.names = names
+		self.functions = functions # nested Code
+		self.name = name
+		self.params = params
+		self.vars = vars
+		self.declarations = declarations # (name, function index)
+		self.named_expression = named_expression
+		self.arguments = arguments # whether calls make an arguments object
+
+	def __getstate__(self):
+		return (self.instructions.tostring(), self.constants, self.names,
+			tuple(f.__getstate__() for f in self.functions), self.name,
+			self.params, self.vars, self.declarations, self.named_expression,
+			self.arguments)
+
+	def __setstate__(self, state):
+		instructions = array('i')
+		instructions.fromstring(state[0])
+		self.__init__(instructions, state[1], state[2],
+			tuple(Code.from_state(f) for f in state[3]), *state[4:])
+
+	@classmethod
+	def from_state(cls, state):
+		code = cls.__new__(cls)
+		code.__setstate__(state)
+		return code
+
+def dumps(code):
+	"serializes `code` to a string"
+	return marshal.dumps(code.__getstate__())
+
+def loads(data):
+	"loads code serialized with `dumps`"
+	return Code.from_state(marshal.loads(data))
+
+def disassemble(code):
+	"a human readable listing of `code`"
+	lines = []
+	instructions = code.instructions
+	for pc in range(0, len(instructions), 2):
+		op, arg = instructions[pc], instructions[pc + 1]
+		name = opnames[op]
+		if op in (CONST,):
+			detail = repr(code.constants[arg])
+		elif op in (LOAD_NAME, LOAD_NAME_THIS, STORE_NAME, TYPEOF_NAME,
+				DELETE_NAME, GET_PROP, SET_PROP, DELETE_PROP, LOAD_METHOD,
+				ENTER_CATCH):
+			detail = code.names[arg]
+		elif op == BINARY:
+			detail = binary_ids[arg]
+		elif op == UNARY:
+			detail = unary_ids[arg]
+		else:
+			detail = str(arg)
+		lines.append('%4d %-20s %s' % (pc, name, detail))
+	return '\n'.join(lines)
+
+
+## Compile
+
+compilers = {}
+
+def compiler(*ids):
+	"decorator registering the compiler for the symbols `ids`"
+	def bind(fn):
+		for id in ids:
+			compilers[id] = fn
+		return fn
+	return bind
+
+class Block(object):
+	"""an entry on the compiler's block stack, for unwinding jumps out of
+	loops, switches, labelled statements, try statements and scopes"""
+	__slots__ = ['kind', 'labels', 'items', 'breaks', 'continues', 'finally_']
+	def __init__(self, kind, labels=frozenset(), items=0, finally_=None):
+		self.kind = kind
+		self.labels = labels
+		self.items = items # operand stack entries the block keeps
+		self.breaks = []
+		self.continues = []
+		self.finally_ = finally_
+
+class Compiler(object):
+	def __init__(self, program=False):
+		self.program = program
+		self.instructions = []
+		self.constants = []
+		self.constant_indexes = {}
+		self.names = []
+		self.name_indexes = {}
+		self.functions = []
+		self.blocks = []
+
+	def emit(self, op, arg=0):
+		self.instructions.extend((op, arg))
+		return len(self.instructions) - 2
+
+	def here(self):
+		return len(self.instructions)
+
+	def patch(self, at, target=None):
+		self.instructions[at + 1] = self.here() if target is None else target
+
+	def constant(self, value):
+		key = (type(value), value)
+		if key not in self.constant_indexes:
+			self.constant_indexes[key] = len(self.constants)
+			self.constants.append(value)
+		return self.constant_indexes[key]
+
+	def name(self, name):
+		if name not in self.name_indexes:
+			self.name_indexes[name] = len(self.names)
+			self.names.append(name)
+		return self.name_indexes[name]
+
+	def function(self, s):
+		self.functions.append(compile_function(s))
+		return len(self.functions) - 1
+
+	def code(self, **kwargs):
+		return Code(array('i', self.instructions), tuple(self.constants),
+			tuple(self.names), tuple(self.functions), **kwargs)
+
+	def expression(self, s):
+		"compiles `s`, leaving its value on the stack"
+		try:
+			fn = compilers[s.id]
+		except KeyError:
+			self.emit(CONST, self.constant('unknown operation %s' % s.id))
+			self.emit(THROW)
+			return
+		fn(self, s)
+
+	def statement(self, s, labels=frozenset()):
+		if s.id in statement_compilers:
+			statement_compilers[s.id](self, s, labels)
+		elif s.id == 'function' and s.is_decl:
+			pass # instantiated on entry
+		elif self.program:
+			self.expression(s)
+			self.emit(SET_RESULT)
+		else:
+			self.discard(s)
+
+	def block(self, s):
+		for statement in s:
+			self.statement(statement)
+
+	def discard(self, s):
+		"compiles expression `s` for its side effects only"
+		if s.id in ('++', '--') and s.arity is None:
+			# the old value isn't needed, so update as if prefix
+			s.arity = 'unary'
+			self.expression(s)
+			s.arity = None
+		else:
+			self.expression(s)
+		self.emit(POP)
+
+	def unwind(self, target, continues=False):
+		"""emits the clean up for leaving every block inside `target` (all
+		of them if `target` is None), and `target` itself unless continuing"""
+		items = 0
+		for i in reversed(range(len(self.blocks))):
+			block = self.blocks[i]
+			if block is target and continues:
+				break
+			if target is not None:
+				items += block.items
+			if block.kind in ('try', 'finally'):
+				self.emit(POP_TRY)
+			elif block.kind == 'scope':
+				self.emit(LEAVE_SCOPE)
+			if block.kind == 'finally':
+				blocks, self.blocks = self.blocks, self.blocks[:i]
+				for _ in range(items):
+					self.emit(POP)
+				items = 0
+				self.block(block.finally_)
+				self.blocks = blocks
+			if block is target:
+				break
+		for _ in range(items):
+			self.emit(POP)
+
+	def jump_target(self, s, continues=False):
+		label = s.first.value if s.first else None
+		for block in reversed(self.blocks):
+			if continues and block.kind != 'loop':
+				continue
+			if label is None and block.kind in ('loop', 'switch') or \
+					label in block.labels:
+				return block
+		raise SyntaxError("no target for %s" % s.id)
+
+def compile_program(s):
+	"compiles the (global) context `s`, once"
+	if s.bytecode is None:
+		c = Compiler(program=True)
+		c.block(s.first)
+		c.emit(LOAD_RESULT)
+		c.emit(RETURN)
+		s.bytecode = c.code(
+			vars=tuple(sorted(s.vars)),
+			declarations=declarations(c, s))
+	return s.bytecode
+
+def declarations(c, s):
+	return tuple((name.value, c.function(f))
+		for name, f in sorted(s.functions.items(), key=lambda i: i[0].value))
+
+def compile_function(s):
+	parse_body(s)
+	c = Compiler()
+	c.block(s.block)
+	c.emit(UNDEFINED)
+	c.emit(RETURN)
+	return c.code(
+		name=s.name.value if s.name else None,
+		params=tuple(p.value for p in s.params),
+		vars=tuple(sorted(s.vars)),
+		declarations=declarations(c, s),
+		named_expression=bool(s.name and not s.is_decl),
+		arguments=bool(s.uses_arguments))
+
+
+## Expressions
+
+@compiler('this')
+def compile_this(c, s):
+	c.emit(THIS)
+
+@compiler('(identifier)')
+def compile_identifier(c, s):
+	c.emit(LOAD_NAME, c.name(s.value))
+
+@compiler('(number)')
+def compile_number(c, s):
+	c.emit(CONST, c.constant(float(s.value)))
+
+@compiler('(string)')
+def compile_string(c, s):
+	c.emit(CONST, c.constant(s.value))
+
+@compiler('(regexp)')
+def compile_regexp(c, s):
+	c.emit(UNDEFINED) # TODO
+
+@compiler('null')
+def compile_null(c, s):
+	c.emit(NULL)
+
+@compiler('true')
+def compile_true(c, s):
+	c.emit(TRUE)
+
+@compiler('false')
+def compile_false(c, s):
+	c.emit(FALSE)
+
+@compiler('(array)')
+def compile_array(c, s):
+	for element in s.first:
+		c.expression(element)
+	c.emit(ARRAY, len(s.first))
+
+@compiler('(object)')
+def compile_object(c, s):
+	keys = []
+	for k, v in s.first:
+		keys.append(toString(float(k.value)) if k.id == '(number)' else k.value)
+		c.expression(v)
+	c.emit(OBJECT, c.constant(tuple(keys)))
+
+@compiler('.')
+def compile_dot(c, s):
+	c.expression(s.first)
+	c.emit(GET_PROP, c.name(s.second.value))
+
+@compiler('[')
+def compile_property(c, s):
+	c.expression(s.first)
+	c.expression(s.second)
+	c.emit(GET_ITEM)
+
+@compiler('new')
+def compile_new(c, s):
+	c.expression(s.first)
+	params = s.params or []
+	for param in params:
+		c.expression(param)
+	c.emit(NEW, len(params))
+
+@compiler('(')
+def compile_call(c, s):
+	f = s.first
+	if f.id == '(identifier)':
+		c.emit(LOAD_NAME_THIS, c.name(f.value))
+	elif f.id == '.':
+		c.expression(f.first)
+		c.emit(LOAD_METHOD, c.name(f.second.value))
+	elif f.id == '[':
+		c.expression(f.first)
+		c.expression(f.second)
+		c.emit(LOAD_METHOD_ITEM)
+	else:
+		c.emit(UNDEFINED)
+		c.expression(f)
+	for param in s.params:
+		c.expression(param)
+	c.emit(CALL, len(s.params))
+
+def compile_store(c, s, value):
+	"""compiles an assignment of the value `value` emits to the reference
+	`s`, leaving the value on the stack"""
+	if s.id == '(identifier)':
+		value()
+		c.emit(STORE_NAME, c.name(s.value))
+	elif s.id == '.':
+		c.expression(s.first)
+		value()
+		c.emit(SET_PROP, c.name(s.second.value))
+	elif s.id == '[':
+		c.expression(s.first)
+		c.expression(s.second)
+		value()
+		c.emit(SET_ITEM)
+	else:
+		c.expression(s)
+		c.emit(REFERENCE_ERROR)
+
+def compile_update_store(c, s, update, postfix=False):
+	"""compiles a read-modify-write of the reference `s`, `update` emits the
+	modification of the value on the stack"""
+	if s.id == '(identifier)':
+		c.emit(LOAD_NAME, c.name(s.value))
+		if postfix:
+			c.emit(TO_NUMBER)
+			c.emit(DUP)
+		update()
+		c.emit(STORE_NAME, c.name(s.value))
+	elif s.id == '.':
+		c.expression(s.first)
+		c.emit(DUP)
+		c.emit(GET_PROP, c.name(s.second.value))
+		if postfix:
+			c.emit(TO_NUMBER)
+			c.emit(DUP)
+			c.emit(ROT3)
+		update()
+		c.emit(SET_PROP, c.name(s.second.value))
+	elif s.id == '[':
+		c.expression(s.first)
+		c.expression(s.second)
+		c.emit(DUP2)
+		c.emit(GET_ITEM)
+		if postfix:
+			c.emit(TO_NUMBER)
+			c.emit(DUP)
+			c.emit(ROT4)
+		update()
+		c.emit(SET_ITEM)
+	else:
+		c.expression(s)
+		c.emit(REFERENCE_ERROR)
+		return
+	if postfix:
+		c.emit(POP)
+
+@compiler('++', '--')
+def compile_increment(c, s):
+	operator = binary_ids.index(s.id[0])
+	def update():
+		c.emit(CONST, c.constant(1.0))
+		c.emit(BINARY, operator)
+	if s.arity is not None:
+		def update_prefix():
+			c.emit(TO_NUMBER)
+			update()
+		compile_update_store(c, s.first, update_prefix)
+	else:
+		compile_update_store(c, s.first, update, postfix=True)
+
+@compiler('typeof')
+def compile_typeof(c, s):
+	if s.first.id == '(identifier)':
+		c.emit(TYPEOF_NAME, c.name(s.first.value))
+	else:
+		c.expression(s.first)
+		c.emit(UNARY, unary_ids.index('typeof'))
+
+@compiler('delete')
+def compile_delete(c, s):
+	l = s.first
+	if l.id == '(identifier)':
+		c.emit(DELETE_NAME, c.name(l.value))
+	elif l.id == '.':
+		c.expression(l.first)
+		c.emit(DELETE_PROP, c.name(l.second.value))
+	elif l.id == '[':
+		c.expression(l.first)
+		c.expression(l.second)
+		c.emit(DELETE_ITEM)
+	else:
+		c.expression(l)
+		c.emit(POP)
+		c.emit(TRUE)
+
+@compiler('void', '~', '!')
+def compile_unary(c, s):
+	c.expression(s.first)
+	c.emit(UNARY, unary_ids.index(s.id))
+
+@compiler(*binary_ids)
+def compile_binary(c, s):
+	if s.arity is not None: # unary + and -
+		return compile_unary(c, s)
+	first, chain = binary_chain(s, binary_ids)
+	c.expression(first)
+	for operator in chain:
+		c.expression(operator.second)
+		c.emit(BINARY, binary_ids.index(operator.id))
+
+@compiler('instanceof', 'in')
+def compile_relational(c, s):
+	# these need the context, so they're calls on a constant function
+	c.emit(UNDEFINED)
+	c.emit(CONST, c.constant(s.id))
+	c.expression(s.first)
+	c.expression(s.second)
+	c.emit(CALL, -1)
+
+@compiler('&&', '||')
+def compile_logical(c, s):
+	first, chain = binary_chain(s, (s.id,))
+	c.expression(first)
+	jumps = []
+	for operator in chain:
+		jumps.append(c.emit(
+			JUMP_IF_FALSE_OR_POP if s.id == '&&' else JUMP_IF_TRUE_OR_POP))
+		c.expression(operator.second)
+	for jump in jumps:
+		c.patch(jump)
+
+@compiler('?')
+def compile_conditional(c, s):
+	c.expression(s.first)
+	otherwise = c.emit(JUMP_IF_FALSE)
+	c.expression(s.second)
+	end = c.emit(JUMP)
+	c.patch(otherwise)
+	c.expression(s.third)
+	c.patch(end)
+
+@compiler('=')
+def compile_assignment(c, s):
+	compile_store(c, s.first, lambda: c.expression(s.second))
+
+@compiler('*=', '/=', '%=', '+=', '-=', '<<=', '>>=', '>>>=', '&=', '^=', '|=')
+def compile_compound_assignment(c, s):
+	def update():
+		c.expression(s.second)
+		c.emit(BINARY, binary_ids.index(s.id[:-1]))
+	compile_update_store(c, s.first, update)
+
+@compiler(',')
+def compile_comma(c, s):
+	c.expression(s.first)
+	c.emit(POP)
+	c.expression(s.second)
+
+@compiler('function')
+def compile_function_expression(c, s):
+	c.emit(FUNCTION, c.function(s))
+
+
+## Statements
+
+statement_compilers = {}
+
+def statement_compiler(*ids):
+	"decorator registering the compiler for the statements `ids`"
+	def bind(fn):
+		for id in ids:
+			statement_compilers[id] = fn
+		return fn
+	return bind
+
+@statement_compiler('(statement)')
+def compile_statement(c, s, labels):
+	labels = frozenset(l.value for l in s.labels)
+	if not labels or s.first.id in ('do', 'while', 'for', 'switch'):
+		c.statement(s.first, labels)
+		return
+	block = Block('label', labels)
+	c.blocks.append(block)
+	c.statement(s.first)
+	c.blocks.pop()
+	for at in block.breaks:
+		c.patch(at)
+
+@statement_compiler('{')
+def compile_block_statement(c, s, labels):
+	c.block(s.block)
+
+@statement_compiler('var')
+def compile_var(c, s, labels):
+	for var in s.first:
+		if var.id != '(identifier)':
+			c.discard(var)
+
+@statement_compiler('if')
+def compile_if(c, s, labels):
+	c.expression(s.first)
+	otherwise = c.emit(JUMP_IF_FALSE)
+	c.block(s.block)
+	if s.elseblock is not None:
+		end = c.emit(JUMP)
+		c.patch(otherwise)
+		c.block(s.elseblock)
+		c.patch(end)
+	else:
+		c.patch(otherwise)
+
+def loop_body(c, s, labels, items=0):
+	block = Block('loop', labels, items)
+	c.blocks.append(block)
+	c.block(s.block)
+	c.blocks.pop()
+	return block
+
+@statement_compiler('while')
+def compile_while(c, s, labels):
+	start = c.here()
+	c.expression(s.first)
+	end = c.emit(JUMP_IF_FALSE)
+	block = loop_body(c, s, labels)
+	c.emit(JUMP, start)
+	c.patch(end)
+	for at in block.continues:
+		c.patch(at, start)
+	for at in block.breaks:
+		c.patch(at)
+
+@statement_compiler('do')
+def compile_do(c, s, labels):
+	start = c.here()
+	block = loop_body(c, s, labels)
+	for at in block.continues:
+		c.patch(at)
+	c.expression(s.second)
+	c.emit(JUMP_IF_TRUE, start)
+	for at in block.breaks:
+		c.patch(at)
+
+@statement_compiler('for')
+def compile_for(c, s, labels):
+	if s.iterator is not None:
+		return compile_for_in(c, s, labels)
+	if s.initializer is not None:
+		if s.initializer.id == 'var':
+			compile_var(c, s.initializer, labels)
+		else:
+			c.discard(s.initializer)
+	start = c.here()
+	end = None
+	if s.condition is not None:
+		c.expression(s.condition)
+		end = c.emit(JUMP_IF_FALSE)
+	block = loop_body(c, s, labels)
+	for at in block.continues:
+		c.patch(at)
+	if s.counter is not None:
+		c.discard(s.counter)
+	c.emit(JUMP, start)
+	if end is not None:
+		c.patch(end)
+	for at in block.breaks:
+		c.patch(at)
+
+def compile_for_in(c, s, labels):
+	identifier = s.iterator
+	if identifier.id == 'var':
+		identifier = identifier.first[0]
+	c.expression(s.object)
+	c.emit(FOR_IN)
+	start = c.emit(FOR_IN_NEXT)
+	# the key is below whatever the reference needs on the stack
+	depth = {'(identifier)': 1, '.': 2, '[': 3}.get(identifier.id, 1)
+	compile_store(c, identifier, lambda: c.emit(PICK, depth))
+	c.emit(POP)
+	c.emit(POP)
+	block = loop_body(c, s, labels, items=1)
+	c.emit(JUMP, start)
+	c.patch(start)
+	for at in block.continues:
+		c.patch(at, start)
+	for at in block.breaks:
+		c.patch(at)
+
+@statement_compiler('continue')
+def compile_continue(c, s, labels):
+	target = c.jump_target(s, continues=True)
+	c.unwind(target, continues=True)
+	target.continues.append(c.emit(JUMP))
+
+@statement_compiler('break')
+def compile_break(c, s, labels):
+	target = c.jump_target(s)
+	c.unwind(target)
+	target.breaks.append(c.emit(JUMP))
+
+@statement_compiler('return')
+def compile_return(c, s, labels):
+	if s.first:
+		c.expression(s.first)
+	else:
+		c.emit(UNDEFINED)
+	blocks = c.blocks
+	for i in reversed(range(len(blocks))):
+		block = blocks[i]
+		if block.kind in ('try', 'finally'):
+			c.emit(POP_TRY)
+		elif block.kind == 'scope':
+			c.emit(LEAVE_SCOPE)
+		if block.kind == 'finally':
+			c.blocks = blocks[:i]
+			c.block(block.finally_)
+	c.blocks = blocks
+	c.emit(RETURN)
+
+@statement_compiler('throw')
+def compile_throw(c, s, labels):
+	c.expression(s.first)
+	c.emit(THROW)
+
+@statement_compiler('with')
+def compile_with(c, s, labels):
+	c.expression(s.first)
+	c.emit(ENTER_WITH)
+	c.blocks.append(Block('scope'))
+	c.block(s.block)
+	c.blocks.pop()
+	c.emit(LEAVE_SCOPE)
+
+@statement_compiler('switch')
+def compile_switch(c, s, labels):
+	c.expression(s.condition)
+	matches = []
+	for case in s.cases:
+		if case.id == 'case':
+			c.emit(DUP)
+			c.expression(case.first)
+			c.emit(BINARY, binary_ids.index('==='))
+			matches.append(c.emit(JUMP_IF_TRUE))
+		else:
+			matches.append(None)
+	otherwise = c.emit(JUMP)
+	block = Block('switch', labels, 1)
+	c.blocks.append(block)
+	default = None
+	for case, match in zip(s.cases, matches):
+		if match is None:
+			default = c.here()
+		else:
+			c.patch(match)
+		c.block(case.block or [])
+	c.blocks.pop()
+	c.patch(otherwise, c.here() if default is None else default)
+	c.emit(POP)
+	# breaks have popped the discriminant already
+	for at in block.breaks:
+		c.patch(at)
+
+@statement_compiler('try')
+def compile_try(c, s, labels):
+	finally_ = s.finallyblock
+	if finally_ is not None:
+		setup_finally = c.emit(SETUP_TRY)
+		c.blocks.append(Block('finally', finally_=finally_))
+	if s.catchblock is not None:
+		setup_catch = c.emit(SETUP_TRY)
+		c.blocks.append(Block('try'))
+		c.block(s.block)
+		c.blocks.pop()
+		c.emit(POP_TRY)
+		end = c.emit(JUMP)
+		c.patch(setup_catch)
+		c.emit(ENTER_CATCH, c.name(s.e.value))
+		c.blocks.append(Block('scope'))
+		c.block(s.catchblock)
+		c.blocks.pop()
+		c.emit(LEAVE_SCOPE)
+		c.patch(end)
+	else:
+		c.block(s.block)
+	if finally_ is not None:
+		c.blocks.pop()
+		c.emit(POP_TRY)
+		c.block(finally_)
+		end = c.emit(JUMP)
+		c.patch(setup_finally)
+		# the exception is on the stack while the finally block runs
+		c.blocks.append(Block('pending', items=1))
+		c.block(finally_)
+		c.blocks.pop()
+		c.emit(THROW)
+		c.patch(end)
+
+
+## Execute
+
+class BytecodeFunction(JavaScriptFunction):
+	"a function whose body is run by the virtual machine"
+	def __init__(self, prototype, code, scope):
+		super(BytecodeFunction, self).__init__(prototype, code, scope)
+		self.code = code
+
+	def enter(self, this, args, context):
+		"the context a call from `context` runs the code in"
+		global_object = context.global_object
+		if global_object.budget is not None:
+			global_object.budget.spend()
+		if context.depth >= max_depth:
+			raise call_stack_exceeded(context)
+		activation = Activation()
+		if self.code.arguments:
+			activation.put('arguments',
+				ArgumentsObject(global_object.object['prototype'], args, self),
+				dont_delete=True)
+		c = ExecutionContext(Scope(self.scope, activation), this, global_object,
+			context.depth + 1)
+		instantiate(self.code, c, activation, args)
+		return c
+
+	def call(self, this, args, context):
+		try:
+			return execute(self.code, self.enter(this, args, context))
+		except RuntimeError, e: # recursing through native functions
+			if not recursion_limit(e):
+				raise
+			raise call_stack_exceeded(context)
+
+def make_function(code, c):
+	prototype = c.global_object.function['prototype']
+	if code.named_expression:
+		scope = Scope(c.scope, c.global_object.object.construct([], c))
+		f = BytecodeFunction(prototype, code, scope)
+		scope.object.put(code.name, f, dont_delete=True, read_only=True)
+		return f
+	return BytecodeFunction(prototype, code, c.scope)
+
+def instantiate(code, c, variables, args=()):
+	for i, name in enumerate(code.params):
+		variables.put(name, args[i] if i < len(args) else None,
+			dont_delete=True)
+	for name, i in code.declarations:
+		variables.put(name, make_function(code.functions[i], c),
+			dont_delete=True)
+	for name in code.vars:
+		if name not in variables:
+			variables.put(name, None, dont_delete=True)
+
+def relational(id):
+	def relational(this, args, c):
+		v, o = args
+		if not isinstance(o, JavaScriptObject) or \
+				id == 'instanceof' and not hasattr(o, 'has_instance'):
+			raise JavaScriptException(
+				c.global_object.type_error.construct([], c))
+		if id == 'in':
+			return toString(v) in o
+		return o.has_instance(v, c)
+	return relational
+relational_operators = {'in': relational('in'),
+	'instanceof': relational('instanceof')}
+
+# how deep calls may nest before a RangeError is thrown
+max_depth = 10000
+
+suspended = object() # yielded by `steps` when its quota runs out
+
+def execute(code, c):
+	"runs `code` in context `c`, returning the value it returns"
+	for v in steps(code, c):
+		return v
+
+def steps(code, c, quota=0):
+	"""runs `code` in context `c`, yielding the value it returns.
+
+	With a `quota`, suspended is yielded each time that many steps, loop
+	iterations and function calls, have run, and running resumes when the
+	next value is asked for.
+
+	Calls of bytecode functions are run by the same loop, with the state of
+	their callers kept on `frames` instead of the Python stack, so only
+	max_depth limits how deep a program can recurse.  Calls through native
+	functions like Function.prototype.call still nest on the Python stack,
+	and run to completion without suspending.
+	"""
+	left = quota or -1 # steps until suspending, never when negative
+	budget = c.global_object.budget # calls spend theirs in enter
+	instructions = code.instructions
+	constants, names, functions = code.constants, code.names, code.functions
+	stack = []
+	push, pop = stack.append, stack.pop
+	handlers = []
+	result = None
+	pc = 0
+	constructing = None # the object a construct call is making
+	frames = []
+	while 1:
+		try:
+			while 1:
+				op = instructions[pc]
+				arg = instructions[pc + 1]
+				pc += 2
+
+				if op == LOAD_NAME:
+					name = names[arg]
+					scope = c.scope
+					while scope:
+						o = scope.object
+						if name in o:
+							push(o[name])
+							break
+						scope = scope.parent
+					else:
+						raise JavaScriptException(
+							c.global_object.reference_error.construct([], c))
+				elif op == CONST:
+					push(constants[arg])
+				elif op == GET_PROP:
+					o = stack[-1]
+					if not isinstance(o, JavaScriptObject):
+						o = toObject(o, c)
+					stack[-1] = o[names[arg]]
+				elif op == BINARY:
+					r = pop()
+					stack[-1] = binary_operators[arg](stack[-1], r)
+				elif op == STORE_NAME:
+					name = names[arg]
+					scope = c.scope
+					while scope:
+						if name in scope.object:
+							scope.object[name] = stack[-1]
+							break
+						scope = scope.parent
+					else:
+						c.global_object[name] = stack[-1]
+				elif op == POP:
+					pop()
+				elif op == JUMP_IF_FALSE:
+					if not toBoolean(pop()):
+						pc = arg
+				elif op == JUMP:
+					if arg < pc: # a loop's back edge
+						if budget is not None:
+							budget.spend()
+						left -= 1
+						if not left:
+							yield suspended
+							left = quota
+					pc = arg
+				elif op == CALL:
+					if arg < 0: # instanceof, in
+						r = pop()
+						v = pop()
+						f = relational_operators[pop()]
+						stack[-1] = f(None, (v, r), c)
+						continue
+					if arg:
+						args = stack[-arg:]
+						del stack[-arg:]
+					else:
+						args = []
+					f = pop()
+					if f.__class__ is BytecodeFunction:
+						callee = f.enter(stack[-1], args, c)
+						pop()
+						frames.append((instructions, constants, names,
+							functions, stack, handlers, pc, c, constructing))
+						code, c, constructing = f.code, callee, None
+						instructions = code.instructions
+						constants, names = code.constants, code.names
+						functions = code.functions
+						stack = []
+						push, pop = stack.append, stack.pop
+						handlers = []
+						pc = 0
+						left -= 1
+						if not left:
+							yield suspended
+							left = quota
+						continue
+					if typeof(f) != 'object' or not hasattr(f, 'call'):
+						raise JavaScriptException(
+							c.global_object.type_error.construct([], c))
+					stack[-1] = f.call(stack[-1], args, c)
+				elif op == LOAD_NAME_THIS:
+					name = names[arg]
+					scope = c.scope
+					while scope:
+						o = scope.object
+						if name in o:
+							push(None if isinstance(o, Activation) else o)
+							push(o[name])
+							break
+						scope = scope.parent
+					else:
+						raise JavaScriptException(
+							c.global_object.reference_error.construct([], c))
+				elif op == LOAD_METHOD:
+					o = toObject(stack[-1], c)
+					stack[-1] = o
+					push(o[names[arg]])
+				elif op == SET_PROP:
+					v = pop()
+					toObject(stack[-1], c)[names[arg]] = v
+					stack[-1] = v
+				elif op == GET_ITEM:
+					key = toString(pop())
+					o = stack[-1]
+					if not isinstance(o, JavaScriptObject):
+						o = toObject(o, c)
+					stack[-1] = o[key]
+				elif op == SET_ITEM:
+					v = pop()
+					key = toString(pop())
+					toObject(stack[-1], c)[key] = v
+					stack[-1] = v
+				elif op == JUMP_IF_TRUE:
+					if toBoolean(pop()):
+						if arg < pc: # do while
+							if budget is not None:
+								budget.spend()
+							left -= 1
+							if not left:
+								yield suspended
+								left = quota
+						pc = arg
+				elif op == RETURN:
+					v = pop()
+					if not frames:
+						yield v
+						return
+					if constructing is not None and typeof(v) != 'object':
+						v = constructing
+					instructions, constants, names, functions, stack, \
+						handlers, pc, c, constructing = frames.pop()
+					push, pop = stack.append, stack.pop
+					push(v)
+				elif op == SET_RESULT:
+					result = pop()
+				elif op == DUP:
+					push(stack[-1])
+				elif op == UNARY:
+					stack[-1] = unary_operators[arg](stack[-1])
+				elif op == TO_NUMBER:
+					stack[-1] = toNumber(stack[-1])
+				elif op == UNDEFINED:
+					push(None)
+				elif op == THIS:
+					push(c.this)
+				elif op == NULL:
+					push(null)
+				elif op == TRUE:
+					push(True)
+				elif op == FALSE:
+					push(False)
+				elif op == JUMP_IF_FALSE_OR_POP:
+					if not toBoolean(stack[-1]):
+						pc = arg
+					else:
+						pop()
+				elif op == JUMP_IF_TRUE_OR_POP:
+					if toBoolean(stack[-1]):
+						pc = arg
+					else:
+						pop()
+				elif op == LOAD_METHOD_ITEM:
+					key = toString(pop())
+					o = toObject(stack[-1], c)
+					stack[-1] = o
+					push(o[key])
+				elif op == PICK:
+					push(stack[-arg])
+				elif op == DUP2:
+					stack.extend(stack[-2:])
+				elif op == ROT3:
+					stack.insert(-2, pop())
+				elif op == ROT4:
+					stack.insert(-3, pop())
+				elif op == NEW:
+					if arg:
+						args = stack[-arg:]
+						del stack[-arg:]
+					else:
+						args = []
+					f = stack[-1]
+					if f.__class__ is BytecodeFunction:
+						o = f.instance(c)
+						callee = f.enter(o, args, c)
+						pop()
+						frames.append((instructions, constants, names,
+							functions, stack, handlers, pc, c, constructing))
+						code, c, constructing = f.code, callee, o
+						instructions = code.instructions
+						constants, names = code.constants, code.names
+						functions = code.functions
+						stack = []
+						push, pop = stack.append, stack.pop
+						handlers = []
+						pc = 0
+						left -= 1
+						if not left:
+							yield suspended
+							left = quota
+						continue
+					if typeof(f) != 'object' or not hasattr(f, 'construct'):
+						raise JavaScriptException(
+							c.global_object.type_error.construct([], c))
+					stack[-1] = f.construct(args, c)
+				elif op == FUNCTION:
+					push(make_function(functions[arg], c))
+				elif op == ARRAY:
+					a = JavaScriptArray(c.global_object.array['prototype'],
+						stack[len(stack) - arg:])
+					del stack[len(stack) - arg:]
+					push(a)
+				elif op == OBJECT:
+					o = c.global_object.object.construct([], c)
+					keys = constants[arg]
+					if keys:
+						for key, v in zip(keys, stack[-len(keys):]):
+							o[key] = v
+						del stack[-len(keys):]
+					push(o)
+				elif op == TYPEOF_NAME:
+					name = names[arg]
+					scope = c.scope
+					while scope:
+						if name in scope.object:
+							push(typeof_value(scope.object[name]))
+							break
+						scope = scope.parent
+					else:
+						push('undefined')
+				elif op == DELETE_NAME:
+					name = names[arg]
+					scope = c.scope
+					while scope:
+						if name in scope.object:
+							push(scope.object.__delitem__(name))
+							break
+						scope = scope.parent
+					else:
+						push(True)
+				elif op == DELETE_PROP:
+					stack[-1] = toObject(stack[-1], c).__delitem__(names[arg])
+				elif op == DELETE_ITEM:
+					key = toString(pop())
+					stack[-1] = toObject(stack[-1], c).__delitem__(key)
+				elif op == THROW:
+					raise JavaScriptException(pop())
+				elif op == REFERENCE_ERROR:
+					raise JavaScriptException(
+						c.global_object.reference_error.construct([], c))
+				elif op == LOAD_RESULT:
+					push(result)
+				elif op == FOR_IN:
+					stack[-1] = iter(toObject(stack[-1], c))
+				elif op == FOR_IN_NEXT:
+					for key in stack[-1]:
+						push(key)
+						break
+					else:
+						pop()
+						pc = arg
+				elif op == SETUP_TRY:
+					handlers.append((arg, len(stack), c.scope))
+				elif op == POP_TRY:
+					handlers.pop()
+				elif op == ENTER_WITH:
+					c.scope = Scope(c.scope, toObject(pop(), c))
+				elif op == ENTER_CATCH:
+					o = c.global_object.object.construct([], c)
+					o.put(names[arg], pop(), dont_delete=True)
+					c.scope = Scope(c.scope, o)
+				elif op == LEAVE_SCOPE:
+					c.scope = c.scope.parent
+				else:
+					raise SystemError('bad opcode %d' % op)
+		except JavaScriptException, e:
+			# unwind to the innermost frame with a handler
+			while not handlers and frames:
+				instructions, constants, names, functions, stack, \
+					handlers, pc, c, constructing = frames.pop()
+				push, pop = stack.append, stack.pop
+			if not handlers:
+				raise
+			pc, depth, c.scope = handlers.pop()
+			del stack[depth:]
+			push(e.value)
+
+
+def start(symbol, global_object, quota=0):
+	"""starts running program `symbol`, returning the generator of `steps`
+	that runs it"""
+	code = compile_program(symbol)
+	c = ExecutionContext(Scope(object=global_object),
+		global_object, global_object)
+	instantiate(code, c, global_object)
+	return steps(code, c, quota)
+
+def run(symbol, global_object):
+	for v in start(symbol, global_object):
+		return v
+
+engines['bytecode'] = run
@@ -1,12 +1,69 @@
-import math, sys, random
+import math, sys, time, random
+from array import array
+from weakref import ref
 from math import isinf, isnan, copysign
-from parser import parse_str
+from parser import parse_str, parse_iter, parse_body, children, \
+	binary_chain, recursion_limit
 
 null = object()
 inf = float('inf')
 neginf = float('-inf')
 nan = float('nan')
 
+# strings at least this long are concatenated lazily
+rope_length = 256
+
+class Rope(object):
+	"""the string `left` + `right`, each a str or another rope, only joined
+	together once its characters are needed, so building a long string a
+	piece at a time takes linear time; flattened ropes keep the str in `left`
+	and None in `right`"""
+	__slots__ = ['left', 'right', 'length']
+	def __init__(self, left, right):
+		self.left = left
+		self.right = right
+		self.length = len(left) + len(right)
+
+	def flatten(self):
+		if self.right is not None:
+			parts, stack = [], [self]
+			while stack:
+				s = stack.pop()
+				if s.__class__ is not Rope:
+					parts.append(s)
+				elif s.right is None:
+					parts.append(s.left)
+				else:
+					stack.append(s.right)
+					stack.append(s.left)
+			self.left, self.right = ''.join(parts), None
+		return self.left
+
+	__str__ = flatten
+
+	def __len__(self):
+		return self.length
+	def __eq__(self, other):
+		if other.__class__ is Rope:
+			other = other.flatten()
+		return self.flatten() == other
+	def __ne__(self, other):
+		return not self == other
+	def __hash__(self):
+		return hash(self.flatten())
+	def __repr__(self):
+		return '<Rope %r>' % self.flatten()
+
+def concatenate(l, r):
+	"the string `l` + `r`, either of which may be a rope"
+	if len(l) + len(r) < rope_length: # so neither is a rope
+		return l + r
+	if not l:
+		return r
+	if not r:
+		return l
+	return Rope(l, r)
+
 def typeof(value):
 	if value is None:
 		return 'undefined'
@@ -18,11 +75,14 @@ def typeof(value):
 		return 'string'
 	if isinstance(value, float):
 		return 'number'
+	if value.__class__ is Rope:
+		return 'string'
 	return 'object'
 
 def toPrimitive(value, preferred=None):
 	if value is null or value is None or isinstance(value, float) \
-			or isinstance(value, str) or isinstance(value, bool):
+			or isinstance(value, str) or isinstance(value, bool) \
+			or value.__class__ is Rope:
 		return value
 	if isinstance(value, int):
 		return float(value)
@@ -31,9 +91,11 @@ def toPrimitive(value, preferred=None):
 def toBoolean(value):
 	return not (value is null or value is None or value is False
 		or isinstance(value, float) and value == 0
-		or isinstance(value, str) and len(str) == 0)
+		or isinstance(value, str) and len(value) == 0)
 
 def toNumber(value):
+	if value.__class__ is float:
+		return value
 	if value is None:
 		return nan
 	if value is null:
@@ -42,6 +104,8 @@ def toNumber(value):
 		return 1 if value else 0
 	if isinstance(value, float):
 		return value
+	if value.__class__ is Rope:
+		value = value.flatten()
 	if isinstance(value, basestring):
 		try:
 			return float(value) # TODO
@@ -77,7 +141,7 @@ def toString(value):
 	if type == 'boolean':
 		return value and 'true' or 'false'
 	if type == 'string':
-		return value
+		return value if value.__class__ is not Rope else value.flatten()
 	if type == 'number':
 		if isnan(value):
 			return 'NaN'
@@ -104,47 +168,81 @@ def toObject(value, c):
 		return JavaScriptNumber(prototype('number'), value)
 	if isinstance(value, str):
 		return JavaScriptString(prototype('string'), value)
+	if value.__class__ is Rope:
+		return JavaScriptString(prototype('string'), value.flatten())
 	return value
 
-def applyOperator(operator, l, r):
-	## Multiplicative Operators
-	if operator == '/':
-		return toNumber(l) / toNumber(r)
-	if operator == '*':
-		return toNumber(l) * toNumber(r)
-	if operator == '%':
-		l, r = toNumber(l), toNumber(r)
-		return (l % r) - (0 if l >= 0 else r)
-
-	## Additive Operators
-	if operator == '-':
-		return toNumber(l) - toNumber(r)
-	if operator == '+':
-		l, r = toPrimitive(l), toPrimitive(r)
-		if typeof(l) == 'string' or typeof(r) == 'string':
-			return toString(l) + toString(r)
-		else:
-			return toNumber(l) + toNumber(r)
+## Multiplicative Operators
 
-	## Bitwise Shift Operators
-	if operator == '<<':
-		return float(int(toInt32(l)) << int(toInt32(r) & 0x1f))
-	if operator == '>>':
-		return float(int(toInt32(l)) >> int(toInt32(r) & 0x1f))
-	if operator == '>>>':
-		pass # TODO
+def divide(l, r):
+	return toNumber(l) / toNumber(r)
+
+def multiply(l, r):
+	if l.__class__ is float and r.__class__ is float:
+		return l * r
+	return toNumber(l) * toNumber(r)
+
+def modulo(l, r):
+	l, r = toNumber(l), toNumber(r)
+	return (l % r) - (0 if l >= 0 else r)
+
+## Additive Operators
 
-	## Binary Bitwise Operators
-	if operator == '&':
-		return float(int(toInt32(l)) & int(toInt32(r)))
-	if operator == '^':
-		return float(int(toInt32(l)) ^ int(toInt32(r)))
-	if operator == '|':
-		return float(int(toInt32(l)) | int(toInt32(r)))
+def add(l, r):
+	if l.__class__ is float and r.__class__ is float:
+		return l + r
+	l, r = toPrimitive(l), toPrimitive(r)
+	if typeof(l) == 'string' or typeof(r) == 'string':
+		return concatenate(l if l.__class__ is Rope else toString(l),
+			r if r.__class__ is Rope else toString(r))
+	else:
+		return toNumber(l) + toNumber(r)
+
+def subtract(l, r):
+	if l.__class__ is float and r.__class__ is float:
+		return l - r
+	return toNumber(l) - toNumber(r)
+
+## Bitwise Shift Operators
+
+# only the low five bits of the count are used
+
+def left_shift(l, r):
+	return float(toInt32(int(toInt32(l)) << (int(toUint32(r)) & 0x1f)))
+
+def signed_right_shift(l, r):
+	return float(int(toInt32(l)) >> (int(toUint32(r)) & 0x1f))
+
+def unsigned_right_shift(l, r):
+	return float(int(toUint32(l)) >> (int(toUint32(r)) & 0x1f))
+
+## Binary Bitwise Operators
+
+def bitwise_and(l, r):
+	return float(int(toInt32(l)) & int(toInt32(r)))
+
+def bitwise_xor(l, r):
+	return float(int(toInt32(l)) ^ int(toInt32(r)))
+
+def bitwise_or(l, r):
+	return float(int(toInt32(l)) | int(toInt32(r)))
+
+operators = {
+	'/': divide, '*': multiply, '%': modulo,
+	'+': add, '-': subtract,
+	'<<': left_shift, '>>': signed_right_shift, '>>>': unsigned_right_shift,
+	'&': bitwise_and, '^': bitwise_xor, '|': bitwise_or,
+}
+
+def applyOperator(operator, l, r):
+	return operators[operator](l, r)
 
 ## Operator Comparisons
 
 def lessThan(x, y):
+	if x.__class__ is float and y.__class__ is float \
+			and x == x and y == y: # neither is NaN
+		return x < y
 	x, y = toPrimitive(x, 'number'), toPrimitive(y, 'number')
 	if typeof(x) != 'string' or typeof(y) != 'string':
 		x, y = toNumber(x), toNumber(y)
@@ -162,6 +260,7 @@ def lessThan(x, y):
 			return True
 		return x < y
 	# string comparison
+	x, y = toString(x), toString(y)
 	if x.startswith(y):
 		return False
 	if y.startswith(x):
@@ -232,94 +331,224 @@ class JavaScriptException(Exception):
 	def __init__(self, value):
 		self.value = value
 
-## Native Objects
+# abrupt completions other than throw; a statement completing normally just
+# returns its value.  A break or continue takes the value of the statements
+# run before it in the block it leaves, see compile_block
+
+class Break(Exception):
+	def __init__(self, label=None, value=None):
+		self.label = label
+		self.value = value
 
-class Property(object):
-	__slots__ = ['value', 'read_only', 'dont_enum', 'dont_delete']
-	def __init__(self,
-			value, read_only=False, dont_enum=False, dont_delete=False):
+class Continue(Exception):
+	def __init__(self, label=None, value=None):
+		self.label = label
+		self.value = value
+
+class Return(Exception):
+	def __init__(self, value):
 		self.value = value
-		self.read_only = read_only
-		self.dont_enum = dont_enum
-		self.dont_delete = dont_delete
+
+def call_stack_exceeded(c):
+	"the RangeError thrown for calls nested deeper than an engine allows"
+	return JavaScriptException(c.global_object.range_error.construct(
+		['Maximum call stack size exceeded'], c))
+
+class BudgetExceeded(Exception):
+	"""raised out of `run` when a program runs out of its Budget; it isn't a
+	JavaScriptException, so the program can't catch it"""
+
+class Budget(object):
+	"""limits a run to `steps` loop iterations and function calls, and to
+	finishing by `deadline`, a time.time().  Engines `spend` a step on each
+	loop back edge and function entry, and the clock is only read every
+	`interval` steps."""
+	__slots__ = ['steps', 'deadline', 'left']
+	interval = 256
+
+	def __init__(self, steps=None, deadline=None):
+		self.steps = steps # not yet handed out to `left`
+		self.deadline = deadline
+		self.left = 0 # steps until the next check
+
+	def spend(self):
+		if self.left:
+			self.left -= 1
+		else:
+			self.check()
+
+	def check(self):
+		if self.deadline is not None and time.time() > self.deadline:
+			raise BudgetExceeded('deadline passed')
+		left = self.interval
+		if self.steps is not None:
+			if not self.steps:
+				raise BudgetExceeded('out of steps')
+			left = min(left, self.steps)
+			self.steps -= left
+		self.left = left - 1 # the step being spent
+
+## Native Objects
+
+# property attributes
+READ_ONLY, DONT_ENUM, DONT_DELETE = 1, 2, 4
+
+# objects with more properties than this get a shape of their own
+max_shared_keys = 64
+
+class Shape(object):
+	"""the keys of an object's own properties in the order they were added,
+	the slot in the object's `values` each is kept at and their attribute
+	`flags`. Objects that had the same properties added in the same order
+	share a shape, found by following `transitions` from the root shape of
+	their class; an object takes a copy of its own once a property is
+	deleted or changes attributes, or it has more than `max_shared_keys`.
+	Only shared shapes never change, so only they are `cacheable`.
+
+	Transitions are weak and a shape keeps its `parent` alive instead, so
+	the tree below a root, which every realm shares, only holds the shapes
+	of objects still alive rather than every set of keys ever used."""
+	__slots__ = ['keys', 'flags', 'slots', 'transitions', 'shared',
+		'cacheable', 'parent', '__weakref__']
+	def __init__(self, keys=(), flags=(), shared=True, cacheable=True,
+			parent=None):
+		self.keys = list(keys)
+		self.flags = list(flags)
+		self.slots = dict((key, i) for i, key in enumerate(self.keys))
+		self.transitions = {} # (key, flags): weak reference to a shape
+		self.shared = shared
+		self.cacheable = shared and cacheable
+		self.parent = parent
+
+	def add(self, key, flags):
+		"returns the shape with property `key` added at the end"
+		if not self.shared:
+			self.slots[key] = len(self.keys)
+			self.keys.append(key)
+			self.flags.append(flags)
+			return self
+		transitions = self.transitions
+		transition = transitions.get((key, flags))
+		if transition is not None:
+			shape = transition()
+			if shape is not None:
+				return shape
+		if len(self.keys) >= max_shared_keys:
+			return Shape(self.keys + [key], self.flags + [flags], False)
+		shape = Shape(self.keys + [key], self.flags + [flags], True,
+			self.cacheable, self)
+		def forget(transition, key=(key, flags)):
+			if transitions.get(key) is transition:
+				del transitions[key]
+		transitions[key, flags] = ref(shape, forget)
+		return shape
+
+	def unshared(self):
+		"returns a shape that can be changed without affecting other objects"
+		if not self.shared:
+			return self
+		return Shape(self.keys, self.flags, False)
+
+	def remove(self, key):
+		"removes `key` from this unshared shape, returning its old slot"
+		i = self.slots.pop(key)
+		del self.keys[i], self.flags[i]
+		for key in self.keys[i:]:
+			self.slots[key] -= 1
+		return i
 
 class JavaScriptObject(object):
 	name = 'Object' # [[Class]]
+	root_shape = Shape()
 
 	def __init__(self, prototype=None):
 		self.prototype = prototype # [[Prototype]]
-		self.properties = {}
-		self.ordered_keys = []
+		self.shape = self.root_shape
+		self.values = []
 
 	def __getitem__(self, key): # [[Get]]
-		if key in self.properties:
-			return self.properties[key].value
+		i = self.shape.slots.get(key)
+		if i is not None:
+			return self.values[i]
 		if not self.prototype:
 			return None
 		return self.prototype[key]
 
-	def get(self, key):
-		if key in self.properties:
-			return self.properties[key]
+	def flags(self, key):
+		"the attributes of property `key`, None if there's no such property"
+		i = self.shape.slots.get(key)
+		if i is not None:
+			return self.shape.flags[i]
 		if not self.prototype:
 			return None
-		return self.prototype.get(key)
+		return self.prototype.flags(key)
 
 	def __setitem__(self, key, value): # [[Put]]
-		if not self.can_put(key):
+		shape = self.shape
+		i = shape.slots.get(key)
+		if i is not None:
+			if shape.flags[i] & READ_ONLY:
+				return False
+			self.values[i] = value
+			return value
+		if self.prototype and not self.prototype.can_put(key):
 			return False
-		if key in self.properties:
-			self.properties[key].value = value
-		else:
-			self.properties[key] = Property(value)
-			self.ordered_keys.append(key)
+		self.shape = shape.add(key, 0)
+		self.values.append(value)
 		return value
 
 	def put(self, key, value,
 			read_only=False, dont_enum=False, dont_delete=False):
-		if key in self.properties:
-			prop = self.properties[key]
-			prop.value = value
-			prop.read_only = read_only
-			prop.dont_enum = dont_enum
-			prop.dont_delete = dont_delete
+		flags = (read_only and READ_ONLY) | (dont_enum and DONT_ENUM) \
+			| (dont_delete and DONT_DELETE)
+		shape = self.shape
+		i = shape.slots.get(key)
+		if i is None:
+			self.shape = shape.add(key, flags)
+			self.values.append(value)
 		else:
-			self.properties[key] = Property(value,
-				read_only, dont_enum, dont_delete)
-			self.ordered_keys.append(key)
+			self.values[i] = value
+			if shape.flags[i] != flags:
+				self.shape = shape = shape.unshared()
+				shape.flags[i] = flags
 		return value
 
 	def __delitem__(self, key): # [[Delete]]
-		if key not in self.properties:
+		shape = self.shape
+		i = shape.slots.get(key)
+		if i is None:
 			return True
-		if self.properties[key].dont_delete:
+		if shape.flags[i] & DONT_DELETE:
 			return False
-		del self.properties[key]
-		if key in self.ordered_keys:
-			# arrays don't store their indexes in the ordered_keys list
-			self.ordered_keys.remove(key)
+		self.shape = shape = shape.unshared()
+		del self.values[shape.remove(key)]
 		return True
 
 	def __contains__(self, key): # [[HasProperty]]
-		return (key in self.properties) \
+		return (key in self.shape.slots) \
 			or self.prototype and (key in self.prototype)
 
+	def has_own_property(self, key):
+		return key in self.shape.slots
+
 	def __iter__(self):
-		keys = []
+		keys, seen = [], set()
 		object = self
 		while object:
-			for key in object.ordered_keys:
-				if not key in keys:
+			for key in object.shape.keys:
+				if not key in seen:
+					seen.add(key)
 					keys.append(key)
 			object = object.prototype
 		for key in keys:
-			property = self.get(key)
-			if property and not property.dont_enum:
+			flags = self.flags(key)
+			if flags is not None and not flags & DONT_ENUM:
 				yield key
 
 	def can_put(self, key): # [[CanPut]]
-		if key in self.properties:
-			return not self.properties[key].read_only
+		i = self.shape.slots.get(key)
+		if i is not None:
+			return not self.shape.flags[i] & READ_ONLY
 		if self.prototype:
 			return self.prototype.can_put(key)
 		return True
@@ -344,11 +573,12 @@ class Scope(object):
 		self.object = object or JavaScriptObject()
 
 class ExecutionContext(object):
-	__slots__ = ['scope', 'this', 'global_object']
-	def __init__(self, scope, this=None, global_object=None):
+	__slots__ = ['scope', 'this', 'global_object', 'depth']
+	def __init__(self, scope, this=None, global_object=None, depth=0):
 		self.scope = scope
 		self.this = this or global_object
 		self.global_object = global_object
+		self.depth = depth # of calls, for engines that limit it
 	def instantiate_variables(self, s, vars):
 		if s.id == 'function':
 			args = vars['arguments']
@@ -361,10 +591,31 @@ class ExecutionContext(object):
 		for name in s.vars:
 			if name not in vars:
 				vars.put(name, None, dont_delete=True)
+	def instantiate_slots(self, s, values, args):
+		for slot, arg in zip(s.param_slots, args):
+			values[slot] = arg
+		for name, function_decl in s.functions.items():
+			values[s.slots[name.value]] = evaluate(function_decl, self)
 
 class Activation(JavaScriptObject):
 	pass
 
+class SlotActivation(object):
+	"""an activation with a fixed set of variables, kept in the list `values`
+	at the indexes `slots` maps their names to"""
+	__slots__ = ['slots', 'values']
+	def __init__(self, slots, values):
+		self.slots = slots
+		self.values = values
+	def __contains__(self, key):
+		return key in self.slots
+	def __getitem__(self, key):
+		return self.values[self.slots[key]]
+	def __setitem__(self, key, value):
+		self.values[self.slots[key]] = value
+	def __delitem__(self, key):
+		return key not in self.slots # variables are dont_delete
+
 class ArgumentsObject(JavaScriptObject):
 	def __init__(self, prototype, args, callee):
 		super(ArgumentsObject, self).__init__(prototype)
@@ -386,27 +637,46 @@ class JavaScriptFunction(JavaScriptObject):
 		self['prototype'].put('constructor', self, dont_enum=True)
 
 	def call(self, this, args, context):
-		global_object = context.global_object
-		activation = Activation()
-		activation.put('arguments',
-			ArgumentsObject(global_object.object['prototype'], args, self),
-			dont_delete=True)
-		c = ExecutionContext(Scope(self.scope, activation), this, global_object)
-		c.instantiate_variables(self.symbol, activation)
-		v = evaluate(self.symbol.block, c)
-		if v[0] == 'throw':
-			raise JavaScriptException(v[1])
-		if v[0] == 'return':
-			return v[1]
-		else: # normal
-			return None
+		s, global_object = self.symbol, context.global_object
+		if global_object.budget is not None:
+			global_object.budget.spend()
+		if s.code is None:
+			compile_body(s)
+		if s.slots is None:
+			activation = Activation()
+			activation.put('arguments', ArgumentsObject(
+				global_object.object['prototype'], args, self), dont_delete=True)
+			c = ExecutionContext(Scope(self.scope, activation),
+				this, global_object)
+			c.instantiate_variables(s, activation)
+		else:
+			values = [None] * len(s.slots)
+			if s.uses_arguments:
+				values[s.slots['arguments']] = ArgumentsObject(
+					global_object.object['prototype'], args, self)
+			c = ExecutionContext(Scope(self.scope,
+				SlotActivation(s.slots, values)), this, global_object)
+			c.instantiate_slots(s, values, args)
+		try:
+			s.code(c)
+		except Return, r:
+			return r.value
+		except RuntimeError, e:
+			if not recursion_limit(e):
+				raise
+			raise call_stack_exceeded(context)
+		return None
 
-	def construct(self, args, context):
+	def instance(self, context):
+		"the new object a construct call starts from"
 		if isinstance(self['prototype'], JavaScriptObject):
 			prototype = self['prototype']
 		else:
 			prototype = context.global_object.object['prototype']
-		o = JavaScriptObject(prototype)
+		return JavaScriptObject(prototype)
+
+	def construct(self, args, context):
+		o = self.instance(context)
 		v = self.call(o, args, context)
 		if typeof(v) == 'object':
 			return v
@@ -425,32 +695,188 @@ class JavaScriptFunction(JavaScriptObject):
 				return True
 		return False
 
+def array_index(key):
+	"the index the property name `key` is, None if it isn't an array index"
+	if key.isdigit() and (key[0] != '0' or key == '0'):
+		i = int(key)
+		if i < 4294967295: # 2^32 - 1
+			return i
+	return None
+
+def numbers(values):
+	"whether all of `values` are numbers, so can be kept in an array('d')"
+	for value in values:
+		if value.__class__ is not float:
+			return False
+	return True
+
 class JavaScriptArray(JavaScriptObject):
+	"""keeps its elements in `elements` while they run from 0 to length - 1
+	without holes, an array('d') while they're all numbers and a list once
+	they aren't, and as properties like any other object, with the length in
+	`length`, once there are holes"""
 	name = 'Array'
-	def __init__(self, prototype):
+	# [[Put]] is special, so the shapes of arrays can't be cached
+	root_shape = Shape(cacheable=False)
+	def __init__(self, prototype, elements=None):
 		super(JavaScriptArray, self).__init__(prototype)
-		self.put('length', 0.0, dont_enum=True, dont_delete=True)
+		if elements is None:
+			elements = array('d')
+		elif elements.__class__ is list and numbers(elements):
+			elements = array('d', elements)
+		self.elements = elements
+		self.length = 0.0
+
+	def buffer(self):
+		"""a read-only buffer onto the elements, without copying them, while
+		they're all numbers (doubles in machine order), otherwise None"""
+		if self.elements.__class__ is array:
+			return buffer(self.elements)
+		return None
+
+	def elements_for(self, values):
+		"the elements, as a list if they're numbers and `values` aren't"
+		elements = self.elements
+		if elements.__class__ is array and not numbers(values):
+			elements = self.elements = list(elements)
+		return elements
+
+	def replace(self, start, end, values):
+		"""replaces the elements from `start` to `end` with `values`, returning
+		the ones that were there"""
+		elements = self.elements_for(values)
+		removed = elements[start:end]
+		if elements.__class__ is array:
+			values = array('d', values)
+		elements[start:end] = values
+		return removed
+
+	def make_sparse(self):
+		"moves the elements to properties"
+		elements, self.elements = self.elements, None
+		self.length = float(len(elements))
+		for i, value in enumerate(elements):
+			self.shape = self.shape.add(str(i), 0)
+			self.values.append(value)
+
+	def __getitem__(self, key):
+		elements = self.elements
+		if key == 'length':
+			return self.length if elements is None else float(len(elements))
+		if elements is not None:
+			i = array_index(key)
+			if i is not None and i < len(elements):
+				return elements[i]
+		return super(JavaScriptArray, self).__getitem__(key)
+
+	def flags(self, key):
+		if key == 'length':
+			return DONT_ENUM | DONT_DELETE
+		if self.elements is not None:
+			i = array_index(key)
+			if i is not None and i < len(self.elements):
+				return 0
+		return super(JavaScriptArray, self).flags(key)
+
+	def has_own_property(self, key):
+		if key == 'length':
+			return True
+		if self.elements is not None:
+			i = array_index(key)
+			if i is not None and i < len(self.elements):
+				return True
+		return key in self.shape.slots
+
+	def __contains__(self, key):
+		return self.has_own_property(key) \
+			or self.prototype and (key in self.prototype)
+
+	def can_put(self, key):
+		return key == 'length' \
+			or super(JavaScriptArray, self).can_put(key)
+
 	def __setitem__(self, key, value):
+		if key == 'length':
+			self.set_length(value)
+			return value
+		i = array_index(key)
+		elements = self.elements
+		if elements is not None and i is not None:
+			n = len(elements)
+			if i <= n and value.__class__ is not float:
+				elements = self.elements_for((value,))
+			if i < n:
+				elements[i] = value
+				return value
+			if i == n:
+				if self.prototype and not self.prototype.can_put(key):
+					return False
+				elements.append(value)
+				return value
+			self.make_sparse()
 		if not self.can_put(key):
 			return False
-		if key != 'length':
-			if key in self.properties:
-				self.properties[key].value = value
-			else:
-				self.properties[key] = Property(value)
-			i = toUint32(key)
-			if toString(i) == key and self.properties['length'].value <= i:
-				self.properties['length'].value = i + 1.0
-			else:
-				self.ordered_keys.append(key)
-		else:
-			i = toUint32(value)
-			if i != toNumber(value):
-				raise JavaScriptError() # TODO range error
-			for a in range(int(i), int(self.properties['length'].value)):
-				del self[str(a)]
-			self.properties['length'].value = i
-	# TODO implement iter over the numerical indices
+		super(JavaScriptArray, self).__setitem__(key, value)
+		if i is not None and self.length <= i:
+			self.length = i + 1.0
+		return value
+
+	def put(self, key, value,
+			read_only=False, dont_enum=False, dont_delete=False):
+		if key == 'length':
+			self.set_length(value)
+			return value
+		i = array_index(key)
+		elements = self.elements
+		if i is not None:
+			if elements is not None and i <= len(elements) \
+					and not (read_only or dont_enum or dont_delete):
+				elements = self.elements_for((value,))
+				if i < len(elements):
+					elements[i] = value
+				else:
+					elements.append(value)
+				return value
+			if elements is not None:
+				self.make_sparse()
+			if self.length <= i:
+				self.length = i + 1.0
+		return super(JavaScriptArray, self).put(key, value,
+			read_only, dont_enum, dont_delete)
+
+	def set_length(self, value):
+		n = toUint32(value)
+		if n != toNumber(value):
+			raise JavaScriptError() # TODO range error
+		elements = self.elements
+		if elements is not None:
+			if n <= len(elements):
+				del elements[int(n):]
+				return
+			self.make_sparse()
+		for key in list(self.shape.keys):
+			i = array_index(key)
+			if i is not None and i >= n:
+				self.__delitem__(key)
+		self.length = float(n)
+
+	def __delitem__(self, key):
+		if key == 'length':
+			return False
+		if self.elements is not None:
+			i = array_index(key)
+			if i is not None and i < len(self.elements):
+				self.make_sparse() # as there'll be a hole
+		return super(JavaScriptArray, self).__delitem__(key)
+
+	def __iter__(self):
+		if self.elements is not None:
+			for i in xrange(len(self.elements)):
+				key = str(i)
+				if self.has_own_property(key):
+					yield key
+		for key in super(JavaScriptArray, self).__iter__():
+			yield key
 
 class JavaScriptString(JavaScriptObject):
 	name = 'String'
@@ -564,7 +990,7 @@ class JavaScriptObjectPrototype(JavaScriptNativePrototype):
 
 	@native(length=1)
 	def hasOwnProperty(this, args, c):
-		return toString(args[0] if len(args) else None) in this.properties
+		return this.has_own_property(toString(args[0] if len(args) else None))
 
 	@native(length=1)
 	def isPrototypeOf(this, args, c):
@@ -580,8 +1006,8 @@ class JavaScriptObjectPrototype(JavaScriptNativePrototype):
 	@native(length=1)
 	def propertyIsEnumerable(this, args, c):
 		property = toString(args[0] if len(args) else None)
-		return not property in this.properties \
-			or not this.get(property).dont_enum
+		return not this.has_own_property(property) \
+			or not this.flags(property) & DONT_ENUM
 
 class JavaScriptFunctionPrototype(JavaScriptNativePrototype):
 	__metaclass__ = NativeFunctions
@@ -622,6 +1048,10 @@ class JavaScriptFunctionPrototype(JavaScriptNativePrototype):
 			if thisArg is None or thisArg is null else toObject(thisArg, c)
 		return this.call(thisArg, args[1:], c)
 
+def dense_elements(o):
+	"the list of elements of `o` if it's an array without holes, else None"
+	return o.elements if isinstance(o, JavaScriptArray) else None
+
 class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 	__metaclass__ = NativeFunctions
 
@@ -643,7 +1073,7 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 		for e in [this] + args:
 			if isinstance(e, JavaScriptArray):
 				for i in map(str, range(int(e['length']))):
-					if i in this.properties:
+					if this.has_own_property(i):
 						a[str(n)] = e[i]
 					n += 1
 			else:
@@ -658,12 +1088,17 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 		sep = ',' if not len(args) or args[0] == None else toString(args[0])
 		if not l:
 			return ''
-		els = (this[str(i)] for i in range(int(l)))
+		els = dense_elements(this)
+		if els is None:
+			els = (this[str(i)] for i in range(int(l)))
 		return sep.join(toString(el) if el is not None and el != null else ''
 			for el in els)
 
 	@native
 	def pop(this, args, c):
+		elements = dense_elements(this)
+		if elements is not None:
+			return elements.pop() if elements else None
 		l = toUint32(this['length'])
 		if l == 0:
 			this['length'] = l
@@ -676,6 +1111,10 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 
 	@native(length=1)
 	def push(this, args, c):
+		elements = dense_elements(this)
+		if elements is not None:
+			this.replace(len(elements), len(elements), args)
+			return float(len(this.elements))
 		n = toUint32(this['length'])
 		for arg in args:
 			this[toString(n)] = arg
@@ -685,15 +1124,19 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 
 	@native
 	def reverse(this, args, c):
+		elements = dense_elements(this)
+		if elements is not None:
+			elements.reverse()
+			return this
 		l = toUint32(this['length'])
 		for i in range(int(l // 2)):
 			i1, i2 = str(int(l - i - 1)), str(i)
-			if i1 in this.properties and i2 in this.properties:
+			if this.has_own_property(i1) and this.has_own_property(i2):
 				this[i2], this[i1] = this[i1], this[i2]
-			elif i1 in this.properties:
+			elif this.has_own_property(i1):
 				this[i2] = this[i1]
 				del[i1]
-			elif i2 in this.properties:
+			elif this.has_own_property(i2):
 				this[i1] = this[i2]
 				del[i2]
 			else:
@@ -703,13 +1146,16 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 
 	@native
 	def shift(this, args, c):
+		elements = dense_elements(this)
+		if elements is not None:
+			return elements.pop(0) if elements else None
 		l = toUint32(this['length'])
 		if l == 0:
 			this['length'] = l
 			return None
 		el = this['0']
 		for i in range(1,int(l)):
-			if str(int(i)) in this.properties:
+			if this.has_own_property(str(int(i))):
 				this[str(int(i - 1))] = this[str(int(i))]
 			else:
 				del this[str(int(i - 1))]
@@ -719,15 +1165,20 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 
 	@native(length=2)
 	def slice(this, args, c):
-		a = c.global_object.array.construct([], c)
-		l = toUint32(this['length'])
+		l = int(toUint32(this['length']))
 		start = toInteger(args[0] if len(args) else None)
 		start = max(l + start, 0) if start < 0 else min(start, l)
-		end = toInteger(args[1]) if len(args) > 1 or args[1] is None else l
-		end = max(l + end) if end < 0 else min(end, l)
+		end = toInteger(args[1]) \
+			if len(args) > 1 and args[1] is not None else l
+		end = max(l + end, 0) if end < 0 else min(end, l)
+		elements = dense_elements(this)
+		if elements is not None:
+			return JavaScriptArray(c.global_object.array['prototype'],
+				elements[start:end])
+		a = c.global_object.array.construct([], c)
 		n = 0
 		for i in range(start, end):
-			if str(i) in this.properties:
+			if this.has_own_property(str(i)):
 				a[str(n)] = this[str(i)]
 			n += 1
 		a['length'] = float(n)
@@ -752,7 +1203,8 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 			else:
 				return cmp(toString(x), toString(y))
 
-		indexes = [i for i in map(str, range(int(l))) if i in this.properties]
+		indexes = [i for i in map(str, range(int(l)))
+			if this.has_own_property(i)]
 		els = [this[i] for i in indexes]
 		els.sort(comparitor)
 		for i, el in zip(indexes, els):
@@ -767,16 +1219,20 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 		start = int(max(l + start, 0) if start < 0 else min(start, l))
 		delete = int(min(max(
 			toInteger(args[1] if len(args) > 1 else None), 0), l - start))
+		elements = dense_elements(this)
+		if elements is not None:
+			a.elements = this.replace(start, start + delete, args[2:])
+			return a
 		n = 0
 		for i in map(str, range(start, start + delete)):
-			if i in this.properties:
+			if this.has_own_property(i):
 				a[str(n)] = this[i]
 			n += 1
 		a['length'] = float(n)
 		els = args[2:]
 		if len(els) < delete:
 			for i in range(start, start + int(l) - len(els)):
-				if str(i + delete) in this.properties:
+				if this.has_own_property(str(i + delete)):
 					this[str(i + len(els))] = this[str(i + delete)]
 				else:
 					del this[str(i + len(els))]
@@ -784,7 +1240,7 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 				del this[str(i)]
 		elif len(els) > delete:
 			for i in reversed(range(start, int(l) - delete + 1)):
-				if str(i + delete - 1) in this.properties:
+				if this.has_own_property(str(i + delete - 1)):
 					this[str(i + len(els) - 1)] = this[str(i + delete - 1)]
 				else:
 					del this[str(i + len(els) - 1)]
@@ -795,9 +1251,13 @@ class JavaScriptArrayPrototype(JavaScriptNativePrototype):
 
 	@native(length=1)
 	def unshift(this, args, c):
+		elements = dense_elements(this)
+		if elements is not None:
+			this.replace(0, 0, args)
+			return float(len(this.elements))
 		l = toUint32(this['length'])
 		for i in reversed(range(0,int(l))):
-			if str(int(i)) in this.properties:
+			if this.has_own_property(str(int(i))):
 				this[str(int(i + len(args)))] = this[str(int(i))]
 			else:
 				del this[str(int(i))]
@@ -1235,9 +1695,7 @@ class JavaScriptArrayConstructor(JavaScriptFunction):
 			array = JavaScriptArray(self['prototype'])
 			array['length'] = args[0]
 		else:
-			array = JavaScriptArray(self['prototype'])
-			for i, arg in enumerate(args):
-				array[str(i)] = arg
+			array = JavaScriptArray(self['prototype'], list(args))
 		return array
 
 class JavaScriptStringConstructor(JavaScriptFunction):
@@ -1462,6 +1920,9 @@ class JavaScriptNativeErrorConstructor(JavaScriptErrorConstructor):
 ## Global Object
 
 class GlobalObject(JavaScriptObject):
+	budget = None # the Budget of the program running in this realm
+	function_class = JavaScriptFunction # what the running engine makes
+
 	def __init__(self):
 		super(GlobalObject, self).__init__()
 
@@ -1548,413 +2009,1068 @@ class GlobalObject(JavaScriptObject):
 			pass # TODO
 
 
-## Evaluate
+## Compile
+
+# Symbols are compiled once into trees of closures taking an execution
+# context, so that everything that can be decided by looking at the symbol
+# alone (operator selection, optional parts of statements, labels) is
+# resolved up front instead of on every evaluation.
+
+compilers = {}
+value_compilers = {}
+
+def compiler(*ids):
+	"decorator registering the compiler for the symbols `ids`"
+	def bind(fn):
+		for id in ids:
+			compilers[id] = fn
+		return fn
+	return bind
+
+def value_compiler(*ids):
+	"""decorator registering a compiler for the symbols `ids` that produces
+	the value of the expression rather than a Reference to it"""
+	def bind(fn):
+		for id in ids:
+			value_compilers[id] = fn
+		return fn
+	return bind
+
+def compile_symbol(s):
+	"compiles symbol `s` to a closure evaluating it in a context"
+	if isinstance(s, list): # block statement
+		return compile_block(s)
+	try:
+		fn = compilers[s.id]
+	except KeyError:
+		def unknown(c):
+			raise JavaScriptException(c.global_object.error.construct(
+				['unknown operation %s' % s.id], c))
+		return unknown
+	return fn(s)
+
+def compile_value(s):
+	"compiles expression `s` to a closure returning its value"
+	if s.id in value_compilers:
+		return value_compilers[s.id](s)
+	return compile_symbol(s)
+
+def compile_program(s):
+	"compiles the statements of the (global) context `s`, once"
+	if s.code is None:
+		for statement in s.first:
+			resolve(statement, [], [])
+		s.code = compile_block(s.first)
+	return s.code
 
 def evaluate(s, c):
 	"evaluates symbol `s` in context `c`"
-
-	#print s
-	if isinstance(s, list) or s.id == '{': # block statement
-		if not isinstance(s, list):
-			s = s.block
-		if len(s) == 0:
-			return ('normal', None, None)
-		for statement in s:
-			try:
-				v = evaluate(statement, c)
-			except JavaScriptException, e:
-				return ('throw', e.value, None)
-			if v[0] != 'normal':
-				return v
+	return compile_symbol(s)(c)
+
+def empty(c):
+	return None
+
+def compile_block(s):
+	statements = [compile_symbol(statement) for statement in s]
+	if not statements:
+		return empty
+	if len(statements) == 1:
+		return statements[0]
+	def block(c):
+		v = None
+		try:
+			for statement in statements:
+				v = statement(c)
+		except (Break, Continue), e:
+			if e.value is not None or v is None:
+				raise
+			raise e.__class__(e.label, v)
 		return v
+	return block
 
+## Scope Resolution
 
-	## Primary Expressions
-	elif s.id == 'this':
-		return c.this
-	elif s.id == '(identifier)':
+def dynamic_scope(s):
+	"whether the body of function `s` uses with or eval"
+	stack = list(s.block)
+	while stack:
+		s = stack.pop()
+		if s.id == 'with' or s.id == '(identifier)' and s.value == 'eval':
+			return True
+		if s.id != 'function':
+			stack.extend(children(s))
+	return False
+
+def address(name, levels):
+	depth = 0
+	for level in reversed(levels):
+		if level is None:
+			return None
+		if isinstance(level, dict):
+			if name in level:
+				return depth, level[name]
+		elif level == name:
+			return None
+		depth += 1
+	return depth, None
+
+binary_ids = set(['/', '*', '%', '+', '-', '<<', '>>', '>>>', '&', '^', '|',
+	'<', '>', '<=', '>=', '==', '!=', '===', '!==', 'instanceof', 'in',
+	'&&', '||'])
+
+def resolve(s, levels, function_levels):
+	"""gives the identifiers below `s` the (depth, slot) `address` they're
+	found at, if it can be known before running, a slot of None meaning the
+	global object. `levels` are the scopes around `s` from the outermost,
+	a dict of slots for activations and catch blocks, the name of a function
+	expression, or None where names can only be looked up while running.
+	`function_levels` are the ones function declarations are created in"""
+	if s.id == '(identifier)':
+		a = address(s.value, levels)
+		if a:
+			s.address = a
+	elif s.id == 'function':
+		resolve_function(s, function_levels if s.is_decl else levels)
+	elif s.id == '.':
+		resolve(s.first, levels, function_levels)
+	elif s.id == 'with':
+		resolve(s.first, levels, function_levels)
+		for statement in s.block:
+			resolve(statement, levels + [None], function_levels)
+	elif s.id == 'try':
+		for statement in s.block + (s.finallyblock or []):
+			resolve(statement, levels, function_levels)
+		if s.catchblock is not None:
+			for statement in s.catchblock:
+				resolve(statement, levels + [{s.e.value: 0}], function_levels)
+	elif s.id in binary_ids and s.arity is None:
+		first, chain = binary_chain(s, binary_ids)
+		resolve(first, levels, function_levels)
+		for operator in chain:
+			resolve(operator.second, levels, function_levels)
+	elif s.id not in ('break', 'continue'):
+		for child in children(s):
+			resolve(child, levels, function_levels)
+
+def resolve_function(s, levels):
+	"""lays out the variables of function `s` in `slots`, unless with or eval
+	mean they have to be looked up by name, and resolves its body"""
+	if s.lazy is not None:
+		s.levels = levels # until compile_body has parsed the body
+		return
+	if s.name and not s.is_decl:
+		levels = levels + [s.name.value]
+	if dynamic_scope(s):
+		s.slots = None
+		levels = levels + [None]
+	else:
+		s.slots = {}
+		for name in [param.value for param in s.params] + ['arguments'] + \
+				[name.value for name in s.functions] + sorted(s.vars):
+			s.slots.setdefault(name, len(s.slots))
+		s.param_slots = [s.slots[param.value] for param in s.params]
+		levels = levels + [s.slots]
+	for statement in s.block:
+		resolve(statement, levels, levels)
+
+def compile_slots(depth):
+	"compiles a closure returning the values of the activation `depth` scopes up"
+	if depth == 0:
+		return lambda c: c.scope.object.values
+	if depth == 1:
+		return lambda c: c.scope.parent.object.values
+	def slots(c):
 		scope = c.scope
-		while scope:
-			if s.value in scope.object:
-				break
+		for i in xrange(depth):
 			scope = scope.parent
-		return Reference(scope and scope.object, s.value)
-
-	# literals
-	elif s.id == '(number)':
-		return float(s.value)
-	elif s.id == '(string)':
-		return s.value
-	elif s.id == '(regexp)':
-		pass # TODO
-	elif s.id == 'null':
-		return null
-	elif s.id == 'true':
-		return True
-	elif s.id == 'false':
-		return False
+		return scope.object.values
+	return slots
 
-	elif s.id == '(array)':
-		array = c.global_object.array.construct([], c)
-		for i, arg in enumerate(s.first):
-			array[str(i)] = getValue(evaluate(arg, c), c)
-		return array
-
-	elif s.id == '(object)':
+def slot_address(s):
+	"the (depth, slot) of `s` if it's an identifier kept in a slot"
+	a = s.address
+	if a and a[1] is not None:
+		return a
+	return None
+
+@compiler('{')
+def compile_block_statement(s):
+	return compile_block(s.block)
+
+
+## Primary Expressions
+
+@compiler('this')
+def compile_this(s):
+	return lambda c: c.this
+
+@compiler('(identifier)')
+def compile_identifier(s):
+	name, a = s.value, s.address
+	if a and a[1] is None:
+		def identifier(c):
+			o = c.global_object
+			return Reference(o if name in o else None, name)
+		return identifier
+	if a:
+		depth = a[0]
+		def identifier(c):
+			scope = c.scope
+			for i in xrange(depth):
+				scope = scope.parent
+			return Reference(scope.object, name)
+		return identifier
+	def identifier(c):
+		scope = c.scope
+		while scope:
+			if name in scope.object:
+				return Reference(scope.object, name)
+			scope = scope.parent
+		return Reference(None, name)
+	return identifier
+
+@value_compiler('(identifier)')
+def compile_identifier_value(s):
+	name, a = s.value, s.address
+	if a and a[1] is None:
+		def identifier(c):
+			o = c.global_object
+			if name in o:
+				return o[name]
+			raise JavaScriptException(
+				c.global_object.reference_error.construct([], c))
+		return identifier
+	if a:
+		depth, slot = a
+		if depth == 0:
+			return lambda c: c.scope.object.values[slot]
+		slots = compile_slots(depth)
+		return lambda c: slots(c)[slot]
+	def identifier(c):
+		scope = c.scope
+		while scope:
+			if name in scope.object:
+				return scope.object[name]
+			scope = scope.parent
+		raise JavaScriptException(
+			c.global_object.reference_error.construct([], c))
+	return identifier
+
+# literals
+@compiler('(number)')
+def compile_number(s):
+	value = float(s.value)
+	return lambda c: value
+
+@compiler('(string)')
+def compile_string(s):
+	value = s.value
+	return lambda c: value
+
+@compiler('(regexp)')
+def compile_regexp(s):
+	return lambda c: None # TODO
+
+@compiler('null')
+def compile_null(s):
+	return lambda c: null
+
+@compiler('true')
+def compile_true(s):
+	return lambda c: True
+
+@compiler('false')
+def compile_false(s):
+	return lambda c: False
+
+@compiler('(array)')
+def compile_array(s):
+	elements = [compile_value(arg) for arg in s.first]
+	def array(c):
+		return JavaScriptArray(c.global_object.array['prototype'],
+			[element(c) for element in elements])
+	return array
+
+@compiler('(object)')
+def compile_object(s):
+	properties = []
+	for k, v in s.first:
+		if k.id == '(number)':
+			key = toString(float(k.value))
+		else: # (identifier) or (string)
+			key = k.value
+		properties.append((key, compile_value(v)))
+	def object(c):
 		o = c.global_object.object.construct([], c)
-		for k, v in s.first:
-			if k.id == '(identifier)':
-				key = k.value
-			elif k.id == '(number)':
-				key = toString(evaluate(k, c))
-			else: # (string)
-				key = evaluate(k, c)
-			o[key] = getValue(evaluate(v, c), c)
+		for key, value in properties:
+			o[key] = value(c)
 		return o
+	return object
 
 
-	## Left-Hand Expressions
+## Left-Hand Expressions
 
-	elif s.id == '.':
-		return Reference(
-			toObject(getValue(evaluate(s.first, c), c), c),
-			s.second.value)
-	elif s.id == '[': # property
-		l = getValue(evaluate(s.first, c), c)
-		r = getValue(evaluate(s.second, c), c)
-		return Reference(toObject(l, c), toString(r))
-
-	elif s.id == 'new':
-		l = getValue(evaluate(s.first, c), c)
-		args = [getValue(evaluate(arg, c), c)
-			for arg in getattr(s, 'params', [])]
-		if typeof(l) != 'object' or not hasattr(l, 'construct'):
+@compiler('.')
+def compile_dot(s):
+	l, name = compile_value(s.first), s.second.value
+	return lambda c: Reference(toObject(l(c), c), name)
+
+@value_compiler('.')
+def compile_dot_value(s):
+	l, name = compile_value(s.first), s.second.value
+	cache = [None, 0] # the shape `name` was last found in, and its slot
+	def dot(c):
+		o = l(c)
+		if not isinstance(o, JavaScriptObject):
+			if name == 'length' and typeof(o) == 'string':
+				return float(len(o))
+			o = toObject(o, c)
+		shape = o.shape
+		if shape is cache[0]:
+			return o.values[cache[1]]
+		i = shape.slots.get(name)
+		if i is None:
+			return o[name]
+		if shape.cacheable:
+			cache[0], cache[1] = shape, i
+		return o.values[i]
+	return dot
+
+@compiler('[') # property
+def compile_property(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	def property(c):
+		o = l(c)
+		return Reference(toObject(o, c), toString(r(c)))
+	return property
+
+@value_compiler('[')
+def compile_property_value(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	cache = [None, None, 0] # the shape and key last found, and its slot
+	def property(c):
+		o = l(c)
+		key = r(c)
+		if key.__class__ is float and o.__class__ is JavaScriptArray \
+				and o.elements is not None \
+				and 0 <= key < len(o.elements) and key == int(key):
+			return o.elements[int(key)]
+		key = toString(key)
+		if not isinstance(o, JavaScriptObject):
+			o = toObject(o, c)
+		shape = o.shape
+		if shape is cache[0] and key == cache[1]:
+			return o.values[cache[2]]
+		i = shape.slots.get(key)
+		if i is None:
+			return o[key]
+		if shape.cacheable:
+			cache[0], cache[1], cache[2] = shape, key, i
+		return o.values[i]
+	return property
+
+@compiler('new')
+def compile_new(s):
+	l = compile_value(s.first)
+	params = [compile_value(arg) for arg in s.params or []]
+	def new(c):
+		f = l(c)
+		args = [param(c) for param in params]
+		if typeof(f) != 'object' or not hasattr(f, 'construct'):
 			raise JavaScriptException(
 				c.global_object.type_error.construct([], c))
-		return l.construct(args, c)
-
-	elif s.id == '(':
-		o = evaluate(s.first, c)
-		args = [getValue(evaluate(arg, c), c) for arg in s.params]
+		return f.construct(args, c)
+	return new
+
+@compiler('(')
+def compile_call(s):
+	params = [compile_value(arg) for arg in s.params]
+	if s.first.id not in value_compilers or s.first.address is not None:
+		# not a reference, or one to an activation or the global object, so
+		# there's no `this` to pass on
+		l = compile_value(s.first)
+		def call(c):
+			f = l(c)
+			args = [param(c) for param in params]
+			if typeof(f) != 'object' or not hasattr(f, 'call'):
+				raise JavaScriptException(
+					c.global_object.type_error.construct([], c))
+			return f.call(None, args, c)
+		return call
+	l = compile_symbol(s.first)
+	def call(c):
+		o = l(c)
+		args = [param(c) for param in params]
 		f = getValue(o, c)
 		if typeof(f) != 'object' or not hasattr(f, 'call'):
 			raise JavaScriptException(
 				c.global_object.type_error.construct([], c))
-		this = o.base if isinstance(o, Reference) else None
-		if this and isinstance(this, Activation):
+		this = o.base
+		if this and isinstance(this, (Activation, SlotActivation)):
 			this = None
 		return f.call(this, args, c)
+	return call
+
+
+## Postfix Expressions, Prefix Increment and Decrement Operators
+
+@compiler('++', '--')
+def compile_update(s):
+	l = compile_symbol(s.first)
+	delta = 1.0 if s.id == '++' else -1.0
+	a = slot_address(s.first)
+	if a:
+		slots, slot = compile_slots(a[0]), a[1]
+		prefix = s.arity is not None
+		def update(c):
+			values = slots(c)
+			v = toNumber(values[slot])
+			values[slot] = v + delta
+			return v + delta if prefix else v
+		return update
+	if s.arity is not None: # prefix
+		def update(c):
+			o = l(c)
+			v = toNumber(getValue(o, c)) + delta
+			putValue(o, v, c)
+			return v
+	else:
+		def update(c):
+			o = l(c)
+			v = toNumber(getValue(o, c))
+			putValue(o, v + delta, c)
+			return v
+	return update
 
-	## Postfix Expressions
-	elif s.id == '++':
-		l = evaluate(s.first, c)
-		v = toNumber(getValue(l, c))
-		if hasattr(s, 'arity'):
-			v += 1.0
-			putValue(l, v, c)
-		else:
-			putValue(l, v + 1.0, c)
-		return v
-	elif s.id == '--':
-		l = evaluate(s.first, c)
-		v = toNumber(getValue(l, c))
-		if hasattr(s, 'arity'):
-			v -= 1.0
-			putValue(l, v, c)
-		else:
-			putValue(l, v - 1.0, c)
-		return v
 
-	## Unary Operators
-	elif s.id == 'typeof':
-		l = evaluate(s.first, c)
-		if isinstance(l, Reference) and l.base == None:
+## Unary Operators
+
+@compiler('typeof')
+def compile_typeof(s):
+	l = compile_symbol(s.first)
+	def typeof_(c):
+		o = l(c)
+		if isinstance(o, Reference) and o.base == None:
 			return 'undefined'
-		o = getValue(l, c)
+		o = getValue(o, c)
 		type = typeof(o)
 		if type == 'object' and hasattr(o, 'call'):
 			return 'function'
 		return type
-	elif s.id == 'void':
-		l = getValue(evaluate(s.first, c), c)
+	return typeof_
+
+@compiler('void')
+def compile_void(s):
+	l = compile_value(s.first)
+	def void(c):
+		l(c)
 		return None
-	elif s.id == 'delete':
-		l = evaluate(s.first, c)
-		if not isinstance(l, Reference):
+	return void
+
+@compiler('delete')
+def compile_delete(s):
+	l = compile_symbol(s.first)
+	def delete(c):
+		o = l(c)
+		if not isinstance(o, Reference):
 			return True
-		return l.base.__delitem__(l.property_name)
-	elif s.id == '+' and hasattr(s, 'arity'): # unary
-		return toNumber(getValue(evaluate(s.first, c), c))
-	elif s.id == '-' and hasattr(s, 'arity'): # unary
-		return -toNumber(getValue(evaluate(s.first, c), c))
-	elif s.id == '~':
-		return float(~int(toInt32(getValue(evaluate(s.first, c), c))))
-	elif s.id == '!':
-		return not toBoolean(getValue(evaluate(s.first, c), c))
-
-	## Multiplicative Operators, Additive Operators
-	## Binary Bitwise Operators, Bitwise Shift Operators
-	elif s.id in ('/', '*', '%', '+', '-', '&', '^', '|', '<<', '>>', '>>>'):
-		return applyOperator(s.id, getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-
-	## Relational Operators
-	elif s.id == '<':
-		r = lessThan(getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-		return False if r == None else r
+		return o.base.__delitem__(o.property_name)
+	return delete
+
+@compiler('~')
+def compile_bitwise_not(s):
+	l = compile_value(s.first)
+	return lambda c: float(~int(toInt32(l(c))))
+
+@compiler('!')
+def compile_not(s):
+	l = compile_value(s.first)
+	return lambda c: not toBoolean(l(c))
+
+
+## Multiplicative Operators, Additive Operators
+## Binary Bitwise Operators, Bitwise Shift Operators
+
+@compiler('/', '*', '%', '+', '-', '&', '^', '|', '<<', '>>', '>>>')
+def compile_operator(s):
+	if s.arity is not None: # unary + and -
+		l = compile_value(s.first)
+		if s.id == '-':
+			return lambda c: -toNumber(l(c))
+		return lambda c: toNumber(l(c))
+	first, chain = binary_chain(s, operators)
+	l = compile_value(first)
+	if len(chain) == 1:
+		r = compile_value(s.second)
+		operator = operators[s.id]
+		return lambda c: operator(l(c), r(c))
+	# a long a + b + c is folded in a loop rather than by nested closures
+	steps = [(operators[o.id], compile_value(o.second)) for o in chain]
+	def operator_chain(c):
+		v = l(c)
+		for operator, r in steps:
+			v = operator(v, r(c))
+		return v
+	return operator_chain
+
+
+## Relational Operators
+
+@compiler('<', '>', '<=', '>=')
+def compile_relational(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	if s.id == '<':
+		def relational(c):
+			v = lessThan(l(c), r(c))
+			return False if v == None else v
 	elif s.id == '>':
-		r = lessThan(getValue(evaluate(s.second, c), c),
-			getValue(evaluate(s.first, c), c))
-		return False if r == None else r
+		def relational(c):
+			x = l(c)
+			v = lessThan(r(c), x)
+			return False if v == None else v
 	elif s.id == '<=':
-		r = lessThan(getValue(evaluate(s.second, c), c),
-			getValue(evaluate(s.first, c), c))
-		return False if r == None else not r
-	elif s.id == '>=':
-		r = lessThan(getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-		return False if r == None else not r
-	elif s.id == 'instanceof':
-		l = getValue(evaluate(s.first, c), c)
-		r = getValue(evaluate(s.second, c), c)
-		if not isinstance(r, JavaScriptObject):
+		def relational(c):
+			x = l(c)
+			v = lessThan(r(c), x)
+			return False if v == None else not v
+	else: # >=
+		def relational(c):
+			v = lessThan(l(c), r(c))
+			return False if v == None else not v
+	return relational
+
+@compiler('instanceof')
+def compile_instanceof(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	def instanceof(c):
+		v, o = l(c), r(c)
+		if not isinstance(o, JavaScriptObject):
 			raise JavaScriptException(
 				c.global_object.type_error.construct([], c))
-		if not hasattr(r, 'has_instance'):
+		if not hasattr(o, 'has_instance'):
 			raise JavaScriptException(
 				c.global_object.type_error.construct([], c))
-		return r.has_instance(l, c)
-	elif s.id == 'in':
-		l = getValue(evaluate(s.first, c), c)
-		r = getValue(evaluate(s.second, c), c)
-		if not isinstance(r, JavaScriptObject):
+		return o.has_instance(v, c)
+	return instanceof
+
+@compiler('in')
+def compile_in(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	def in_(c):
+		v, o = l(c), r(c)
+		if not isinstance(o, JavaScriptObject):
 			raise JavaScriptException(
 				c.global_object.type_error.construct([], c))
-		return toString(l) in r
-
-	## Equality Operators
-	elif s.id == '==':
-		return equal(getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-	elif s.id == '!=':
-		return not equal(getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-	elif s.id == '===':
-		return strictlyEqual(getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-	elif s.id == '!==':
-		return not strictlyEqual(getValue(evaluate(s.first, c), c),
-			getValue(evaluate(s.second, c), c))
-
-	## Binary Logical Operators
-	elif s.id == '&&':
-		l = getValue(evaluate(s.first, c), c)
-		if not toBoolean(l):
-			return l
-		return getValue(evaluate(s.second, c), c)
-	elif s.id == '||':
-		l = getValue(evaluate(s.first, c), c)
-		if toBoolean(l):
-			return l
-		return getValue(evaluate(s.second, c), c)
-
-	## Conditional Operator
-	elif s.id == '?':
-		if toBoolean(getValue(evaluate(s.first, c), c)):
-			return getValue(evaluate(s.second, c), c)
-		else:
-			return getValue(evaluate(s.third, c), c)
+		return toString(v) in o
+	return in_
+
+
+## Equality Operators
+
+@compiler('==', '!=', '===', '!==')
+def compile_equality(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	test = strictlyEqual if len(s.id) == 3 else equal
+	if s.id[0] == '!':
+		return lambda c: not test(l(c), r(c))
+	return lambda c: test(l(c), r(c))
+
+
+## Binary Logical Operators
+
+@compiler('&&')
+def compile_and(s):
+	first, chain = binary_chain(s, ('&&',))
+	l = compile_value(first)
+	if len(chain) > 1:
+		rs = [compile_value(o.second) for o in chain]
+		def and_chain(c):
+			v = l(c)
+			for r in rs:
+				if not toBoolean(v):
+					return v
+				v = r(c)
+			return v
+		return and_chain
+	r = compile_value(s.second)
+	def and_(c):
+		v = l(c)
+		if not toBoolean(v):
+			return v
+		return r(c)
+	return and_
+
+@compiler('||')
+def compile_or(s):
+	first, chain = binary_chain(s, ('||',))
+	l = compile_value(first)
+	if len(chain) > 1:
+		rs = [compile_value(o.second) for o in chain]
+		def or_chain(c):
+			v = l(c)
+			for r in rs:
+				if toBoolean(v):
+					return v
+				v = r(c)
+			return v
+		return or_chain
+	r = compile_value(s.second)
+	def or_(c):
+		v = l(c)
+		if toBoolean(v):
+			return v
+		return r(c)
+	return or_
 
-	## Assignment Operators
-	elif s.id == '=':
-		l = evaluate(s.first, c)
-		r = getValue(evaluate(s.second, c), c)
-		putValue(l, r, c)
-		return r
-	elif s.id in ('*=', '/=', '%=', '+=', '-=',
-			'<<=', '>>=', '>>>=', '&=', '^=', '|='):
-		operator = s.id[:-1]
-		o = evaluate(s.first, c)
-		l = getValue(o, c)
-		r = getValue(evaluate(s.second, c), c)
-		v = applyOperator(operator, l, r)
+
+## Conditional Operator
+
+@compiler('?')
+def compile_conditional(s):
+	condition = compile_value(s.first)
+	l, r = compile_value(s.second), compile_value(s.third)
+	return lambda c: l(c) if toBoolean(condition(c)) else r(c)
+
+
+## Assignment Operators
+
+def compile_property_assignment(s):
+	"""compiles assigning to the property `s`, caching the slot it was last
+	found at for the shape of the object, when it could be written to"""
+	o, r = compile_value(s.first.first), compile_value(s.second)
+	if s.first.id == '.':
+		name = s.first.second.value
+		key = lambda c: name
+	else:
+		key = compile_value(s.first.second)
+	cache = [None, None, 0] # the shape and key last written, and its slot
+	def assignment(c):
+		object = toObject(o(c), c)
+		k = key(c)
+		if k.__class__ is float and object.__class__ is JavaScriptArray:
+			v = r(c)
+			elements = object.elements
+			if elements is not None \
+					and 0 <= k < len(elements) and k == int(k):
+				if v.__class__ is not float:
+					elements = object.elements_for((v,))
+				elements[int(k)] = v
+			else:
+				object[toString(k)] = v
+			return v
+		k = toString(k)
+		v = r(c)
+		shape = object.shape
+		if shape is cache[0] and k == cache[1]:
+			object.values[cache[2]] = v
+			return v
+		i = shape.slots.get(k)
+		if i is not None and shape.cacheable \
+				and not shape.flags[i] & READ_ONLY:
+			cache[0], cache[1], cache[2] = shape, k, i
+		object[k] = v
+		return v
+	return assignment
+
+@compiler('=')
+def compile_assignment(s):
+	if s.first.id in ('.', '['):
+		return compile_property_assignment(s)
+	l, r = compile_symbol(s.first), compile_value(s.second)
+	a = slot_address(s.first)
+	if a:
+		slots, slot = compile_slots(a[0]), a[1]
+		def assignment(c):
+			v = slots(c)[slot] = r(c)
+			return v
+		return assignment
+	def assignment(c):
+		o = l(c)
+		v = r(c)
 		putValue(o, v, c)
 		return v
-
-	## Comma Operator
-	elif s.id == ',':
-		getValue(evaluate(s.first, c), c)
-		return getValue(evaluate(s.second, c), c)
-
-	## Statements
-	elif s.id == '(statement)':
-		v = evaluate(s.first, c)
-		if isinstance(v, tuple):
-			if v[0] == 'break' and v[2] in set(l.value for l in s.labels):
-				return ('normal', v[1], None)
+	return assignment
+
+@compiler('*=', '/=', '%=', '+=', '-=', '<<=', '>>=', '>>>=', '&=', '^=', '|=')
+def compile_compound_assignment(s):
+	l, r = compile_symbol(s.first), compile_value(s.second)
+	operator = operators[s.id[:-1]]
+	a = slot_address(s.first)
+	if a:
+		slots, slot = compile_slots(a[0]), a[1]
+		def assignment(c):
+			values = slots(c)
+			v = values[slot] = operator(values[slot], r(c))
 			return v
-		else:
-			return ('normal', getValue(v, c), None)
-	elif s.id == 'var':
-		for var in s.first:
-			if var.id == '(identifier)': continue
-			evaluate(var, c) # assignment
-		return ('normal', None, None)
-
-	elif s.id == 'if':
-		if toBoolean(getValue(evaluate(s.first, c), c)):
-			return evaluate(s.block, c)
-		elif hasattr(s, 'elseblock'):
-			return evaluate(s.elseblock, c)
-		else:
-			return ('normal', None, None)
-
-	elif s.id == 'do':
-		t = True
-		while t:
-			v = evaluate(s.block, c)
-			if v[0] == 'continue' and \
-					(not v[2] or v[2] in set(l.value for l in s.labels)):
-				pass
-			elif v[0] == 'break' and \
-					(not v[2] or v[2] in set(l.value for l in s.labels)):
-				return ('normal', v[1], None)
-			elif v[0] != 'normal':
-				return v
-			t = toBoolean(getValue(evaluate(s.second, c), c))
-		return ('normal', v[1], None)
-
-	elif s.id == 'while':
+		return assignment
+	def assignment(c):
+		o = l(c)
+		v = operator(getValue(o, c), r(c))
+		putValue(o, v, c)
+		return v
+	return assignment
+
+
+## Comma Operator
+
+@compiler(',')
+def compile_comma(s):
+	l, r = compile_value(s.first), compile_value(s.second)
+	def comma(c):
+		l(c)
+		return r(c)
+	return comma
+
+
+## Statements
+
+statement_ids = set(['{', 'var', 'if', 'do', 'while', 'for', 'continue',
+	'break', 'return', 'with', 'switch', 'throw', 'try'])
+iteration_ids = set(['do', 'while', 'for', 'switch'])
+
+@compiler('(statement)')
+def compile_statement(s):
+	labels = frozenset(l.value for l in s.labels)
+	if s.first.id not in statement_ids:
+		return compile_value(s.first)
+	if s.first.id in iteration_ids:
+		statement = compilers[s.first.id](s.first, labels)
+	else:
+		statement = compile_symbol(s.first)
+	if not labels:
+		return statement
+	def labelled(c):
+		try:
+			return statement(c)
+		except Break, e:
+			if e.label not in labels:
+				raise
+			return e.value
+	return labelled
+
+@compiler('var')
+def compile_var(s):
+	assignments = [compile_symbol(var) for var in s.first
+		if var.id != '(identifier)']
+	def var(c):
+		for assignment in assignments:
+			assignment(c)
+	return var
+
+@compiler('if')
+def compile_if(s):
+	condition, block = compile_value(s.first), compile_block(s.block)
+	if s.elseblock is not None:
+		elseblock = compile_block(s.elseblock)
+	else:
+		elseblock = empty
+	def if_(c):
+		if toBoolean(condition(c)):
+			return block(c)
+		return elseblock(c)
+	return if_
+
+@compiler('do')
+def compile_do(s, labels=frozenset()):
+	block, condition = compile_block(s.block), compile_value(s.second)
+	def do(c):
 		v = None
-		while toBoolean(getValue(evaluate(s.second, c), c)):
-			v = evaluate(s.block, c)
-			if v[0] == 'continue' and \
-					(not v[2] or v[2] in set(l.value for l in s.labels)):
-				pass
-			elif v[0] == 'break' and \
-					(not v[2] or v[2] in set(l.value for l in s.labels)):
-				return ('normal', v[1], None)
-			elif v[0] != 'normal':
-				return v
-		return ('normal', v[1], None)
-	elif s.id == 'for':
+		budget = c.global_object.budget
+		while 1:
+			if budget is not None:
+				budget.spend()
+			try:
+				v = block(c)
+			except Continue, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+			except Break, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+				break
+			if not toBoolean(condition(c)):
+				break
+		return v
+	return do
+
+@compiler('while')
+def compile_while(s, labels=frozenset()):
+	condition, block = compile_value(s.first), compile_block(s.block)
+	def while_(c):
 		v = None
-		if hasattr(s, 'iterator'):
-			o = toObject(getValue(evaluate(s.object, c), c), c)
-			identifier = s.iterator
-			if identifier.id == 'var':
-				evaluate(identifier, c)
-				identifier = identifier.first[0]
-			for key in o:
-				putValue(evaluate(identifier, c), key, c)
-				result = evaluate(s.block, c)
-				v = result[1]
-				if result[0] == 'break' and (not result[2] or \
-						result[2] in set(l.value for l in s.labels)):
-					break
-				if result[0] == 'continue' and (not result[2] or \
-						result[2] in set(l.value for l in s.labels)):
-					continue
-				if result[0] != 'normal':
-					return result
+		budget = c.global_object.budget
+		while toBoolean(condition(c)):
+			if budget is not None:
+				budget.spend()
+			try:
+				v = block(c)
+			except Continue, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+			except Break, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+				break
+		return v
+	return while_
+
+@compiler('for')
+def compile_for(s, labels=frozenset()):
+	block = compile_block(s.block)
+	if s.iterator is not None:
+		return compile_for_in(s, block, labels)
+	initializer = condition = counter = None
+	if s.initializer is not None:
+		if s.initializer.id == 'var':
+			initializer = compile_symbol(s.initializer)
 		else:
-			if hasattr(s, 'initializer'):
-				i = evaluate(s.initializer, c)
-				if not s.initializer.id == 'var':
-					getValue(i, c)
-			while 1:
-				if hasattr(s, 'condition') and \
-						not toBoolean(getValue(evaluate(s.condition, c), c)):
-					break
-				result = evaluate(s.block, c)
-				v = result[1]
-				if result[0] == 'break' and (not result[2] or \
-						result[2] in set(l.value for l in s.labels)):
-					break
-				if result[0] == 'continue' and (not result[2] or \
-						result[2] in set(l.value for l in s.labels)):
-					pass
-				elif result[0] != 'normal':
-					return result
-				if hasattr(s, 'counter'):
-					getValue(evaluate(s.counter, c), c)
-		return ('normal', v, None)
-	elif s.id == 'continue':
-		return ('continue', None, s.first.value if s.first else None)
-	elif s.id == 'break':
-		return ('break', None, s.first.value if s.first else None)
-	elif s.id == 'return':
-		return ('return', evaluate(s.first, c) if s.first else None, None)
-	elif s.id == 'with':
-		c.scope = Scope(c.scope, toObject(getValue(evaluate(s.first, c), c), c))
+			initializer = compile_value(s.initializer)
+	if s.condition is not None:
+		condition = compile_value(s.condition)
+	if s.counter is not None:
+		counter = compile_value(s.counter)
+	def for_(c):
+		v = None
+		if initializer:
+			initializer(c)
+		budget = c.global_object.budget
+		while 1:
+			if condition and not toBoolean(condition(c)):
+				break
+			if budget is not None:
+				budget.spend()
+			try:
+				v = block(c)
+			except Continue, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+			except Break, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+				break
+			if counter:
+				counter(c)
+		return v
+	return for_
+
+def compile_for_in(s, block, labels):
+	o = compile_value(s.object)
+	identifier = s.iterator
+	var = None
+	if identifier.id == 'var':
+		var = compile_symbol(identifier)
+		identifier = identifier.first[0]
+	identifier = compile_symbol(identifier)
+	def for_in(c):
+		v = None
+		object = toObject(o(c), c)
+		if var:
+			var(c)
+		budget = c.global_object.budget
+		for key in object:
+			if budget is not None:
+				budget.spend()
+			putValue(identifier(c), key, c)
+			try:
+				v = block(c)
+			except Continue, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+			except Break, e:
+				if e.label and e.label not in labels:
+					raise
+				if e.value is not None:
+					v = e.value
+				break
+		return v
+	return for_in
+
+@compiler('continue')
+def compile_continue(s):
+	e = Continue(s.first.value if s.first else None)
+	def continue_(c):
+		raise e
+	return continue_
+
+@compiler('break')
+def compile_break(s):
+	e = Break(s.first.value if s.first else None)
+	def break_(c):
+		raise e
+	return break_
+
+@compiler('return')
+def compile_return(s):
+	if not s.first:
+		e = Return(None)
+		def return_(c):
+			raise e
+	else:
+		v = compile_value(s.first)
+		def return_(c):
+			raise Return(v(c))
+	return return_
+
+@compiler('with')
+def compile_with(s):
+	o, block = compile_value(s.first), compile_block(s.block)
+	def with_(c):
+		c.scope = Scope(c.scope, toObject(o(c), c))
 		try:
-			r = evaluate(s.block, c)
-		except JavaScriptException, e:
-			r = ('throw', e.value, None)
-		c.scope = c.scope.parent
-		return r
-	elif s.id == 'switch':
-		v = getValue(evaluate(s.condition, c), c)
-		default = result = None
-		while not result:
-			cases = s.cases
-			if default is not None:
-				cases = cases[default:]
-				result = ('normal', None, None)
-			for i, case in enumerate(cases):
-				if case.id == 'default' and default is None:
-					default = i
-				elif case.id == 'case' and not result:
-					if strictlyEqual(getValue(evaluate(case.first, c), c), v):
-						result = ('normal', None, None)
-				if result and hasattr(case, 'block'):
-					result = evaluate(case.block, c)
-				if result and result[0] != 'normal':
-					if result[0] == 'break' and (not result[2] or \
-							result[2] in set(l.value for l in s.labels)):
-						result = ('normal', result[1], None)
-					break
-			if not result and default is None:
-				result = ('normal', None, None)
-		return result
-	elif s.id == 'throw':
-		return ('throw', getValue(evaluate(s.first, c)), None)
-	elif s.id == 'try':
-		result = evaluate(s.block, c)
-		if result[0] == 'throw' and hasattr(s, 'catchblock'):
-			c.scope = Scope(c.scope, c.global_object.object.construct([], c))
-			c.scope.object.put(s.e.value, result[1], dont_delete=True)
-			r = evaluate(s.catchblock, c)
+			return block(c)
+		finally:
 			c.scope = c.scope.parent
-			if not hasattr(s, 'finallyblock') or r[0] != 'normal':
-				result = r
-		if hasattr(s, 'finallyblock'):
-			r = evaluate(s.finallyblock, c)
-			if not hasattr(s, 'catchblock') or r[0] != 'normal':
-				result = r
+	return with_
+
+@compiler('switch')
+def compile_switch(s, labels=frozenset()):
+	condition = compile_value(s.condition)
+	cases = []
+	for case in s.cases:
+		test = compile_value(case.first) if case.id == 'case' else None
+		block = compile_block(case.block) if case.block is not None else None
+		cases.append((test, block))
+	default = [i for i, (test, block) in enumerate(cases) if not test]
+	default = default[0] if default else len(cases)
+	def switch(c):
+		v = condition(c)
+		start = default
+		for i, (test, block) in enumerate(cases):
+			if test and strictlyEqual(test(c), v):
+				start = i
+				break
+		result = None
+		try:
+			for test, block in cases[start:]:
+				if block:
+					result = block(c)
+		except Break, e:
+			if e.label and e.label not in labels:
+				raise
+			if e.value is not None:
+				result = e.value
 		return result
-	elif s.id == 'function':
-		prototype = c.global_object.function['prototype']
-		if not s.is_decl and s.name:
+	return switch
+
+@compiler('throw')
+def compile_throw(s):
+	v = compile_value(s.first)
+	def throw(c):
+		raise JavaScriptException(v(c))
+	return throw
+
+@compiler('try')
+def compile_try(s):
+	block = compile_block(s.block)
+	name = catchblock = finallyblock = None
+	if s.catchblock is not None:
+		name, catchblock = s.e.value, compile_block(s.catchblock)
+	if s.finallyblock is not None:
+		finallyblock = compile_block(s.finallyblock)
+	slots = {name: 0}
+	def catch(c, e):
+		c.scope = Scope(c.scope, SlotActivation(slots, [e.value]))
+		try:
+			return catchblock(c)
+		finally:
+			c.scope = c.scope.parent
+	if not finallyblock:
+		def try_(c):
+			try:
+				return block(c)
+			except JavaScriptException, e:
+				return catch(c, e)
+	elif not catchblock:
+		def try_(c):
+			try:
+				return block(c)
+			finally:
+				finallyblock(c)
+	else:
+		def try_(c):
+			try:
+				try:
+					return block(c)
+				except JavaScriptException, e:
+					return catch(c, e)
+			finally:
+				finallyblock(c)
+	return try_
+
+def compile_body(s):
+	"parses, resolves and compiles the body a lazy parse skipped"
+	parse_body(s)
+	if s.levels is not None:
+		resolve_function(s, s.levels)
+		s.levels = None
+	s.code = compile_block(s.block)
+
+@compiler('function')
+def compile_function(s):
+	if s.code is None and s.lazy is None:
+		s.code = compile_block(s.block)
+	if not s.is_decl and s.name:
+		name = s.name.value
+		def function(c):
+			prototype = c.global_object.function['prototype']
 			scope = Scope(c.scope, c.global_object.object.construct([], c))
-			f = JavaScriptFunction(prototype, s, scope)
-			scope.object.put(s.name.value, f, dont_delete=True, read_only=True)
-		else:
-			f = JavaScriptFunction(prototype, s, c.scope)
-		return f
-
-	raise JavaScriptException(c.global_object.error.construct(
-		['unknown operation %s' % s.id], c))
+			f = c.global_object.function_class(prototype, s, scope)
+			scope.object.put(name, f, dont_delete=True, read_only=True)
+			return f
+	else:
+		def function(c):
+			prototype = c.global_object.function['prototype']
+			return c.global_object.function_class(prototype, s, c.scope)
+	return function
 
 
-def run(symbol, global_object=None):
-	if isinstance(symbol, basestring):
-		symbol = parse_str(symbol)
-	global_object = global_object or GlobalObject()
+def run_tree(symbol, global_object):
 	c = ExecutionContext(Scope(object=global_object),
 		global_object, global_object)
+	code = compile_program(symbol)
 	c.instantiate_variables(symbol, global_object)
-	return evaluate(symbol.first, c)[1]
+	return code(c)
+
+# the engines `run` can execute a program with, other modules add theirs
+engines = {'tree': run_tree}
+
+def run(symbol, global_object=None, engine='tree', stream=False,
+		steps=None, deadline=None):
+	"""runs a program or the source of one, which is run a statement at a
+	time as it is parsed if `stream`, see parse_iter.
+
+	With `steps` or a `deadline`, a time.time(), BudgetExceeded is raised
+	once the program has taken that many loop iterations and function
+	calls, or is still running after the deadline, see Budget."""
+	global_object = global_object or GlobalObject()
+	budget = global_object.budget
+	if steps is not None or deadline is not None:
+		global_object.budget = Budget(steps, deadline)
+	try:
+		if isinstance(symbol, basestring):
+			if stream:
+				v = None
+				for program in parse_iter(symbol):
+					v = engines[engine](program, global_object)
+				return v.flatten() if v.__class__ is Rope else v
+			symbol = parse_str(symbol)
+		v = engines[engine](symbol, global_object)
+		return v.flatten() if v.__class__ is Rope else v
+	finally:
+		global_object.budget = budget
 
 
@@ -1,9 +1,17 @@
 import re
+from bisect import bisect_left
+from collections import namedtuple
+
+
+def regexp_may_follow(id):
+	"""Whether a / after the token id starts a regular expression."""
+
+	return id and (id[-1] in '(,=:[!&|?{};' or id == 'return')
 
 
 class JavaScriptLexer(object):
 
-	tx = re.compile(r"""\s*(
+	tx = re.compile(r"""[^\S\n]*(
 		 [(){}\[.,:;\'"~\?\]#@]
 		|==?=?
 		|\/(\*|=|\/)?
@@ -20,169 +28,325 @@ class JavaScriptLexer(object):
 		|[a-zA-Z_$][a-zA-Z0-9_$]*
 		|[0-9]+([xX][0-9a-fA-F]+|\.[0-9]*)?([eE][+\-]?[0-9]+)?
 	)""", re.VERBOSE)
+	wx = re.compile(r'[^\S\n]*')
 	lx = re.compile(r'\*\/|\/\*')
+	nx = re.compile(r'\n')
 
-	sx = re.compile(r'^"(?:\\.|[^"])*"|^\'(?:\\.|[^\'])*\'')
-	rx = re.compile(r'^/((?:\\.|\[(?:\\.|[^\]])*\]|[^\/])+)\/([gimy]*)')
+	sx = {
+		'"': re.compile(r'"([^"\\]*(?:\\[\s\S][^"\\]*)*)"'),
+		"'": re.compile(r"'([^'\\]*(?:\\[\s\S][^'\\]*)*)'"),
+	}
+	ex = re.compile(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|[\s\S])|\n')
+	# backslashes and brackets only appear as escapes and classes, so a
+	# match in a truncated buffer is a prefix of the match in the whole
+	rx = re.compile(r'/((?:\\.|\[(?:\\.|[^\]\n\\])*\]|[^\/\n\\\[])+)\/([gimy]*)')
 
-	def __init__(self, source, symbol_table, filename=None):
+	def __init__(self, source, symbol_table, filename=None, first_line=0):
 		self.symbol_table = symbol_table
 		self.filename = filename
-		self.lines = source.split('\n')
-		self.lineno = -1
-		self.offset = 0
-		self.s = None
+		self.source = source
+		self.first_line = first_line # of source in the file
+		self.pos = 0
+		self.newlines = [m.start() for m in self.nx.finditer(source)]
+		self.lineno = 0
+		self.start = 0
 		self.prereg = True
 		self.comments = []
 
-		self.nextLine()
-		self.start = 0
+	def locate(self, pos):
+		"""Return the (lineno, column) of an offset into the source."""
+
+		lineno = bisect_left(self.newlines, pos)
+		return lineno, pos - (lineno and self.newlines[lineno - 1] + 1)
 
-	def nextLine(self):
-		self.lineno += 1
-		if self.lineno >= len(self.lines):
-			return False
-		self.offset = 0
-		self.s = self.lines[self.lineno];
-		return True
+	def line(self, lineno):
+		"""Return the text of a line; (end) tokens map to the last line."""
 
-	def it(self, type, value):
+		newlines = self.newlines
+		lineno = max(min(lineno - self.first_line, len(newlines)), 0)
+		start = lineno and newlines[lineno - 1] + 1
+		end = lineno < len(newlines) and newlines[lineno] or len(self.source)
+		return self.source[start:end]
+
+	def error(self, message, pos):
+		"""Raise SyntaxError at an offset; its lineno counts from 0 like
+		those of tokens and JavaScriptSyntaxError."""
+
+		lineno, offset = self.locate(pos)
+		lineno += self.first_line
+		raise SyntaxError(message,
+			(self.filename, lineno, offset, self.line(lineno)))
+
+	def it(self, type, value, start, end):
 		"""Produce a token object.  The token inherits from a syntax symbol."""
 
-		if type == '(punctuator)' or \
-				(type == '(identifier)' and value in self.symbol_table):
+		if type == '(punctuator)':
+			if value not in self.symbol_table:
+				self.error("Unexpected '%s'." % value, start)
+			t = self.symbol_table[value]
+		elif type == '(identifier)' and value in self.symbol_table:
 			t = self.symbol_table[value]
 		else:
 			t = self.symbol_table[type]
 
 		t = t()
-		if type == '(identifier)':
-			t.identifier = True
-
 		t.value = value
-		t.lineno = self.lineno
-		t.offset = self.offset
-		t.start = self.start
+		newlines = self.newlines
+		lineno = self.lineno
+		# only strings, comments and continuations span lines
+		while lineno < len(newlines) and newlines[lineno] < end:
+			lineno += 1
+		self.lineno = lineno
+		first = lineno and newlines[lineno - 1] + 1
+		t.lineno = lineno + self.first_line
+		t.offset = end - first
+		t.start = max(start - first, 0)
+		self.pos = end
 		i = t.id
 		if i != '(endline)':
-			self.prereg = i and (i[-1] in '(,=:[!&|?{};' or i == 'return')
+			self.prereg = regexp_may_follow(i)
 			t.comments = self.comments
 			self.comments = []
 		return t
 
-	def parse_string(self, t):
-		r = ''
-		j = 0
-		while True:
-			while j >= len(self.s):
-				j = 0
-				if not self.nextLine():
-					errorAt("Unclosed string.", line)
-			c = self.s[j]
-			if c == t:
-				self.offset += 1
-				self.s = self.s[j+1:]
-				return self.it('(string)', r)
-			#elif c < ' ':
-			#	if c == '\n' or c == '\r':
-			#		break
-			#	warningAt("Control character in string: {a}.", line, offset + j, s[:j])
-			elif c == '\\' and j + 1 == len(self.s):
-				self.nextLine()
-				j = 0
-			elif c == '\\':
-				j += 1
-				self.offset += 1
-				c = self.s[j]
-
-				if c == 'u':
-					c = unichr(int(self.s[j+1:j+5], 16))
-					j += 4
-					self.offset += 4
-				elif c == 'x':
-					c = unichr(int(self.s[j+1:j+3], 16))
-					j += 2
-					self.offset += 2
-				else:
-					c = {
-						'\\': '\\',
-						"'": "'",
-						'"': '"',
-						'/': '/',
-						'b': '\b',
-						'f': '\f',
-						'n': '\n',
-						'r': '\r',
-						't': '\t',
-						'v': '\v',
-					}.get(c, c)
-			r += c
-			self.offset += 1
-			j += 1
+	def parse_string(self, s, q, start, final=True):
+		m = self.sx[q].match(s, start)
+		if not m:
+			if not final:
+				return None
+			self.error("Unclosed string.", start)
+		r = m.group(1)
+		if '\\' in r or '\n' in r:
+			try:
+				r = self.ex.sub(self.unescape, r)
+			except ValueError:
+				self.error("Bad escape sequence.", start)
+		return '(string)', r, start, m.end()
+
+	escapes = {
+		'\\': '\\',
+		"'": "'",
+		'"': '"',
+		'/': '/',
+		'b': '\b',
+		'f': '\f',
+		'n': '\n',
+		'r': '\r',
+		't': '\t',
+		'v': '\v',
+		# line continuation
+		'\n': '',
+	}
+
+	@classmethod
+	def unescape(cls, m):
+		c = m.group(1)
+		if c is None:
+			# an unescaped line break is dropped
+			return ''
+		if len(c) > 1:
+			return unichr(int(c[1:], 16))
+		if c == 'u' or c == 'x': # without the hex digits
+			raise ValueError('bad escape')
+		return cls.escapes.get(c, c)
 
 	def token(self):
 		"""called by advance to get the next token."""
 
+		return self.it(*self.scan(self.source, self.pos))
+
+	def skip_block(self):
+		"""Scan up to the } closing the block whose { was the last token,
+		so that it is the next token, and return its offset."""
+
+		s = self.source
+		pos = self.pos
+		depth = 1
+		while 1:
+			type, value, start, end = self.scan(s, pos)
+			if type == '(end)':
+				break
+			if type == '(punctuator)':
+				if value == '{':
+					depth += 1
+				elif value == '}':
+					depth -= 1
+					if not depth:
+						break
+			if type != '(endline)':
+				keyword = type == '(identifier)' and value in self.symbol_table
+				self.prereg = regexp_may_follow(
+					value if type == '(punctuator)' or keyword else type)
+			pos = end
+		self.pos = start
+		self.comments = []
+		return start
+
+	def scan(self, s, pos, final=True):
+		"""Find the next token in s at or after pos.
+
+		Returns a (type, value, start, end) tuple, or None if s is not
+		final and the token might continue past its end.
+		"""
+
+		n = len(s)
+		if not final:
+			# numbers like 1e+5 need to see ahead of their match
+			n -= 3
 		while 1:
-			if not self.s:
-				return self.it(self.nextLine() and '(endline)' or '(end)', '')
-			m = self.tx.match(self.s)
+			m = self.tx.match(s, pos)
 			if not m:
-				self.c = ''
-				while self.s and self.s < '!':
-					self.s = self.s[1:]
-				if self.s:
-					errorAt("Unexpected '%s'.", self.lineno, self.offset, self.s[0])
-				continue
+				pos = self.wx.match(s, pos).end()
+				if pos >= len(s):
+					if not final:
+						return None
+					return '(end)', '', pos, pos
+				if s[pos] == '\n':
+					return '(endline)', '', pos, pos + 1
+				# control characters are skipped
+				if s[pos] < '!':
+					pos += 1
+					continue
+				self.error("Unexpected '%s'." % s[pos], pos)
 
 			t = m.group(1)
-			#print t
-			self.c = t[0]
-			self.s = self.s[m.end():]
-			self.offset += m.end()
-			self.start = self.offset - len(t)
+			c = t[0]
+			start = m.start(1)
+			end = m.end()
+			if end > n:
+				return None
 
 			# identifier
-			if self.c.isalpha() or self.c == '_' or self.c == '$':
-				return self.it('(identifier)', t)
+			if c.isalpha() or c == '_' or c == '$':
+				return '(identifier)', t, start, end
 			# number
-			if self.c.isdigit():
-				return self.it('(number)', t)
+			if c.isdigit():
+				return '(number)', t, start, end
 			# string
 			if t == '"' or t == "'":
-				return self.parse_string(t)
+				return self.parse_string(s, t, start, final)
 			# // comment
 			if t == '//':
-				self.s = ''
+				pos = s.find('\n', end)
+				if pos < 0:
+					if not final:
+						return None
+					pos = len(s)
 				continue
 			# /* comment
 			if t == '/*':
-				while 1:
-					m = self.lx.search(self.s)
-					if m:
-						break
-					t += self.s + '\n'
-					if not self.nextLine():
-						errorAt("Unclosed comment.", self.lineno, self.offset)
-				t += self.s[:m.end()]
-				self.comments.append(t)
-				self.offset += m.end()
-				if self.s[m.start()] == '/':
-					errorAt("Nested comment.", self.lineno, self.offset)
-				self.s = self.s[m.end():]
-				continue
-			if t == '':
+				m = self.lx.search(s, end)
+				if not m:
+					if not final:
+						return None
+					self.error("Unclosed comment.", start)
+				if s[m.start()] == '/':
+					self.error("Nested comment.", m.start())
+				self.comments.append(s[start:m.end()])
+				pos = m.end()
 				continue
 			# /
 			if (t == '/' or t == '/=') and self.prereg:
-				m = self.rx.match(t + self.s)
-				if m:
-					l = m.end() - len(t)
-					t += self.s[:l]
-					self.offset += l
-					self.s = self.s[l:]
-					return self.it('(regexp)', t)
+				m = self.rx.match(s, start)
+				if m and m.end() <= n:
+					return '(regexp)', m.group(), start, m.end()
+				if not final and (m or s.find('\n', start) < 0):
+					return None
 			# punctuator
-			return self.it('(punctuator)', t)
+			return '(punctuator)', t, start, end
+
+
+Token = namedtuple('Token', 'type value lineno column')
+
+
+class JavaScriptTokenizer(JavaScriptLexer):
+	"""Scans input arriving in chunks into Token records.
+
+	Only the unconsumed tail of the input is kept, and no syntax symbols
+	are built.  self.source is the current buffer, self.pos the end of the
+	last token in it and self.line_start the buffer offset of its line,
+	which goes negative once the line began in an earlier chunk.
+	"""
+
+	def __init__(self, filename=None, chunk_size=65536):
+		JavaScriptLexer.__init__(self, '', None, filename)
+		self.chunk_size = chunk_size
+		self.line_start = 0
+
+	def error(self, message, pos):
+		s = self.source
+		lineno = self.lineno + s.count('\n', self.pos, pos)
+		start = lineno > self.lineno and s.rfind('\n', 0, pos) + 1 \
+			or self.line_start
+		end = s.find('\n', pos)
+		raise SyntaxError(message, (self.filename, lineno, pos - start,
+			s[max(start, 0):end < 0 and len(s) or end]))
+
+	def chunks(self, source):
+		if isinstance(source, basestring):
+			yield source
+		elif hasattr(source, 'read'):
+			while 1:
+				chunk = source.read(self.chunk_size)
+				if not chunk:
+					break
+				yield chunk
+		else:
+			for chunk in source:
+				yield chunk
+
+	def tokens(self, source):
+		chunks = self.chunks(source)
+		final = False
+		s = self.source
+		while 1:
+			pos = self.pos
+			t = self.scan(s, pos, final)
+			if self.comments:
+				self.comments = []
+			if t is None:
+				# drop what was consumed and read at least as much as is
+				# left, so a long token is not rescanned once per chunk
+				s = [s[pos:]]
+				self.line_start -= pos
+				self.pos = 0
+				need = max(self.chunk_size, len(s[0]))
+				for chunk in chunks:
+					s.append(chunk)
+					need -= len(chunk)
+					if need <= 0:
+						break
+				else:
+					final = True
+				s = self.source = ''.join(s)
+				continue
+
+			type, value, start, end = t
+			if s.count('\n', pos, start):
+				self.lineno += s.count('\n', pos, start)
+				self.line_start = s.rfind('\n', pos, start) + 1
+			self.pos = end
+			if type == '(endline)':
+				self.lineno += 1
+				self.line_start = end
+				continue
+			if type == '(end)':
+				return
+			self.prereg = type == '(punctuator)' and \
+					value[-1] in '(,=:[!&|?{};' or \
+				type == '(identifier)' and value == 'return'
+			yield Token(type, value, self.lineno, start - self.line_start)
+			if type == '(string)' and s.count('\n', start, end):
+				self.lineno += s.count('\n', start, end)
+				self.line_start = s.rfind('\n', start, end) + 1
+
+
+def tokenize(source, filename=None, chunk_size=65536):
+	"""Generate the Tokens of a string, file object or iterable of strings.
 
+	Input is read chunk_size characters at a time and only the token being
+	scanned is kept in memory.  Line numbers and columns are 0-based, as on
+	parser tokens, and line breaks and comments are not reported.
+	"""
 
+	return JavaScriptTokenizer(filename, chunk_size).tokens(source)
@@ -0,0 +1,204 @@
+"""Folds constant expressions and prunes dead branches in a parsed program.
+
+Operators on literals are evaluated with the interpreter's own operator
+functions, so a folded value is exactly what running the expression would
+have given, and `if`, `?`, `&&`, `||` and `while` on a constant condition
+are replaced by the branch that is taken.  Declarations in a pruned branch
+stay hoisted: they were collected into `vars` and `functions` by the
+parser.
+
+	program = optimize(parse_str(source))
+
+Function bodies a lazy parse skipped are left alone.
+"""
+
+from parser import symbol_table, binary_chain, child_attributes
+from interpreter import operators, null, typeof, toBoolean, toNumber, \
+	toInt32, toString, lessThan, equal, strictlyEqual, applyOperator
+from math import isinf, isnan, copysign
+
+
+unknown = object() # the value of an expression that isn't constant
+
+def value(s):
+	"the value of `s` if it is a literal, otherwise unknown"
+	id = s.id
+	if id == '(number)':
+		try:
+			return float(s.value)
+		except ValueError: # hex, which the interpreter doesn't read either
+			return unknown
+	if id == '(string)':
+		return s.value
+	if id == 'true':
+		return True
+	if id == 'false':
+		return False
+	if id == 'null':
+		return null
+	if id == '-' and s.arity is not None and s.first.id == '(number)':
+		v = value(s.first) # how negative numbers are written
+		return -v if v is not unknown else unknown
+	return unknown
+
+def literal(v, s):
+	"""a literal for the value `v` to replace `s` with, or None where there
+	is no literal for it"""
+	if v is True or v is False or v is null:
+		t = symbol_table[toString(v)](s)
+	elif typeof(v) == 'string':
+		t = symbol_table['(string)'](s)
+		t.value = toString(v)
+	elif v.__class__ is float:
+		if isnan(v) or isinf(v) or v == 0 and copysign(1, v) < 0:
+			return None
+		if v < 0:
+			t = symbol_table['-'](s)
+			t.arity = 'unary'
+			t.first = literal(-v, s)
+			return t
+		t = symbol_table['(number)'](s)
+		t.value = '%d' % v if v % 1 == 0 and v < 1e21 else repr(v)
+	else:
+		return None
+	return t
+
+def relational(swap, negate):
+	def compare(l, r):
+		v = lessThan(r, l) if swap else lessThan(l, r)
+		return False if v == None else v != negate
+	return compare
+
+comparisons = {
+	'<': relational(False, False),
+	'>': relational(True, False),
+	'<=': relational(True, True),
+	'>=': relational(False, True),
+	'==': equal, '===': strictlyEqual,
+	'!=': lambda l, r: not equal(l, r),
+	'!==': lambda l, r: not strictlyEqual(l, r),
+}
+
+unary_operators = {
+	'!': lambda v: not toBoolean(v),
+	'~': lambda v: float(~int(toInt32(v))),
+	'+': toNumber,
+	'-': lambda v: -toNumber(v),
+}
+
+binary_ids = set(operators) | set(comparisons) | set(['&&', '||'])
+
+def fold_binary(s):
+	l, r = value(s.first), value(s.second)
+	if l is unknown:
+		if r is not unknown and s.id == '+' and typeof(r) == 'string':
+			# (x + 'a') + 'b' is a string whatever x is, x + 'ab'
+			left = s.first
+			if left.id == '+' and left.arity is None and \
+					typeof(value(left.second)) == 'string':
+				left.second = literal(value(left.second) + r, left.second)
+				return left
+		return s
+	if s.id == '&&':
+		return s.second if toBoolean(l) else s.first
+	if s.id == '||':
+		return s.first if toBoolean(l) else s.second
+	if r is unknown:
+		return s
+	if s.id in comparisons:
+		v = comparisons[s.id](l, r)
+	else:
+		try:
+			v = applyOperator(s.id, l, r)
+		except ArithmeticError: # 1 / 0, left to fail as it would have
+			return s
+	return literal(v, s) or s
+
+def fold_unary(s):
+	v = value(s.first)
+	if v is unknown or s.id == '-' and s.first.id == '(number)':
+		return s
+	return literal(unary_operators[s.id](v), s) or s
+
+def fold_conditional(s):
+	v = value(s.first)
+	if v is unknown:
+		return s
+	return s.second if toBoolean(v) else s.third
+
+def block(statements, s):
+	t = symbol_table['{'](s)
+	t.block = statements
+	return t
+
+def fold_if(s):
+	v = value(s.first)
+	if v is unknown:
+		return s
+	if toBoolean(v):
+		return block(s.block, s)
+	return block(s.elseblock or [], s)
+
+def fold_while(s):
+	v = value(s.first)
+	if v is unknown or toBoolean(v):
+		return s
+	return block([], s)
+
+folders = {'?': fold_conditional, 'if': fold_if, 'while': fold_while}
+for id in unary_operators:
+	folders[id] = fold_unary
+
+# where the first operand is used as a reference, which the value of
+# (0 || o.f) isn't: (0 || o.f)() calls f with another this
+reference_ids = set(['(', 'new', 'typeof', 'delete', '++', '--', '=',
+	'+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=', '>>>='])
+
+def fold(s):
+	"folds the constants below `s`, returning it or the node to replace it by"
+	if s.id == 'function':
+		if s.lazy is None:
+			fold_list(s.block)
+		return s
+	if s.id in ('break', 'continue'): # first is a label
+		return s
+	if s.id in binary_ids and s.arity is None:
+		# a long a + b + c is folded in a loop, see binary_chain
+		first, chain = binary_chain(s, binary_ids)
+		v = fold(first)
+		for operator in chain:
+			operator.first = v
+			operator.second = fold(operator.second)
+			v = fold_binary(operator)
+		return v
+	for attr in child_attributes:
+		child = getattr(s, attr)
+		if child is None:
+			continue
+		if isinstance(child, list):
+			fold_list(child)
+			continue
+		t = fold(child)
+		if attr == 'first' and s.id in reference_ids and \
+				t.id in ('(identifier)', '.', '['):
+			t = child
+		setattr(s, attr, t)
+	if s.id in folders:
+		return folders[s.id](s)
+	return s
+
+def fold_list(s):
+	for i, child in enumerate(s):
+		if isinstance(child, tuple): # (object) key, value
+			s[i] = child[0], fold(child[1])
+		elif child is not None:
+			s[i] = fold(child)
+
+def optimize(s):
+	"""folds the constants in the program or function `s` before it is run,
+	returning it"""
+	if s.id == '(global)':
+		fold_list(s.first)
+	else:
+		fold(s)
+	return s
@@ -1,24 +1,55 @@
 
+import os, sys, tempfile, hashlib, cPickle
+from multiprocessing import Pool
+from optparse import OptionParser
 from lexer import JavaScriptLexer
 
 class JavaScriptSyntaxError(SyntaxError):
-	def __init__(self, msg, t=None):
+	def __init__(self, msg, t=None, lexer=None):
 		self.msg = msg
-		if not t:
-			t = nexttoken
-		if t.id == '(end)':
-			t = token
-		self.lineno = t.lineno
-		self.offset = t.offset
-		# if the token is (end) the lineno is len+1
-		self.text = lexer.lines[min(t.lineno, len(lexer.lines) - 1)]
-		self.filename = lexer.filename
+		if t:
+			self.lineno = t.lineno
+			self.offset = t.offset
+			self.text = lexer.line(t.lineno)
+			self.filename = lexer.filename
+
+	def __reduce__(self):
+		# for passing errors back from worker processes
+		return JavaScriptSyntaxError, (self.msg,), dict(lineno=self.lineno,
+			offset=self.offset, text=self.text, filename=self.filename)
+
+	def __setstate__(self, state):
+		for key, value in state.items():
+			setattr(self, key, value)
+
+def recursion_limit(e):
+	"""whether RuntimeError `e` is Python's recursion limit, which deeply
+	nested source runs into when parsed, and deep recursion when run by the
+	engines that call on the Python stack"""
+	return str(e).startswith('maximum recursion depth exceeded')
 
 class Symbol(object):
 
+	# Every field is present on every node, None when it doesn't apply.
+	fields = ('value', 'lineno', 'offset', 'start', 'comments',
+		'first', 'second', 'third', 'arity', 'params', 'labels',
+		# statements
+		'block', 'elseblock', 'condition', 'initializer', 'counter',
+		'iterator', 'object', 'cases', 'e', 'catchblock', 'finallyblock',
+		# functions and the (global) context
+		'name', 'is_decl', 'functions', 'vars', 'iteration_depth',
+		'switch_depth', 'lazy',
+		# whether the arguments object may be used, so has to be made
+		'uses_arguments')
+	# set by the interpreters, and not pickled
+	caches = ('address', 'levels', 'slots', 'param_slots', 'code',
+		'bytecode', 'python', 'python_source')
+	__slots__ = fields + caches
+
 	id = None
-	value = None
-	first = second = third = None
+	kind = 0 # small integer standing for id
+	lbp = 0
+	fud = None
 
 	reach = False
 	reserved = False
@@ -30,16 +61,28 @@ class Symbol(object):
 			self.lineno = replace_token.lineno
 			self.offset = replace_token.offset
 			self.start = replace_token.start
+		else:
+			self.lineno = self.offset = self.start = None
 		self.first = first
 		self.second = second
-
-	def led(self, left):
-		raise JavaScriptSyntaxError("Expected an operator and instead saw '%s'." %
-			nexttoken.value, nexttoken)
-
-	def nud(self):
-		raise JavaScriptSyntaxError(
-			"Expected an identifier and instead saw '%s'." % token.id, token)
+		self.value = self.comments = self.third = self.arity = \
+			self.params = self.labels = self.block = self.elseblock = \
+			self.condition = self.initializer = self.counter = \
+			self.iterator = self.object = self.cases = self.e = \
+			self.catchblock = self.finallyblock = self.name = \
+			self.is_decl = self.functions = self.vars = \
+			self.iteration_depth = self.switch_depth = self.lazy = \
+			self.uses_arguments = None
+		self.address = self.levels = self.slots = self.param_slots = \
+			self.code = self.bytecode = self.python = self.python_source = None
+
+	def led(self, p, left):
+		raise p.error("Expected an operator and instead saw '%s'." %
+			p.nexttoken.value, p.nexttoken)
+
+	def nud(self, p):
+		raise p.error(
+			"Expected an identifier and instead saw '%s'." % p.token.id, p.token)
 
 	def __repr__(self):
 		if self.id in ('(identifier)', '(number)', '(string)'):
@@ -48,15 +91,37 @@ class Symbol(object):
 		out = map(str, filter(None, out))
 		return "(" + " ".join(out) + ")"
 
+	def __reduce__(self):
+		# symbol classes are made by symbol() so pickle can't find them,
+		# and only the fields that are set are kept, as (index, value)
+		state = []
+		for i, field in enumerate(self.fields):
+			value = getattr(self, field)
+			if value is not None:
+				state.append(i)
+				state.append(value)
+		return make_symbol, (self.id,), tuple(state)
+
+	def __setstate__(self, state):
+		Symbol.__init__(self)
+		fields = self.fields
+		for i in xrange(0, len(state), 2):
+			setattr(self, fields[state[i]], state[i + 1])
+
+def make_symbol(id):
+	return Symbol.__new__(symbol_table[id])
+
 def symbol(id, bp=0):
 	try:
 		s = symbol_table[id]
 	except KeyError:
 		class s(Symbol):
-			pass
+			__slots__ = ()
 		s.__name__ = "symbol-" + id # for debugging
 		s.id = id
-		s.value = None
+		s.kind = len(symbol_table) + 1
+		# words are lexed as identifiers, even operators like typeof
+		s.identifier = id[0].isalpha()
 		s.lbp = bp
 		symbol_table[id] = s
 	else:
@@ -65,24 +130,24 @@ def symbol(id, bp=0):
 
 def infix(id, bp):
 	s = symbol(id, bp)
-	def led(self, left):
+	def led(self, p, left):
 		self.first = left
-		self.second = parse(bp)
+		self.second = p.parse(bp)
 		return self
 	s.led = led
 	return s
 
 def infix_r(id, bp):
-	def led(self, left):
+	def led(self, p, left):
 		self.first = left
-		self.second = parse(bp-1)
+		self.second = p.parse(bp-1)
 		return self
 	symbol(id, bp).led = led
 
 def prefix(id, bp=150):
 	s = symbol(id)
-	def nud(self):
-		self.first = parse(bp)
+	def nud(self, p):
+		self.first = p.parse(bp)
 		self.arity = 'unary'
 		return self
 	s.nud = nud
@@ -90,7 +155,7 @@ def prefix(id, bp=150):
 
 def suffix(id):
 	s = symbol(id, 150)
-	def led(self, left):
+	def led(self, p, left):
 		self.first = left
 		return self
 	s.led = led
@@ -107,16 +172,16 @@ def reserve(id, f=None):
 	return s
 
 def reservevar(id):
-	return reserve(id, lambda self: self)
+	return reserve(id, lambda self, p: self)
 
 def assignop(id):
 	@method(symbol(id, 20))
-	def led(self, left):
+	def led(self, p, left):
 		self.first = left
 		if not left or left.reserved or \
 				(left.id != '.' and left.id != '[' and not left.identifier):
-			raise JavaScriptSyntaxError("Bad assignment.", self)
-		self.second = parse(19)
+			raise p.error("Bad assignment.", self)
+		self.second = p.parse(19)
 		return self
 
 def stmt(id):
@@ -144,13 +209,19 @@ def method(s):
 
 symbol_table = {}
 
-type('(number)', lambda self: self)
-type('(string)', lambda self: self)
-type('(regexp)', lambda self: self)
+type('(number)', lambda self, p: self)
+type('(string)', lambda self, p: self)
+type('(regexp)', lambda self, p: self)
 type('(array)')
 type('(object)')
 
-symbol('(identifier)').nud = lambda self: self
+@method(symbol('(identifier)'))
+def nud(self, p):
+	# eval could reach arguments too
+	if self.value == 'arguments' or self.value == 'eval':
+		p.context.uses_arguments = True
+	return self
+symbol('(identifier)').identifier = True
 
 symbol('(statement)')
 
@@ -162,9 +233,9 @@ symbol(')'); symbol(']'); symbol('}').reach = True
 symbol(';'); symbol(':').reach = True
 
 @method(symbol(',', 10))
-def led(self, left):
+def led(self, p, left):
 	self.first = left
-	self.second = parse(0)
+	self.second = p.parse(0)
 	return self
 
 reserve('else')
@@ -181,11 +252,11 @@ assignop('%='); assignop('&='); assignop('|='); assignop('^=')
 assignop('<<='); assignop('>>='); assignop('>>>=')
 
 @method(infix('?', 30))
-def led(self, left):
+def led(self, p, left):
 	self.first = left
-	self.second = parse(10)
-	advance(':')
-	self.third = parse(10)
+	self.second = p.parse(10)
+	p.advance(':')
+	self.third = p.parse(10)
 	return self
 
 infix('||', 40); infix('&&', 50)
@@ -210,322 +281,280 @@ prefix('~'); prefix('!');
 prefix('typeof'); prefix('void')
 
 @method(prefix('new', 155))
-def nud(self):
-	self.first = parse(155)
+def nud(self, p):
+	self.first = p.parse(155)
 	return self
 
 @method(infix('.', 160))
-def led(self, left):
+def led(self, p, left):
 	self.first = left
-	self.second = identifier()
+	self.second = p.identifier()
 	return self
 
 
 @method(infix('(', 155))
-def led(self, left):
+def led(self, p, left):
 	if left.id == 'new':
 		s = left
 	else:
 		s = self
-		self.lbp = 160
 		self.first = left
 	s.params = []
-	while nexttoken.id != ')':
-		s.params.append(parse(10))
-		if nexttoken.id == ',':
-			advance(',')
-	advance(')')
+	while p.nexttoken.id != ')':
+		s.params.append(p.parse(10))
+		if p.nexttoken.id == ',':
+			p.advance(',')
+	p.advance(')')
 	return s
 
 @method(prefix('('))
-def nud(self):
-	v = parse(0)
-	advance(')', self)
+def nud(self, p):
+	v = p.parse(0)
+	p.advance(')', self)
 	return v
 
 
 @method(infix('[', 160))
-def led(self, left):
+def led(self, p, left):
 	self.first = left
-	self.second = parse(0)
-	advance(']', self)
+	self.second = p.parse(0)
+	p.advance(']', self)
 	return self
 
 @method(prefix('['))
-def nud(self):
+def nud(self, p):
 	s = symbol_table['(array)'](self)
 	s.first = []
-	while nexttoken.id != ']':
-		s.first.append(parse(10))
-		if nexttoken.id == ',':
-			advance(',')
-	advance(']', s)
+	while p.nexttoken.id != ']':
+		s.first.append(p.parse(10))
+		if p.nexttoken.id == ',':
+			p.advance(',')
+	p.advance(']', s)
 	return s
 
 
 @method(symbol('{'))
-def fud(self):
-	self.block = block()
-	advance('}', self)
+def fud(self, p):
+	self.block = p.block()
+	p.advance('}', self)
 	return self
 
 @method(symbol('{'))
-def nud(self):
+def nud(self, p):
 	s = symbol_table['(object)'](self)
 	s.first = []
-	while nexttoken.id != '}':
-		key = optionalidentifier()
+	while p.nexttoken.id != '}':
+		key = p.optionalidentifier()
 		if not key:
-			if nexttoken.id in ('(string)', '(number)'):
-				key = advance()
+			if p.nexttoken.id in ('(string)', '(number)'):
+				key = p.advance()
 			else:
-				raise JavaScriptSyntaxError(
-					"Expected '}' and instead saw '%s'." % nexttoken.value, nexttoken)
-		advance(':')
-		s.first.append((key, parse(10)))
-		if nexttoken.id == ',':
-			advance(',')
-	advance('}', self)
+				raise p.error(
+					"Expected '}' and instead saw '%s'." % p.nexttoken.value, p.nexttoken)
+		p.advance(':')
+		s.first.append((key, p.parse(10)))
+		if p.nexttoken.id == ',':
+			p.advance(',')
+	p.advance('}', self)
 	return s
 
 
-def varstatement(prefix=False):
-	vars = []
-	while 1:
-		var = identifier()
-		context.vars.add(var.value)
-		if prefix:
-			return [var]
-		if nexttoken.id == '=':
-			t = advance('=')
-			var = symbol_table['='](t, var, parse(19))
-		vars.append(var)
-		if nexttoken.id != ',':
-			return vars
-		advance(',')
-
-
 @method(stmt('var'))
-def nud(self):
-	self.first = varstatement()
+def nud(self, p):
+	self.first = p.varstatement()
 	return self
 
-def functionparams():
-	t = advance('(')
-	p = []
-	while nexttoken.id != ')':
-		p.append(identifier())
-		if nexttoken.id == ',':
-			advance(',')
-	advance(')', t)
-	return p
-
-def function(s, is_decl=True):
-	global context
-	s.is_decl = is_decl
-	s.name = optionalidentifier()
-	if is_decl and s.name:
-		context.functions[s.name] = s
-	s.params = functionparams()
-	s.functions = {}
-	s.vars = set()
-	s.labels = set()
-	s.iteration_depth = 0
-	s.switch_depth = 0
-	c, context = context, s
-	s.block = block()
-	context = c
-
 @method(blockstmt('function'))
-def fud(self):
-	function(self)
-	if nexttoken.id == '(' and nexttoken.lineno == token.lineno:
-		raise JavaScriptSyntaxError(
+def fud(self, p):
+	p.function(self)
+	if p.nexttoken.id == '(' and p.nexttoken.lineno == p.token.lineno:
+		raise p.error(
 			"Function statements are not invocable. Wrap the function expression in parens.", self)
 	return self
 
 @method(prefix('function'))
-def nud(self):
-	function(self, False)
+def nud(self, p):
+	p.function(self, False)
 	return self
 
 @method(blockstmt('if'))
-def nud(self):
-	t = advance('(')
-	self.first = parse(5)
-	advance(')', t)
-	self.block = block()
-	if nexttoken.id == 'else':
-		advance('else')
-		self.elseblock = block()
+def nud(self, p):
+	t = p.advance('(')
+	self.first = p.parse(5)
+	p.advance(')', t)
+	self.block = p.block()
+	if p.nexttoken.id == 'else':
+		p.advance('else')
+		self.elseblock = p.block()
 	return self
 
 @method(blockstmt('try'))
-def nud(self):
-	self.block = block()
-	if nexttoken.id == 'catch':
-		advance('catch')
-		t = advance('(')
-		self.e = advance('(identifier)')
-		advance(')', t)
-		self.catchblock = block()
-	if nexttoken.id == 'finally':
-		advance('finally')
-		self.finallyblock = block()
-	elif not hasattr(self, 'catchblock'):
-		raise JavaScriptSyntaxError(
-			"Expected 'catch' and instead saw '%s'." % nexttoken.value, nexttoken)
+def nud(self, p):
+	self.block = p.block()
+	if p.nexttoken.id == 'catch':
+		p.advance('catch')
+		t = p.advance('(')
+		self.e = p.advance('(identifier)')
+		p.advance(')', t)
+		self.catchblock = p.block()
+	if p.nexttoken.id == 'finally':
+		p.advance('finally')
+		self.finallyblock = p.block()
+	elif self.catchblock is None:
+		raise p.error(
+			"Expected 'catch' and instead saw '%s'." % p.nexttoken.value, p.nexttoken)
 	return self
 
 @method(blockstmt('while'))
-def nud(self):
-	t = advance('(')
-	self.first = parse(5)
-	advance(')', t)
-	context.iteration_depth += 1
-	self.block = block()
-	context.iteration_depth -= 1
+def nud(self, p):
+	t = p.advance('(')
+	self.first = p.parse(5)
+	p.advance(')', t)
+	p.context.iteration_depth += 1
+	self.block = p.block()
+	p.context.iteration_depth -= 1
 	return self
 
 @method(blockstmt('with'))
-def nud(self):
-	t = advance('(')
-	self.first = parse(5)
-	advance(')', t)
-	self.block = block()
+def nud(self, p):
+	p.context.uses_arguments = True # as an unqualified name
+	t = p.advance('(')
+	self.first = p.parse(5)
+	p.advance(')', t)
+	self.block = p.block()
 	return self
 
 @method(blockstmt('switch'))
-def nud(self):
-	t = advance('(')
-	self.condition = parse(19)
-	advance(')', t)
-	context.switch_depth += 1
-	t = advance('{')
+def nud(self, p):
+	t = p.advance('(')
+	self.condition = p.parse(19)
+	p.advance(')', t)
+	p.context.switch_depth += 1
+	t = p.advance('{')
 	self.cases = []
 	case = default = None
 	while 1:
-		if nexttoken.id == 'case':
-			case = advance('case')
-			case.first = parse(20)
+		if p.nexttoken.id == 'case':
+			case = p.advance('case')
+			case.first = p.parse(20)
 			self.cases.append(case)
-			advance(':')
-		elif nexttoken.id == 'default':
+			p.advance(':')
+		elif p.nexttoken.id == 'default':
 			if default:
-				raise JavaScriptSyntaxError(
-					"More than one default statement", nexttoken)
-			case = default = advance('default')
+				raise p.error(
+					"More than one default statement", p.nexttoken)
+			case = default = p.advance('default')
 			self.cases.append(case)
-			advance(':')
-		elif nexttoken.id == '}':
-			advance('}', t)
-			context.switch_depth -= 1
+			p.advance(':')
+		elif p.nexttoken.id == '}':
+			p.advance('}', t)
+			p.context.switch_depth -= 1
 			return self
 		elif case:
-			casestatements = statements()
+			casestatements = p.statements()
 			if casestatements:
 				case.block = casestatements
 			case = None
 		else:
-			if nexttoken.id == '(end)':
-				raise JavaScriptSyntaxError("Missing '}'.", nexttoken);
-			raise JavaScriptSyntaxError(
-				"Expected 'case' and instead saw '%s'." % nexttoken.value, nexttoken)
+			if p.nexttoken.id == '(end)':
+				raise p.error("Missing '}'.", p.nexttoken);
+			raise p.error(
+				"Expected 'case' and instead saw '%s'." % p.nexttoken.value, p.nexttoken)
 
 stmt('debugger')
 
 @method(stmt('do'))
-def nud(self):
-	context.iteration_depth += 1
-	self.block = block()
-	context.iteration_depth -= 1
-	advance('while')
-	t = advance('(')
-	self.second = parse(5)
-	advance(')', t)
+def nud(self, p):
+	p.context.iteration_depth += 1
+	self.block = p.block()
+	p.context.iteration_depth -= 1
+	p.advance('while')
+	t = p.advance('(')
+	self.second = p.parse(5)
+	p.advance(')', t)
 	return self
 
 @method(blockstmt('for'))
-def nud(self):
-	t = advance('(')
-	if peek(nexttoken.id == 'var' and 1 or 0).id == 'in':
-		if nexttoken.id == 'var':
-			self.iterator = advance('var')
-			self.iterator.first = varstatement(True)
+def nud(self, p):
+	t = p.advance('(')
+	if p.peek(p.nexttoken.id == 'var' and 1 or 0).id == 'in':
+		if p.nexttoken.id == 'var':
+			self.iterator = p.advance('var')
+			self.iterator.first = p.varstatement(True)
 		else:
-			self.iterator = advance('(identifier)')
-		advance('in')
-		self.object = parse(20)
+			self.iterator = p.advance('(identifier)')
+		p.advance('in')
+		self.object = p.parse(20)
 	else:
-		if nexttoken.id != ';':
-			if nexttoken.id == 'var':
-				advance('var')
+		if p.nexttoken.id != ';':
+			if p.nexttoken.id == 'var':
+				p.advance('var')
 				self.initializer = symbol_table['var']()
-				self.initializer.first = varstatement()
+				self.initializer.first = p.varstatement()
 			else:
-				self.initializer = parse(0, 'for')
-				while nexttoken.id == ',':
-					comma = advance(',')
+				self.initializer = p.parse(0, 'for')
+				while p.nexttoken.id == ',':
+					comma = p.advance(',')
 					self.initializer = symbol_table[','](
-						comma, self.initializer, parse(0, 'for'))
-		advance(';')
-		if nexttoken.id != ';':
-			self.condition = parse(20)
-			if nexttoken.id == '=':
-				eq = advance('=')
+						comma, self.initializer, p.parse(0, 'for'))
+		p.advance(';')
+		if p.nexttoken.id != ';':
+			self.condition = p.parse(20)
+			if p.nexttoken.id == '=':
+				eq = p.advance('=')
 				self.condition = symbol_table['='](
-					eq, self.condition, parse(20))
-		advance(';')
-		if nexttoken.id == ';':
-			raise JavaScriptSyntaxError("Expected ')' and instead saw ';'.",
-					nexttoken)
-		if nexttoken.id != ')':
-			self.counter = parse(0, 'for')
-			while nexttoken.id == ',':
-				comma = advance(',')
+					eq, self.condition, p.parse(20))
+		p.advance(';')
+		if p.nexttoken.id == ';':
+			raise p.error("Expected ')' and instead saw ';'.",
+					p.nexttoken)
+		if p.nexttoken.id != ')':
+			self.counter = p.parse(0, 'for')
+			while p.nexttoken.id == ',':
+				comma = p.advance(',')
 				self.counter = symbol_table[','](
-					comma, self.counter, parse(0, 'for'))
-	advance(')', t)
-	context.iteration_depth += 1
-	self.block = block()
-	context.iteration_depth -= 1
+					comma, self.counter, p.parse(0, 'for'))
+	p.advance(')', t)
+	p.context.iteration_depth += 1
+	self.block = p.block()
+	p.context.iteration_depth -= 1
 	return self
 
 @method(stmt('break'))
-def nud(self):
-	if nexttoken.identifier and token.lineno == nexttoken.lineno:
-		if nexttoken.value not in context.labels:
-			raise JavaScriptSyntaxError(
-				"Unrecognized label '%s'." % nexttoken.value, nexttoken)
-		self.first = advance('(identifier)')
-	elif not context.iteration_depth and not context.switch_depth:
-		raise JavaScriptSyntaxError(
-			"break outside of a loop or a switch", token)
+def nud(self, p):
+	if p.nexttoken.identifier and p.token.lineno == p.nexttoken.lineno:
+		if p.nexttoken.value not in p.context.labels:
+			raise p.error(
+				"Unrecognized label '%s'." % p.nexttoken.value, p.nexttoken)
+		self.first = p.advance('(identifier)')
+	elif not p.context.iteration_depth and not p.context.switch_depth:
+		raise p.error(
+			"break outside of a loop or a switch", p.token)
 	return self
 
 @method(stmt('continue'))
-def nud(self):
-	if not context.iteration_depth:
-		raise JavaScriptSyntaxError(
-			"continue outside of a loop", token)
-	if nexttoken.identifier and token.lineno == nexttoken.lineno:
-		if nexttoken.value not in context.labels:
-			raise JavaScriptSyntaxError(
-				"Unrecognized label '%s'." % nexttoken.value, nexttoken)
-		self.first = advance('(identifier)')
+def nud(self, p):
+	if not p.context.iteration_depth:
+		raise p.error(
+			"continue outside of a loop", p.token)
+	if p.nexttoken.identifier and p.token.lineno == p.nexttoken.lineno:
+		if p.nexttoken.value not in p.context.labels:
+			raise p.error(
+				"Unrecognized label '%s'." % p.nexttoken.value, p.nexttoken)
+		self.first = p.advance('(identifier)')
 	return self
 
 @method(stmt('return'))
-def nud(self):
-	if context.id == '(global)':
-		raise JavaScriptSyntaxError("return declared in the global scope.", token)
-	if nexttoken.id != ';' and not nexttoken.reach:
-		self.first = parse(19)
+def nud(self, p):
+	if p.context.id == '(global)':
+		raise p.error("return declared in the global scope.", p.token)
+	if p.nexttoken.id != ';' and not p.nexttoken.reach:
+		self.first = p.parse(19)
 	return self
 
 @method(stmt('throw'))
-def nud(self):
-	self.first = parse(19)
+def nud(self, p):
+	self.first = p.parse(19)
 	return self
 
 # Superfluous reserved words
@@ -538,138 +567,394 @@ map(reserve,
 
 
 
-lookahead = []
-prevtoken = token = nexttoken = symbol_table['(begin)']()
+class Parser(object):
+	"""Holds the state of one parse, so independent sources can be parsed
+	at the same time from different threads."""
 
+	def __init__(self, source, filename="", lazy=False, first_line=0):
+		self.lexer = JavaScriptLexer(source, symbol_table, filename,
+			first_line)
+		self.lazy = lazy # skip function bodies, see parse_body
+		self.lookahead = []
+		self.prevtoken = self.token = self.nexttoken = \
+			symbol_table['(begin)']()
+		self.context = None
 
-def peek(p=0):
-	j = 0
-	while j <= p:
-		if len(lookahead) < j:
-			t = lookahead[j]
+	def error(self, msg, t=None):
+		if not t:
+			t = self.nexttoken
+		if t.id == '(end)':
+			t = self.token
+		return JavaScriptSyntaxError(msg, t, self.lexer)
+
+	def begin_program(self):
+		context = self.context = symbol_table['(global)']()
+		context.functions = {}
+		context.vars = set()
+		context.labels = set()
+		context.iteration_depth = 0
+		context.switch_depth = 0
+
+		self.advance()
+		return context
+
+	def parse_program(self):
+		context = self.begin_program()
+		try:
+			context.first = self.statements()
+		except RuntimeError, e:
+			if not recursion_limit(e):
+				raise
+			raise self.error("Nested too deeply.")
+		self.advance('(end)')
+
+		return context
+
+	def iter_program(self):
+		"""yields a (global) context for each top-level statement as soon as
+		it is parsed, holding the statement and the functions and vars it
+		declares"""
+		context = self.begin_program()
+		while not self.nexttoken.reach and self.nexttoken.id != '(end)':
+			functions = context.functions = {}
+			vars = context.vars = set()
+			try:
+				s = self.statement()
+			except RuntimeError, e:
+				if not recursion_limit(e):
+					raise
+				raise self.error("Nested too deeply.")
+			if s:
+				program = symbol_table['(global)']()
+				program.first = [s]
+				program.functions = functions
+				program.vars = vars
+				yield program
+		self.advance('(end)')
+
+	def peek(self, p=0):
+		j = 0
+		while j <= p:
+			if len(self.lookahead) < j:
+				t = self.lookahead[j]
+			else:
+				t = self.lexer.token()
+				self.lookahead.append(t)
+			j += 1
+		return t
+
+	def advance(self, id=None, t=None):
+		self.prevtoken, self.token = self.token, self.nexttoken
+		if id and self.token.id != id:
+			raise self.error('Expected %s' % id, self.token)
+		while 1:
+			self.nexttoken = len(self.lookahead) and \
+				self.lookahead.pop(0) or self.lexer.token()
+			if self.nexttoken.id != '(endline)':
+				break
+		return self.token
+
+	# This is the heart of JSLINT, the Pratt parser. In addition to parsing,
+	# it is looking for ad hoc lint patterns. We add to Pratt's model .fud,
+	# which is like nud except that it is only used on the first token of a
+	# statement. Having .fud makes it much easier to define JavaScript. I
+	# retained Pratt's nomenclature.
+
+	# .nud     Null denotation
+	# .fud     First null denotation
+	# .led     Left denotation
+	#  lbp     Left binding power
+	#  rbp     Right binding power
+
+	# They are key to the parsing method called Top Down Operator Precedence.
+
+	def parse(self, rbp, initial=False):
+		if self.nexttoken.id == '(end)':
+			raise SyntaxError("Unexpected early end of program.")
+		self.advance()
+		if initial and self.token.fud:
+			left = self.token.fud(self)
 		else:
-			t = lexer.token()
-			lookahead.append(t)
-		j += 1
-	return t
-
-def advance(id=None, t=None):
-	global token, prevtoken, nexttoken
-	prevtoken, token = token, nexttoken
-	if id and token.id != id:
-		raise JavaScriptSyntaxError('Expected %s' % id, token)
-	while 1:
-		nexttoken = len(lookahead) and lookahead.pop(0) or lexer.token()
-		if nexttoken.id != '(endline)':
-			break
-	return token
-
-
-# This is the heart of JSLINT, the Pratt parser. In addition to parsing, it
-# is looking for ad hoc lint patterns. We add to Pratt's model .fud, which is
-# like nud except that it is only used on the first token of a statement.
-# Having .fud makes it much easier to define JavaScript. I retained Pratt's
-# nomenclature.
-
-# .nud     Null denotation
-# .fud     First null denotation
-# .led     Left denotation
-#  lbp     Left binding power
-#  rbp     Right binding power
-
-# They are key to the parsing method called Top Down Operator Precedence.
-
-def parse(rbp, initial=False):
-	if nexttoken.id == '(end)':
-		raise SyntaxError("Unexpected early end of program.")
-	advance()
-	if initial and hasattr(token, 'fud'):
-		left = token.fud()
-	else:
-		left = token.nud()
-		while rbp < nexttoken.lbp:
-			advance()
-			left = token.led(left)
-	return left
-
-def statement():
-	t = nexttoken
-	if t.id == ';': # empty
-		advance(';')
-		return
-	s = symbol_table['(statement)']()
-	s.comments = t.comments
-	s.labels = set()
-	# Is this a labelled statement?
-	while t.identifier and not t.reserved and peek().id == ':':
-		if t.value in context.labels:
-			raise JavaScriptSyntaxError(
-				"Duplicate label '%s'." % t.value, t)
-		context.labels.add(t.value)
-		s.labels.add(advance('(identifier)'))
-		advance(':')
-		t = nexttoken
-	s.first = parse(0, True)
-	for label in s.labels:
-		context.labels.remove(label.value)
-	if nexttoken.id == ';':
-		advance(';')
-	elif not t.terminated and not nexttoken.reach \
-			and nexttoken.lineno == token.lineno:
-		raise JavaScriptSyntaxError(
-			"Missing ; before statement '%s'." % nexttoken.value, nexttoken)
-	return s
+			left = self.token.nud(self)
+			while rbp < self.nexttoken.lbp:
+				self.advance()
+				left = self.token.led(self, left)
+		return left
+
+	def statement(self):
+		t = self.nexttoken
+		if t.id == ';': # empty
+			self.advance(';')
+			return
+		s = symbol_table['(statement)']()
+		s.comments = t.comments
+		s.labels = set()
+		# Is this a labelled statement?
+		while t.identifier and not t.reserved and self.peek().id == ':':
+			if t.value in self.context.labels:
+				raise self.error(
+					"Duplicate label '%s'." % t.value, t)
+			self.context.labels.add(t.value)
+			s.labels.add(self.advance('(identifier)'))
+			self.advance(':')
+			t = self.nexttoken
+		s.first = self.parse(0, True)
+		for label in s.labels:
+			self.context.labels.remove(label.value)
+		if self.nexttoken.id == ';':
+			self.advance(';')
+		elif not t.terminated and not self.nexttoken.reach \
+				and self.nexttoken.lineno == self.token.lineno:
+			raise self.error("Missing ; before statement '%s'." %
+				self.nexttoken.value, self.nexttoken)
+		return s
+
+	def statements(self):
+		statements = []
+		while not self.nexttoken.reach and self.nexttoken.id != '(end)':
+			s = self.statement()
+			if s: statements.append(s)
+		return statements
+
+	def block(self, f=False):
+		if self.nexttoken.id == '{':
+			t = self.advance('{')
+			s = self.statements()
+			self.advance('}', t)
+		else:
+			s = self.statement()
+			s = [s] if s else []
+		return s
+
+	def optionalidentifier(self):
+		if self.nexttoken.identifier:
+			self.advance()
+			return self.token
+
+	def identifier(self):
+		i = self.optionalidentifier()
+		if not i:
+			raise self.error(
+				"Expected an identifier and instead saw '%s'." %
+				self.nexttoken.value, self.nexttoken)
+		return i
+
+	def varstatement(self, prefix=False):
+		vars = []
+		while 1:
+			var = self.identifier()
+			self.context.vars.add(var.value)
+			if prefix:
+				return [var]
+			if self.nexttoken.id == '=':
+				t = self.advance('=')
+				var = symbol_table['='](t, var, self.parse(19))
+			vars.append(var)
+			if self.nexttoken.id != ',':
+				return vars
+			self.advance(',')
+
+	def functionparams(self):
+		t = self.advance('(')
+		p = []
+		while self.nexttoken.id != ')':
+			p.append(self.identifier())
+			if self.nexttoken.id == ',':
+				self.advance(',')
+		self.advance(')', t)
+		return p
+
+	def function(self, s, is_decl=True):
+		s.is_decl = is_decl
+		s.name = self.optionalidentifier()
+		if is_decl and s.name:
+			self.context.functions[s.name] = s
+		s.params = self.functionparams()
+		s.functions = {}
+		s.vars = set()
+		s.labels = set()
+		s.iteration_depth = 0
+		s.switch_depth = 0
+		c, self.context = self.context, s
+		if self.lazy and self.nexttoken.id == '{' and not self.lookahead:
+			s.lazy = self.skip_block()
+		else:
+			s.block = self.block()
+		self.context = c
+
+	def skip_block(self):
+		"""moves past the block at nexttoken without parsing it, returning
+		what parse_body needs to parse it later"""
+		lexer = self.lexer
+		lineno = self.nexttoken.lineno
+		start = lexer.pos - 1 # the { is the last token lexed
+		end = lexer.skip_block()
+		self.advance('{')
+		self.advance('}')
+		return lexer.source[start:end + 1], lexer.filename, lineno
+
+
+def binary_chain(s, ids):
+	"""returns the leftmost operand of the chain of binary operators in `ids`
+	of the precedence of `s` that `s` ends, and the operators of the chain
+	from the left.  a + b + c nests to the left as (a + b) + c, so walking
+	it this way rather than down .first doesn't recurse once per term"""
+	chain = []
+	lbp = s.lbp
+	while s.id in ids and s.lbp == lbp and s.arity is None:
+		chain.append(s)
+		s = s.first
+	chain.reverse()
+	return s, chain
+
+
+child_attributes = ('first', 'second', 'third', 'params', 'block',
+	'elseblock', 'condition', 'initializer', 'counter', 'iterator', 'object',
+	'cases', 'e', 'catchblock', 'finallyblock', 'name')
+
+def children(s):
+	"""yields the symbols directly below `s`, for an (object) only the
+	property values are yielded"""
+	for attr in child_attributes:
+		child = getattr(s, attr, None)
+		if child is None:
+			continue
+		if isinstance(child, list):
+			for c in child:
+				if isinstance(c, tuple): # (object) key, value
+					c = c[1]
+				yield c
+		else:
+			yield child
 
-def statements():
-	statements = []
-	while not nexttoken.reach and nexttoken.id != '(end)':
-		s = statement()
-		if s: statements.append(s)
-	return statements
-
-def block(f=False):
-	if nexttoken.id == '{':
-		t = advance('{')
-		s = statements()
-		advance('}', t)
-	else:
-		s = statement()
-		s = [s] if s else []
-	return s
 
-def optionalidentifier():
-	if nexttoken.identifier:
-		advance()
-		return token
-
-def identifier():
-	i = optionalidentifier()
-	if not i:
-		raise JavaScriptSyntaxError(
-			"Expected an identifier and instead saw '%s'." %
-			nexttoken.value, nexttoken)
-	return i
-
-
-def parse_str(js, filename=""):
-	global lexer, context
-	lexer = JavaScriptLexer(js, symbol_table, filename)
-	
-	context = symbol_table['(global)']()
-	context.functions = {}
-	context.vars = set()
-	context.labels = set()
-	context.iteration_depth = 0
-	context.switch_depth = 0
-
-	advance()
-	context.first = statements()
-	advance('(end)')
+# A directory to keep parsed programs in, keyed by a hash of the source
+# and ast_version, which has to change whenever the trees parse_str
+# builds for the same source do.
+cache_directory = None
+ast_version = 1
 
-	return context
+def cache_path(js, lazy):
+	if isinstance(js, unicode):
+		js = js.encode('utf-8')
+	key = hashlib.sha1('%s %s %s\n' % (ast_version, lazy,
+		' '.join(Symbol.fields)))
+	key.update(js)
+	return os.path.join(cache_directory, key.hexdigest() + '.ast')
 
-def parse_file(filename):
-	return parse_str(open(filename, 'r').read(), filename)
+def load_cached(path):
+	try:
+		f = open(path, 'rb')
+	except IOError:
+		return None
+	try:
+		try:
+			return cPickle.loads(f.read())
+		except Exception:
+			return None # a damaged or outdated entry is parsed again
+	finally:
+		f.close()
+
+def store_cached(path, context):
+	try:
+		fd, temp = tempfile.mkstemp(dir=cache_directory)
+	except OSError:
+		return
+	try:
+		f = os.fdopen(fd, 'wb')
+		try:
+			f.write(cPickle.dumps(context, cPickle.HIGHEST_PROTOCOL))
+		finally:
+			f.close()
+		# other processes only ever see complete entries
+		os.rename(temp, path)
+	except (EnvironmentError, cPickle.PicklingError, RuntimeError):
+		# RuntimeError is pickle running out of stack on very deep trees
+		try:
+			os.unlink(temp)
+		except OSError:
+			pass
+
+def parse_str(js, filename="", lazy=False):
+	"""parses the program `js`, leaving the bodies of functions to be parsed
+	by parse_body when they are first needed if `lazy`"""
+	if not cache_directory:
+		return Parser(js, filename, lazy).parse_program()
+	path = cache_path(js, lazy)
+	context = load_cached(path)
+	if context is None:
+		context = Parser(js, filename, lazy).parse_program()
+		store_cached(path, context)
+	return context
 
+def parse_iter(js, filename="", lazy=False):
+	"""parses the program `js` one top-level statement at a time, yielding
+	each as a program of its own to run before the next is parsed.  Only
+	what has been parsed so far is hoisted, so a function declared further
+	down can't be called yet.  The cache isn't used."""
+	return Parser(js, filename, lazy).iter_program()
 
+def parse_file(filename, lazy=False):
+	return parse_str(open(filename, 'r').read(), filename, lazy)
 
+def parse_body(s):
+	"parses the body of function `s` if a lazy parse skipped it"
+	if s.lazy is None:
+		return
+	source, filename, lineno = s.lazy
+	p = Parser(source, filename, True, lineno)
+	p.context = s
+	p.advance()
+	try:
+		s.block = p.block()
+	except RuntimeError, e:
+		if not recursion_limit(e):
+			raise
+		raise p.error("Nested too deeply.")
+	p.advance('(end)')
+	s.lazy = None
+
+def check_file(args):
+	filename, ast = args
+	try:
+		s = parse_file(filename)
+	except (SyntaxError, EnvironmentError), e:
+		return filename, None, e
+	return filename, ast and s or None, None
+
+def parse_files(filenames, workers=None, ast=False):
+	"""Parse files in a pool of worker processes, one per CPU by default.
+
+	Returns a (filename, ast, error) tuple for each file in order, with the
+	SyntaxError or EnvironmentError raised for it or None.  ASTs are only
+	pickled back from the workers when ast is true.
+	"""
+	args = [(filename, ast) for filename in filenames]
+	if workers == 1:
+		return map(check_file, args)
+	pool = Pool(workers)
+	try:
+		return pool.map(check_file, args, 1)
+	finally:
+		pool.close()
+		pool.join()
+
+def main(argv=None):
+	parser = OptionParser(usage="%prog [options] file...",
+		description="Check the syntax of JavaScript files.")
+	parser.add_option('-j', '--jobs', type='int', default=None,
+		help="number of worker processes (default: one per CPU)")
+	options, filenames = parser.parse_args(argv)
+	if not filenames:
+		parser.error("no files given")
+	failed = 0
+	for filename, ast, error in parse_files(filenames, options.jobs):
+		if isinstance(error, EnvironmentError):
+			failed += 1
+			print >>sys.stderr, '%s: %s' % (filename,
+				error.strerror or error)
+		elif error:
+			failed += 1
+			print >>sys.stderr, '%s:%s: %s' % (filename,
+				error.lineno is not None and error.lineno + 1 or '?', error.msg)
+	return failed and 1 or 0
@@ -0,0 +1,88 @@
+"""Runs many programs on one thread, a slice at a time.
+
+Each program gets a realm of its own, a GlobalObject, and is run by the
+bytecode engine for at most its quota of steps, loop iterations and
+function calls, before the scheduler moves on to the next in turn.  A long
+or endless script so only delays the others by a slice per round.
+
+	scheduler = Scheduler(quota=1000)
+	tasks = [scheduler.spawn(source) for source in sources]
+	scheduler.run()
+	values = [task.value for task in tasks]
+"""
+
+from collections import deque
+
+from parser import parse_str
+from interpreter import GlobalObject, Budget, Rope
+from bytecode import start, suspended
+
+
+class Task(object):
+	"""a program being run by a Scheduler, which is `done` once it has
+	returned its `value` or raised `error`"""
+
+	def __init__(self, program, global_object, quota, budget=None):
+		self.global_object = global_object
+		self.quota = quota
+		self.budget = budget # only in place while a slice runs
+		self.steps = start(program, global_object, quota)
+		self.done = False
+		self.value = self.error = None
+
+	def step(self):
+		"runs a slice of the program, returning whether it has finished"
+		global_object = self.global_object
+		budget = global_object.budget
+		if self.budget is not None:
+			global_object.budget = self.budget
+		try:
+			v = self.steps.next()
+		except Exception, e: # JavaScriptException, BudgetExceeded or a bug
+			self.error = e
+		else:
+			if v is suspended:
+				return False
+			self.value = v.flatten() if v.__class__ is Rope else v
+		finally:
+			global_object.budget = budget
+		self.done = True
+		self.steps = None
+		return True
+
+
+class Scheduler(object):
+	"""interleaves the programs it is given round-robin, `quota` steps at a
+	time unless they are spawned with a quota of their own"""
+
+	def __init__(self, quota=1000):
+		self.quota = quota
+		self.tasks = deque()
+
+	def spawn(self, program, global_object=None, quota=None, steps=None,
+			deadline=None):
+		"""adds program `program`, or the source of one, to be run in
+		`global_object` or a new realm, returning its Task.  A task given
+		`steps` or a `deadline` fails with BudgetExceeded once it has
+		used them up, see Budget."""
+		if isinstance(program, basestring):
+			program = parse_str(program)
+		budget = None
+		if steps is not None or deadline is not None:
+			budget = Budget(steps, deadline)
+		task = Task(program, global_object or GlobalObject(),
+			quota or self.quota, budget)
+		self.tasks.append(task)
+		return task
+
+	def step(self):
+		"runs a slice of the next task, returning it"
+		task = self.tasks.popleft()
+		if not task.step():
+			self.tasks.append(task)
+		return task
+
+	def run(self):
+		"runs every task to completion"
+		while self.tasks:
+			self.step()
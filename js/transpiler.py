@@ -0,0 +1,704 @@
+"""Translates JavaScript function bodies into Python source.
+
+The generated source is loaded with the builtin compile() so that the
+function runs as ordinary Python bytecode: JavaScript locals become Python
+locals and loops become Python loops, while everything with JavaScript
+semantics (conversions, operators, property access, calls) goes through
+the interpreter's runtime helpers.
+
+Only functions that can be lowered faithfully are translated; anything
+using a construct listed in `Unsupported` is left to the interpreter.
+"""
+
+from parser import children, parse_body, binary_chain
+from interpreter import JavaScriptException, JavaScriptFunction, \
+	JavaScriptObject, JavaScriptArray, Activation, SlotActivation, null, \
+	operators, typeof, toBoolean, toNumber, toString, toObject, toInt32, \
+	lessThan, equal, strictlyEqual, engines, run_tree, recursion_limit, \
+	call_stack_exceeded
+
+
+class Unsupported(Exception):
+	"""raised for a construct that can't be lowered to Python, the
+	function is then left to the interpreter"""
+
+# how deep CPython lets loops and try statements nest, and lines indent
+max_blocks = 18
+max_indent = 90
+
+
+## Runtime
+
+def lookup(scope, name, c):
+	while scope:
+		if name in scope.object:
+			return scope.object[name]
+		scope = scope.parent
+	raise JavaScriptException(c.global_object.reference_error.construct([], c))
+
+def assign(scope, name, value, c):
+	while scope:
+		if name in scope.object:
+			scope.object[name] = value
+			return value
+		scope = scope.parent
+	c.global_object[name] = value
+	return value
+
+def typeof_value(value):
+	type = typeof(value)
+	if type == 'object' and hasattr(value, 'call'):
+		return 'function'
+	return type
+
+def typeof_name(scope, name):
+	while scope:
+		if name in scope.object:
+			return typeof_value(scope.object[name])
+		scope = scope.parent
+	return 'undefined'
+
+def get(o, key, c):
+	if not isinstance(o, JavaScriptObject):
+		o = toObject(o, c)
+	return o[key]
+
+def put(o, key, value, c):
+	toObject(o, c)[key] = value
+	return value
+
+def update(o, key, operator, value, c):
+	o = toObject(o, c)
+	value = operator(o[key], value)
+	o[key] = value
+	return value
+
+def increment(o, key, delta, prefix, c):
+	o = toObject(o, c)
+	v = toNumber(o[key])
+	o[key] = v + delta
+	return v + delta if prefix else v
+
+def delete(o, key, c):
+	return toObject(o, c).__delitem__(key)
+
+def call(f, this, args, c):
+	if typeof(f) != 'object' or not hasattr(f, 'call'):
+		raise JavaScriptException(c.global_object.type_error.construct([], c))
+	return f.call(this, args, c)
+
+def call_method(o, key, args, c):
+	o = toObject(o, c)
+	return call(o[key], o, args, c)
+
+def call_name(scope, name, args, c):
+	while scope:
+		o = scope.object
+		if name in o:
+			if isinstance(o, (Activation, SlotActivation)):
+				o = None
+			return call(scope.object[name], o, args, c)
+		scope = scope.parent
+	raise JavaScriptException(c.global_object.reference_error.construct([], c))
+
+def construct(f, args, c):
+	if typeof(f) != 'object' or not hasattr(f, 'construct'):
+		raise JavaScriptException(c.global_object.type_error.construct([], c))
+	return f.construct(args, c)
+
+def make_array(elements, c):
+	return JavaScriptArray(c.global_object.array['prototype'], elements)
+
+def make_object(properties, c):
+	o = c.global_object.object.construct([], c)
+	for key, value in properties:
+		o[key] = value
+	return o
+
+def less_than(l, r):
+	return lessThan(l, r) or False
+
+def greater_than(l, r):
+	return lessThan(r, l) or False
+
+def less_than_or_equal(l, r):
+	v = lessThan(r, l)
+	return False if v == None else not v
+
+def greater_than_or_equal(l, r):
+	v = lessThan(l, r)
+	return False if v == None else not v
+
+def instanceof(v, o, c):
+	if not isinstance(o, JavaScriptObject) or not hasattr(o, 'has_instance'):
+		raise JavaScriptException(c.global_object.type_error.construct([], c))
+	return o.has_instance(v, c)
+
+def in_(v, o, c):
+	if not isinstance(o, JavaScriptObject):
+		raise JavaScriptException(c.global_object.type_error.construct([], c))
+	return toString(v) in o
+
+def and_(l, r):
+	"`r` is a thunk, it's only evaluated when `l` is truthy"
+	return r() if toBoolean(l) else l
+
+def or_(l, r):
+	return l if toBoolean(l) else r()
+
+runtime = dict(
+	JavaScriptException=JavaScriptException, null=null,
+	toBoolean=toBoolean, toNumber=toNumber, toString=toString,
+	toInt32=toInt32, equal=equal, strictlyEqual=strictlyEqual,
+	lookup=lookup, assign=assign, typeof_value=typeof_value,
+	typeof_name=typeof_name, get=get, put=put, update=update,
+	increment=increment, delete=delete, call=call, call_method=call_method,
+	call_name=call_name, construct=construct, make_array=make_array,
+	make_object=make_object,
+	less_than=less_than, greater_than=greater_than,
+	less_than_or_equal=less_than_or_equal,
+	greater_than_or_equal=greater_than_or_equal,
+	instanceof=instanceof, in_=in_, and_=and_, or_=or_,
+)
+operator_names = {
+	'/': 'divide', '*': 'multiply', '%': 'modulo', '+': 'add', '-': 'subtract',
+	'<<': 'left_shift', '>>': 'signed_right_shift',
+	'>>>': 'unsigned_right_shift',
+	'&': 'bitwise_and', '^': 'bitwise_xor', '|': 'bitwise_or',
+}
+for id, name in operator_names.items():
+	runtime[name] = operators[id]
+
+
+class PythonFunction(JavaScriptFunction):
+	"""a function whose body was translated to Python by `transpile`, or is
+	interpreted when it couldn't be"""
+	def call(self, this, args, context):
+		if self.symbol.python is None:
+			return JavaScriptFunction.call(self, this, args, context)
+		try:
+			return self.symbol.python(self, this or context.global_object,
+				args, context)
+		except RuntimeError, e:
+			if not recursion_limit(e):
+				raise
+			raise call_stack_exceeded(context)
+
+
+## Expressions
+
+expressions = {}
+statements = {}
+
+def expression(*ids):
+	"decorator registering the translation of the expressions `ids`"
+	def bind(fn):
+		for id in ids:
+			expressions[id] = fn
+		return fn
+	return bind
+
+def statement(*ids):
+	"decorator registering the translation of the statements `ids`"
+	def bind(fn):
+		for id in ids:
+			statements[id] = fn
+		return fn
+	return bind
+
+class FunctionTranspiler(object):
+	"""holds the state for translating the body of function symbol `s`"""
+
+	def __init__(self, s):
+		self.s = s
+		self.locals = {}
+		self.constants = {}
+		self.lines = []
+		self.indent = 1
+		self.temps = 0
+		self.blocks = [] # the 'loop', 'try' and 'finally' blocks emitting in
+		for name in [p.value for p in s.params] + sorted(s.vars):
+			if name not in self.locals:
+				self.locals[name] = 'v%d' % len(self.locals)
+
+	def constant(self, value):
+		name = 'k%d' % len(self.constants)
+		self.constants[name] = value
+		return name
+
+	def temp(self):
+		self.temps += 1
+		return 't%d' % self.temps
+
+	def emit(self, line):
+		if self.indent > max_indent:
+			raise Unsupported('statements nested too deeply')
+		self.lines.append('\t' * self.indent + line)
+
+	def enter(self, block):
+		self.blocks.append(block)
+		if len(self.blocks) > max_blocks:
+			raise Unsupported('blocks nested too deeply')
+
+	def leave(self):
+		self.blocks.pop()
+
+	def local(self, s):
+		"the Python name of identifier `s`, if it is a local"
+		if s.value in ('arguments', 'eval'):
+			raise Unsupported(s.value)
+		return self.locals.get(s.value)
+
+	def expression(self, s):
+		try:
+			fn = expressions[s.id]
+		except KeyError:
+			raise Unsupported(s.id)
+		return fn(self, s)
+
+	def condition(self, s):
+		"an expression evaluating to a Python bool"
+		if s.id in boolean_ids:
+			return self.expression(s)
+		return 'toBoolean(%s)' % self.expression(s)
+
+	def statement(self, s):
+		try:
+			fn = statements[s.id]
+		except KeyError:
+			self.emit(self.expression(s))
+		else:
+			fn(self, s)
+
+	def block(self, s):
+		if not s:
+			self.emit('pass')
+		for statement in s:
+			self.statement(statement)
+
+	def spend(self):
+		"takes a step of the Budget, on function entry and loop back edges"
+		self.emit('if budget is not None:')
+		self.emit('\tbudget.spend()')
+
+	def nested_block(self, s):
+		self.indent += 1
+		self.block(s)
+		self.indent -= 1
+
+	def source(self):
+		s = self.s
+		self.emit('scope = function.scope')
+		self.emit('budget = c.global_object.budget')
+		self.spend()
+		for i, param in enumerate(s.params):
+			self.emit('%s = args[%d] if len(args) > %d else None' %
+				(self.locals[param.value], i, i))
+		params = set(p.value for p in s.params)
+		for name in sorted(s.vars):
+			if name not in params:
+				self.emit('%s = None' % self.locals[name])
+		self.block(s.block)
+		self.emit('return None')
+		return 'def f(function, this, args, c):\n' + '\n'.join(self.lines)
+
+boolean_ids = set(['<', '>', '<=', '>=', '==', '!=', '===', '!==', '!',
+	'instanceof', 'in', 'true', 'false'])
+
+@expression('this')
+def this_expression(t, s):
+	return 'this'
+
+@expression('(identifier)')
+def identifier_expression(t, s):
+	local = t.local(s)
+	if local:
+		return local
+	return 'lookup(scope, %s, c)' % t.constant(s.value)
+
+@expression('(number)')
+def number_expression(t, s):
+	return t.constant(float(s.value))
+
+@expression('(string)')
+def string_expression(t, s):
+	return t.constant(s.value)
+
+@expression('null')
+def null_expression(t, s):
+	return 'null'
+
+@expression('true', 'false')
+def boolean_expression(t, s):
+	return s.id.title()
+
+@expression('(array)')
+def array_expression(t, s):
+	return 'make_array([%s], c)' % ', '.join(t.expression(e) for e in s.first)
+
+@expression('(object)')
+def object_expression(t, s):
+	properties = []
+	for k, v in s.first:
+		key = toString(float(k.value)) if k.id == '(number)' else k.value
+		properties.append('(%s, %s)' % (t.constant(key), t.expression(v)))
+	return 'make_object([%s], c)' % ', '.join(properties)
+
+def property_key(t, s):
+	"the object and key expressions of a '.' or '[' symbol"
+	if s.id == '.':
+		return t.expression(s.first), t.constant(s.second.value)
+	return t.expression(s.first), 'toString(%s)' % t.expression(s.second)
+
+@expression('.', '[')
+def property_expression(t, s):
+	return 'get(%s, %s, c)' % property_key(t, s)
+
+@expression('new')
+def new_expression(t, s):
+	return 'construct(%s, [%s], c)' % (t.expression(s.first),
+		', '.join(t.expression(p) for p in s.params or []))
+
+@expression('(')
+def call_expression(t, s):
+	args = '[%s]' % ', '.join(t.expression(p) for p in s.params)
+	f = s.first
+	if f.id in ('.', '['):
+		o, key = property_key(t, f)
+		return 'call_method(%s, %s, %s, c)' % (o, key, args)
+	if f.id == '(identifier)' and not t.local(f):
+		return 'call_name(scope, %s, %s, c)' % (t.constant(f.value), args)
+	return 'call(%s, None, %s, c)' % (t.expression(f), args)
+
+@expression('++', '--')
+def update_expression(t, s):
+	if s.first.id not in ('.', '['):
+		raise Unsupported('%s in an expression' % s.id)
+	o, key = property_key(t, s.first)
+	return 'increment(%s, %s, %s, %s, c)' % (o, key,
+		'1.0' if s.id == '++' else '-1.0', s.arity is not None)
+
+@expression('typeof')
+def typeof_expression(t, s):
+	if s.first.id == '(identifier)' and not t.local(s.first):
+		return 'typeof_name(scope, %s)' % t.constant(s.first.value)
+	return 'typeof_value(%s)' % t.expression(s.first)
+
+@expression('void')
+def void_expression(t, s):
+	return '(%s, None)[1]' % t.expression(s.first)
+
+@expression('delete')
+def delete_expression(t, s):
+	if s.first.id not in ('.', '['):
+		raise Unsupported('delete')
+	return 'delete(%s, %s, c)' % property_key(t, s.first)
+
+@expression('~')
+def bitwise_not_expression(t, s):
+	return 'float(~int(toInt32(%s)))' % t.expression(s.first)
+
+@expression('!')
+def not_expression(t, s):
+	return '(not %s)' % t.condition(s.first)
+
+# Python's parser runs out of stack on calls nested much deeper, the
+# interpreter folds longer chains in a loop
+max_chain = 50
+
+@expression('/', '*', '%', '+', '-', '&', '^', '|', '<<', '>>', '>>>')
+def operator_expression(t, s):
+	if s.arity is not None:
+		return '%stoNumber(%s)' % ('-' if s.id == '-' else '',
+			t.expression(s.first))
+	first, chain = binary_chain(s, operator_names)
+	if len(chain) > max_chain:
+		raise Unsupported('chain of %d operators' % len(chain))
+	v = t.expression(first)
+	for operator in chain:
+		v = '%s(%s, %s)' % (operator_names[operator.id], v,
+			t.expression(operator.second))
+	return v
+
+relational_names = {'<': 'less_than', '>': 'greater_than',
+	'<=': 'less_than_or_equal', '>=': 'greater_than_or_equal'}
+
+@expression('<', '>', '<=', '>=')
+def relational_expression(t, s):
+	return '%s(%s, %s)' % (relational_names[s.id],
+		t.expression(s.first), t.expression(s.second))
+
+@expression('instanceof', 'in')
+def instanceof_expression(t, s):
+	return '%s(%s, %s, c)' % ('in_' if s.id == 'in' else s.id,
+		t.expression(s.first), t.expression(s.second))
+
+@expression('==', '!=', '===', '!==')
+def equality_expression(t, s):
+	test = 'strictlyEqual' if len(s.id) == 3 else 'equal'
+	return '%s%s(%s, %s)' % ('not ' if s.id[0] == '!' else '', test,
+		t.expression(s.first), t.expression(s.second))
+
+@expression('&&', '||')
+def logical_expression(t, s):
+	return '%s(%s, lambda: %s)' % ('and_' if s.id == '&&' else 'or_',
+		t.expression(s.first), t.expression(s.second))
+
+@expression('?')
+def conditional_expression(t, s):
+	return '(%s if %s else %s)' % (t.expression(s.second),
+		t.condition(s.first), t.expression(s.third))
+
+@expression('=')
+def assignment_expression(t, s):
+	l = s.first
+	if l.id in ('.', '['):
+		o, key = property_key(t, l)
+		return 'put(%s, %s, %s, c)' % (o, key, t.expression(s.second))
+	if t.local(l):
+		raise Unsupported('assignment to a local in an expression')
+	return 'assign(scope, %s, %s, c)' % (t.constant(l.value),
+		t.expression(s.second))
+
+@expression('*=', '/=', '%=', '+=', '-=', '<<=', '>>=', '>>>=', '&=', '^=', '|=')
+def compound_assignment_expression(t, s):
+	l, operator = s.first, operator_names[s.id[:-1]]
+	if l.id in ('.', '['):
+		o, key = property_key(t, l)
+		return 'update(%s, %s, %s, %s, c)' % (o, key, operator,
+			t.expression(s.second))
+	if t.local(l):
+		raise Unsupported('assignment to a local in an expression')
+	name = t.constant(l.value)
+	return 'assign(scope, %s, %s(lookup(scope, %s, c), %s), c)' % (
+		name, operator, name, t.expression(s.second))
+
+@expression(',')
+def comma_expression(t, s):
+	return '(%s, %s)[1]' % (t.expression(s.first), t.expression(s.second))
+
+
+## Statements
+
+compound_ids = set(['*=', '/=', '%=', '+=', '-=',
+	'<<=', '>>=', '>>>=', '&=', '^=', '|='])
+
+def local_assignment(t, s):
+	"""emits `s` as a Python assignment statement if it assigns to a local,
+	returns False if it doesn't"""
+	if s.id not in ('=', '++', '--') and s.id not in compound_ids \
+			or s.first.id != '(identifier)':
+		return False
+	local = t.local(s.first)
+	if not local:
+		return False
+	if s.id in ('++', '--'):
+		t.emit('%s = toNumber(%s) %s 1.0' % (local, local, s.id[0]))
+	elif s.id in compound_ids:
+		t.emit('%s = %s(%s, %s)' % (local, operator_names[s.id[:-1]],
+			local, t.expression(s.second)))
+	elif s.second.id == '=' and local_assignment(t, s.second):
+		t.emit('%s = %s' % (local, t.expression(s.second.first)))
+	else:
+		t.emit('%s = %s' % (local, t.expression(s.second)))
+	return True
+
+@statement('(statement)')
+def statement_statement(t, s):
+	if s.labels:
+		raise Unsupported('labelled statement')
+	if s.first.id in statements or not local_assignment(t, s.first):
+		t.statement(s.first)
+
+@statement('{')
+def block_statement(t, s):
+	t.block(s.block)
+
+@statement('var')
+def var_statement(t, s):
+	for var in s.first:
+		if var.id != '(identifier)':
+			local_assignment(t, var)
+
+@statement('if')
+def if_statement(t, s):
+	t.emit('if %s:' % t.condition(s.first))
+	t.nested_block(s.block)
+	if s.elseblock is not None:
+		t.emit('else:')
+		t.nested_block(s.elseblock)
+
+def loop_continues(s):
+	"whether a continue in `s` targets the loop `s` is the body of"
+	for child in s if isinstance(s, list) else children(s):
+		if child.id == 'continue':
+			return True
+		if child.id not in ('do', 'while', 'for') and loop_continues(child):
+			return True
+	return False
+
+@statement('while')
+def while_statement(t, s):
+	t.emit('while %s:' % t.condition(s.first))
+	t.indent += 1
+	t.enter('loop')
+	t.spend()
+	t.block(s.block)
+	t.leave()
+	t.indent -= 1
+
+@statement('do')
+def do_statement(t, s):
+	first = t.temp()
+	t.emit('%s = True' % first)
+	t.emit('while %s or %s:' % (first, t.condition(s.second)))
+	t.indent += 1
+	t.emit('%s = False' % first)
+	t.enter('loop')
+	t.spend()
+	t.block(s.block)
+	t.leave()
+	t.indent -= 1
+
+def expression_statement(t, s):
+	if not local_assignment(t, s):
+		t.emit(t.expression(s))
+
+@statement('for')
+def for_statement(t, s):
+	if s.iterator is not None:
+		raise Unsupported('for in')
+	if s.initializer is not None:
+		if s.initializer.id == 'var':
+			var_statement(t, s.initializer)
+		else:
+			expression_statement(t, s.initializer)
+	condition = t.condition(s.condition) \
+		if s.condition is not None else 'True'
+	counter = s.counter
+	if not counter or not loop_continues(s.block):
+		t.emit('while %s:' % condition)
+		t.indent += 1
+		t.enter('loop')
+		t.spend()
+		t.block(s.block)
+		t.leave()
+		if counter:
+			expression_statement(t, counter)
+		t.indent -= 1
+		return
+	# continue has to run the counter before testing the condition again
+	first = t.temp()
+	t.emit('%s = True' % first)
+	t.emit('while True:')
+	t.indent += 1
+	t.emit('if %s:' % first)
+	t.emit('\t%s = False' % first)
+	t.emit('else:')
+	t.indent += 1
+	expression_statement(t, counter)
+	t.indent -= 1
+	t.emit('if not %s:' % condition)
+	t.emit('\tbreak')
+	t.enter('loop')
+	t.spend()
+	t.block(s.block)
+	t.leave()
+	t.indent -= 1
+
+@statement('continue', 'break')
+def jump_statement(t, s):
+	if s.first:
+		raise Unsupported('labelled %s' % s.id)
+	for block in reversed(t.blocks):
+		if block == 'loop':
+			break
+		if block == 'finally': # CPython refuses to jump out of one
+			raise Unsupported('%s in finally' % s.id)
+	t.emit(s.id)
+
+@statement('return')
+def return_statement(t, s):
+	t.emit('return %s' % (t.expression(s.first) if s.first else 'None'))
+
+@statement('throw')
+def throw_statement(t, s):
+	t.emit('raise JavaScriptException(%s)' % t.expression(s.first))
+
+@statement('try')
+def try_statement(t, s):
+	# try, except and finally take a block each
+	handlers = (s.catchblock is not None) + (s.finallyblock is not None)
+	for i in range(handlers):
+		t.enter('try')
+	t.emit('try:')
+	t.nested_block(s.block)
+	if s.catchblock is not None:
+		if s.e.value in t.locals:
+			raise Unsupported('catch shadowing a local')
+		e = t.temp()
+		t.locals[s.e.value] = e
+		t.emit('except JavaScriptException, %s:' % e)
+		t.indent += 1
+		t.emit('%s = %s.value' % (e, e))
+		t.block(s.catchblock)
+		t.indent -= 1
+		del t.locals[s.e.value]
+	for i in range(handlers):
+		t.leave()
+	if s.finallyblock is not None:
+		t.emit('finally:')
+		t.enter('finally')
+		t.nested_block(s.finallyblock)
+		t.leave()
+
+
+def transpile_function(s):
+	"""compiles the body of function symbol `s` into a Python function,
+	raising Unsupported if it can't be lowered"""
+	parse_body(s)
+	if s.functions:
+		raise Unsupported('nested function')
+	t = FunctionTranspiler(s)
+	source = t.source()
+	namespace = dict(runtime)
+	namespace.update(t.constants)
+	name = s.name.value if s.name else 'anonymous'
+	try:
+		code = compile(source, '<javascript function %s>' % name, 'exec')
+	except SyntaxError, e: # a limit of CPython's the checks above missed
+		raise Unsupported(e.msg)
+	exec code in namespace
+	s.python_source = source
+	s.python = namespace['f']
+	return s.python
+
+def transpile(s):
+	"""translates every function below symbol `s` that can be lowered to
+	Python, returns the number of functions translated"""
+	n = 0
+	stack = list(s if isinstance(s, list) else children(s))
+	while stack:
+		child = stack.pop()
+		if child.id == 'function':
+			if not child.python:
+				try:
+					transpile_function(child)
+					n += 1
+				except Unsupported:
+					pass
+		stack.extend(children(child))
+	return n
+
+def run(symbol, global_object):
+	transpile(symbol)
+	# the tree engine running the program makes PythonFunctions, which run
+	# the translations transpile kept on the function symbols
+	function_class = global_object.function_class
+	global_object.function_class = PythonFunction
+	try:
+		return run_tree(symbol, global_object)
+	finally:
+		global_object.function_class = function_class
+
+engines['python'] = run
@@ -1,7 +1,9 @@
 
 import unittest
 
-import function, if_, delete, string, globals, for_, switch
+import function, if_, delete, string, globals, for_, switch, transpiler, \
+	bytecode, object, array_, lexer, parser_, operators, \
+	optimizer, scheduler, budget
 
 def suite():
 	suite = unittest.TestSuite([
@@ -12,6 +14,16 @@ def suite():
 		globals.suite(),
 		for_.suite(),
 		switch.suite(),
+		transpiler.suite(),
+		bytecode.suite(),
+		object.suite(),
+		array_.suite(),
+		lexer.suite(),
+		parser_.suite(),
+		operators.suite(),
+		optimizer.suite(),
+		scheduler.suite(),
+		budget.suite(),
 		])
 	return suite
 
@@ -0,0 +1,47 @@
+import unittest
+from array import array
+from js.interpreter import run, GlobalObject
+
+class Array(unittest.TestCase):
+	def test_dense(self):
+		self.assertEqual(run(
+			"""var a = [1, 2, 3], r = [];
+			a.push(4, 5);
+			r.push(a.length, a.pop(), a.join('-'), a.slice(1).join(),
+				a.slice(-2, 10).join(), a.shift(), a.unshift(9, 8),
+				a.reverse().join(), a.splice(1, 2, 'x').join(), a.join());
+			a[a.length] = 7; a[0] = 6;
+			r.push(a.join(), a[3], a['1'], a[9]);
+			r.join('|')"""), '5|5|1-2-3-4|2,3,4|3,4|1|5|4,3,2,8,9|3,2|4,x,8,9|'
+				'6,x,8,9,7|9|x|')
+
+	def test_sparse(self):
+		global_object = GlobalObject()
+		self.assertEqual(run(
+			"""var a = [1, 2, 3], b = [], r = [];
+			delete a[1]; b[3] = 1;
+			r.push(a.length, a.join(), 1 in a, b.length, b.join(), 0 in b);
+			b.length = 2; a.length = 1;
+			r.push(b.length, a.join(), 2 in a);
+			r.join('|')""", global_object), '3|1,,3|false|4|,,,1|false|2|1|false')
+		self.assertEqual(global_object['a'].elements, None)
+		self.assertNotEqual(global_object['r'].elements, None)
+
+	def test_numbers(self):
+		global_object = GlobalObject()
+		run("var a = [1, 2]; a.push(3); a.unshift(0); a[4] = 4", global_object)
+		a = global_object['a']
+		self.assertEqual(a.elements, array('d', [0, 1, 2, 3, 4]))
+		self.assertEqual(array('d', str(a.buffer())), a.elements)
+		self.assertEqual(run("a.slice(1, 3)", global_object).buffer(),
+			buffer(array('d', [1, 2])))
+		self.assertEqual(run("a[1] = 'x'; a.join()", global_object),
+			'0,x,2,3,4')
+		self.assertEqual(a.elements, [0, 'x', 2, 3, 4])
+		self.assertEqual(a.buffer(), None)
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Array),
+		])
+	return suite
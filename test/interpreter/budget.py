@@ -0,0 +1,40 @@
+import time
+import unittest
+from js.interpreter import run, GlobalObject, BudgetExceeded
+
+engines = ['tree', 'bytecode', 'python']
+
+class Limits(unittest.TestCase):
+	def test_steps(self):
+		js = "function f() { while (1) {} } try { f() } catch (e) {} 1"
+		for engine in engines:
+			self.assertRaises(BudgetExceeded, run, js, engine=engine,
+				steps=1000)
+
+	def test_within_budget(self):
+		# ten iterations and a call
+		js = "function f(n) { return n * 2 } var s = 0;" \
+			"for (var i = 0; i < 10; i++) s += i; f(s)"
+		for engine in engines:
+			self.assertEqual(run(js, engine=engine, steps=11), 90)
+			self.assertRaises(BudgetExceeded, run, js, engine=engine,
+				steps=10)
+
+	def test_recursion(self):
+		js = "function f(n) { return n ? f(n - 1) : 0 } f(500)"
+		for engine in engines:
+			self.assertRaises(BudgetExceeded, run, js, engine=engine,
+				steps=100)
+
+	def test_deadline(self):
+		global_object = GlobalObject()
+		self.assertRaises(BudgetExceeded, run, "do {} while (true)",
+			global_object, deadline=time.time() + 0.05)
+		self.assertEqual(global_object.budget, None)
+		self.assertEqual(run("1", global_object), 1)
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Limits),
+		])
+	return suite
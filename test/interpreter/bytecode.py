@@ -0,0 +1,94 @@
+import unittest
+from js.parser import parse_str
+from js.interpreter import run
+from js import bytecode
+from js.bytecode import compile_program, dumps, loads
+
+def run_bytecode(js):
+	return run(js, engine='bytecode')
+
+class Bytecode(unittest.TestCase):
+	def test_loops(self):
+		js = """var s = 0;
+			outer: for (var i = 0; i < 5; i++) {
+				for (var j = 0; j < 5; j++) {
+					if (j == 3) continue outer;
+					if (i == 4) break outer;
+					s += i * j;
+				}
+			}
+			var k = 0;
+			do k++; while (k < 3);
+			s + k"""
+		self.assertEqual(run_bytecode(js), run(js))
+		self.assertEqual(run_bytecode(js), 21)
+
+	def test_finally(self):
+		js = """var log = '';
+			function f() {
+				for (var i = 0; i < 3; i++) {
+					try {
+						if (i == 1) continue;
+						if (i == 2) return 'r';
+					} finally { log += i; }
+				}
+			}
+			f() + log"""
+		self.assertEqual(run_bytecode(js), 'r012')
+
+	def test_switch(self):
+		js = """function f(x) {
+				switch (x) {
+				case 1: return 'one';
+				case 2: x = 'two'; break;
+				default: x = 'other';
+				}
+				return x;
+			}
+			f(1) + f(2) + f(3)"""
+		self.assertEqual(run_bytecode(js), 'onetwoother')
+
+	def test_scopes(self):
+		js = """var o = {a: 1, b: 2}, keys = '';
+			for (var k in o) keys += k;
+			with (o) { a = 3; }
+			try { throw o; } catch (e) { e.b = 4; }
+			keys + o.a + o.b"""
+		self.assertEqual(run_bytecode(js), 'ab34')
+
+	def test_serialize(self):
+		code = compile_program(parse_str(
+			"function f(n) { return n < 2 ? n : f(n - 1) + f(n - 2); } f(10)"))
+		self.assertEqual(dumps(loads(dumps(code))), dumps(code))
+
+class Recursion(unittest.TestCase):
+	def test_deep(self):
+		self.assertEqual(run_bytecode("""function f(n) {
+				return n ? 1 + f(n - 1) : 0;
+			}
+			f(5000)"""), 5000)
+		self.assertEqual(run_bytecode("""function P(n) {
+				this.n = n ? new P(n - 1).n + 1 : 0;
+			}
+			new P(2000).n"""), 2000)
+
+	def test_overflow(self):
+		max_depth = bytecode.max_depth
+		bytecode.max_depth = 100
+		try:
+			self.assertEqual(run_bytecode("""var depth = 0;
+				function f() {
+					depth++;
+					try { return f(); } finally { depth--; }
+				}
+				try { f(); } catch (e) { [e.name, depth].join(); }"""),
+				'RangeError,0')
+		finally:
+			bytecode.max_depth = max_depth
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Bytecode),
+		unittest.TestLoader().loadTestsFromTestCase(Recursion),
+		])
+	return suite
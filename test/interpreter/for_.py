@@ -29,6 +29,18 @@ class For(unittest.TestCase):
 		self.assertEqual(run(
 			'for (var i = 0; i < 10; i = i + 1) ; i'), 10)
 
+	def test_abrupt(self):
+		self.assertEqual(run(
+			"""var s = '';
+			outer: for (var i = 0; i < 3; i++) {
+				switch (i) { case 1: continue outer; default: s += i; }
+				try { if (i == 2) break; } finally { s += '!'; }
+			}
+			s"""), '0!2!')
+		self.assertEqual(run(
+			"""function f() { for (;;) { try { return 1; } finally { x = 2; } } }
+			var x = 0; f() + x"""), 3)
+
 def suite():
 	suite = unittest.TestSuite([
 		unittest.TestLoader().loadTestsFromTestCase(LabelledStatement),
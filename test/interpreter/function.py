@@ -1,5 +1,7 @@
 import unittest
+from js.parser import parse_str
 from js.interpreter import run, GlobalObject
+import js.bytecode, js.transpiler
 
 class Names(unittest.TestCase):
 
@@ -17,6 +19,52 @@ class Names(unittest.TestCase):
 		#self.assertRaises(Exception, run, "a", object)
 		self.assertEqual(run("b", global_object), run("b()", global_object))
 
+	def test_scopes(self):
+		self.assertEqual(run("""var g = 'g';
+			function outer(a) {
+				var b = 'b';
+				function inner(c) {
+					try { throw c; }
+					catch (e) { return function () { return a + b + e + g; }; }
+				}
+				return inner('e')();
+			}
+			outer('a')"""), 'abeg')
+		self.assertEqual(run("""function f(o) {
+				var x = 1;
+				with (o) { x = 2; }
+				return x + o.x;
+			}
+			f({x: 0})"""), 3)
+
+class Lazy(unittest.TestCase):
+	def test_lazy(self):
+		program = parse_str("""var a = 1;
+			function outer(b) {
+				var c = '}'; // }
+				function inner() { return a + b + c; }
+				if (false) c = /}/;
+				return inner();
+			}
+			outer(2)""", lazy=True)
+		outer, = program.functions.values()
+		self.assertEqual(outer.block, None)
+		self.assertEqual(run(program), '3}')
+		self.assertEqual(len(outer.block), 4)
+
+	def test_syntax_error(self):
+		program = parse_str("""var a = 1;
+			function broken() { var = 1; }""", lazy=True)
+		global_object = GlobalObject()
+		# compiling engines parse the bodies before running
+		try:
+			run(program, global_object)
+			run("broken()", global_object)
+		except SyntaxError, e:
+			self.assertEqual(e.lineno, 1)
+		else:
+			self.fail()
+
 class Arguments(unittest.TestCase):
 	def test_arguments(self):
 		self.assertEqual(run("(function () {return arguments.length})(1, 2)"), 2)
@@ -26,6 +74,22 @@ class Arguments(unittest.TestCase):
 		global_object = GlobalObject()
 		self.assertEqual(run("function a () { return arguments.callee; }; a()", global_object), run("a", global_object))
 
+	def test_uses_arguments(self):
+		program = parse_str("""function a(x) { return x + b(x, 2); }
+			function b() { var c = function () { return 1; };
+				return arguments.length + c(); }
+			function d(o) { with (o) return arguments; }
+			a(1) + d({}).length""")
+		self.assertEqual(run(program), 5)
+		a, b, d = [program.functions[name] for name in
+			sorted(program.functions, key=lambda name: name.value)]
+		self.assertEqual((a.uses_arguments, b.uses_arguments, d.uses_arguments),
+			(None, True, True))
+		self.assertEqual(run("""function f(x) {
+				return function () { return arguments[0]; }(x);
+			}
+			f(5)"""), 5)
+
 class Call(unittest.TestCase):
 	def test_call(self):
 		self.assertEqual(run("function a(){return 1};a.call()"), 1)
@@ -36,11 +100,24 @@ class Call(unittest.TestCase):
 		self.assertEqual(run("function a(){return arguments.length};a.call(a, 2)"), 1)
 		self.assertEqual(run("function a(){return arguments.length};a.call(a, 2, 4)"), 2)
 
+class Overflow(unittest.TestCase):
+	def test_overflow(self):
+		js = """function f(n) { return f(n + 1) + 1; }
+			function g() { return g.call(null); }
+			var names = [];
+			try { f(0); } catch (e) { names.push(e.name); }
+			try { g(); } catch (e) { names.push(e.name); }
+			names.join()"""
+		for engine in 'tree', 'bytecode', 'python':
+			self.assertEqual(run(js, engine=engine), 'RangeError,RangeError')
+
 def suite():
 	suite = unittest.TestSuite([
 		unittest.TestLoader().loadTestsFromTestCase(Names),
+		unittest.TestLoader().loadTestsFromTestCase(Lazy),
 		unittest.TestLoader().loadTestsFromTestCase(Arguments),
 		unittest.TestLoader().loadTestsFromTestCase(Call),
+		unittest.TestLoader().loadTestsFromTestCase(Overflow),
 		])
 	return suite
 
@@ -0,0 +1,68 @@
+import unittest
+from StringIO import StringIO
+from js.lexer import tokenize
+from js.parser import parse_str
+from js.interpreter import run
+
+source = """var re = /a\\/b/g, n = 1e+5 / 2;
+/* comment */ var s = 'it\\'s', t = "multi\\
+line";
+return /x/
+"""
+
+class Tokenize(unittest.TestCase):
+	def test_tokenize(self):
+		tokens = list(tokenize(source))
+		self.assertEqual([t.value for t in tokens], [
+			'var', 're', '=', '/a\\/b/g', ',', 'n', '=', '1e+5', '/', '2',
+			';', 'var', 's', '=', "it's", ',', 't', '=', 'multiline', ';',
+			'return', '/x/'])
+		self.assertEqual(tokens[3].type, '(regexp)')
+		self.assertEqual(tokens[8].type, '(punctuator)')
+		self.assertEqual(tuple(tokens[11]), ('(identifier)', 'var', 1, 14))
+		self.assertEqual(tuple(tokens[18]), ('(string)', 'multiline', 1, 35))
+		self.assertEqual(tokens[19].lineno, 2)
+
+	def test_chunks(self):
+		tokens = list(tokenize(source))
+		for size in 1, 2, 3, 5:
+			self.assertEqual(list(tokenize(StringIO(source), chunk_size=size)),
+				tokens)
+		self.assertEqual(list(tokenize(iter(source))), tokens)
+
+	def test_error(self):
+		try:
+			list(tokenize(StringIO('a = 1;\nb = "x'), chunk_size=2))
+		except SyntaxError, e:
+			self.assertEqual((e.lineno, e.offset), (1, 4))
+		else:
+			self.fail()
+
+	def test_error_lines(self):
+		# lexer and parser errors both count lines from 0
+		for source in 'a = 1;\n#', 'a = 1;\nvar = 2;':
+			try:
+				parse_str(source)
+			except SyntaxError, e:
+				self.assertEqual((e.lineno, e.text), (1, source[7:]))
+			else:
+				self.fail()
+
+	def test_bad_escapes(self):
+		self.assertEqual(run(r'"\u0041\x42\\u"'), u'AB\\u')
+		for source in r'a = 1;\n"a\uZZZZ"', r'"\x4"', r'"b\u12"':
+			source = source.replace(r'\n', '\n')
+			try:
+				list(tokenize(source))
+			except SyntaxError, e:
+				self.assertEqual(e.msg, 'Bad escape sequence.')
+				self.assertEqual((e.lineno, e.offset),
+					(source.count('\n'), 0))
+			else:
+				self.fail()
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Tokenize),
+		])
+	return suite
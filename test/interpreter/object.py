@@ -0,0 +1,44 @@
+import gc
+import unittest
+from js.interpreter import run, GlobalObject, JavaScriptObject
+
+class Shapes(unittest.TestCase):
+	def test_shared(self):
+		global_object = GlobalObject()
+		run("var a = {x: 1, y: 2}, b = {x: 3, y: 4}, c = {y: 5, x: 6}",
+			global_object)
+		a, b, c = [global_object[name] for name in 'abc']
+		self.assert_(a.shape is b.shape)
+		self.assert_(a.shape is not c.shape)
+		run("delete b.x", global_object)
+		self.assert_(a.shape is not b.shape)
+		self.assertEqual(a.shape.keys, ['x', 'y'])
+
+	def test_released(self):
+		# objects used as dictionaries leave no shapes behind once gone
+		root = JavaScriptObject.root_shape
+		run("for (var i = 0; i < 1000; i++) { var d = {}; d['k' + i] = i; }")
+		gc.collect()
+		self.assert_(len(root.transitions) < 10)
+		global_object = GlobalObject()
+		run("""var a = {}, b = {}; a['p' + 1] = 1; a.q = 2;
+			b.p1 = 3; b.q = 4""", global_object)
+		gc.collect()
+		self.assert_(global_object['a'].shape is global_object['b'].shape)
+
+	def test_cached_access(self):
+		self.assertEqual(run(
+			"""function get(o) { return o.x + o['y']; }
+			function set(o, v) { o.x = v; o['y'] = v; }
+			var a = {x: 1, y: 2}, b = {y: 3, x: 4}, s = '';
+			s += get(a) + get(b) + get(a);
+			set(a, 5); set(b, 6); delete a.y;
+			s += ',' + get(a) + ',' + get(b);
+			set(a, 7);
+			s + ',' + get(a)"""), '13,NaN,12,14')
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Shapes),
+		])
+	return suite
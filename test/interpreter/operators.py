@@ -0,0 +1,30 @@
+import unittest
+from js.interpreter import run
+import js.bytecode, js.transpiler
+
+class Chains(unittest.TestCase):
+	def test_long_chains(self):
+		n = 5000 # well past the recursion limit
+		source = """var a = 1, b = '', c = 0;
+			function f() { return %s; }
+			[f(), %s, %s, %s].join()""" % (
+			' + '.join(['a'] * n), ' - '.join(['a'] * n),
+			' && '.join(['a'] * n + ['c']), ' || '.join(['b'] * n + ['c']))
+		for engine in 'tree', 'bytecode', 'python':
+			self.assertEqual(run(source, engine=engine),
+				'%d,%d,0,0' % (n, 2 - n))
+
+class Shifts(unittest.TestCase):
+	def test_shifts(self):
+		source = """[1 << 5, 1 << 31, 1 << 32, 3 << 33, 256 >> 2, -8 >> 1,
+			-1 >> 40, -1 >>> 0, -8 >>> 1, 256 >>> 34].join()"""
+		for engine in 'tree', 'bytecode', 'python':
+			self.assertEqual(run(source, engine=engine), '32,-2147483648,1,'
+				'6,64,-4,-1,4294967295,2147483644,64')
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Chains),
+		unittest.TestLoader().loadTestsFromTestCase(Shifts),
+		])
+	return suite
@@ -0,0 +1,41 @@
+import unittest
+from js.parser import parse_str
+from js.interpreter import run
+from js.optimizer import optimize
+from compressor import compress
+
+def optimized(js):
+	return optimize(parse_str(js))
+
+class Fold(unittest.TestCase):
+	def test_constants(self):
+		for source in ("60 * 60 * 24", "'a' + 'b' + 1.5", "0.1 + 0.2",
+				"1 - 4", "!0 + ~5", "(1 < 2) + ('a' <= 'b') + (null == 0)",
+				"var x = 'q'; x + 'a' + 'b' + 3 + 'c'",
+				"var x = 1; (x + 1) * (2 + 3)"):
+			self.assertEqual(run(optimized(source)), run(source))
+		self.assertEqual(compress(optimized("60 * 60 * 24").first), '86400;')
+		self.assertEqual(compress(optimized("var x; x + 'a' + 'b' + 3").first),
+			'var x;x+"ab"+3;')
+		self.assertEqual(compress(optimized("var x; x - (3 - 4)").first),
+			'var x;x- -1;')
+		compressed = compress(optimized("(1 + 2).toString()").first)
+		self.assertEqual(compressed, '(3).toString();')
+		parse_str(compressed)
+		compressed = compress(optimized("(1 + 2).valueOf() + 1").first)
+		self.assertEqual(run(compressed), 4)
+
+	def test_branches(self):
+		program = optimized("""var x = 0, o = {f: function () { return this; }};
+			if (false) { x = 1; var y = 2; } else x += 2;
+			while (0) x++;
+			function f() { return 1 ? x : y; }
+			[f(), typeof y, 1 && x, (0 || o.f)() === o].join()""")
+		self.assertEqual(compress(program.first[1:3]), 'x+=2;')
+		self.assertEqual(run(program), '2,undefined,2,false')
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Fold),
+		])
+	return suite
@@ -0,0 +1,166 @@
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+from js import parser
+from js.parser import Parser, JavaScriptSyntaxError, parse_str, parse_files, \
+	parse_iter, main
+from js.interpreter import run
+
+class Reentrant(unittest.TestCase):
+	def test_threads(self):
+		sources = ['var a%d = [%s];\nfunction f(x) { return x * %d; }' %
+			(i, ', '.join(['{k: %d}' % j for j in range(200)]), i)
+			for i in range(8)]
+		expected = [repr(parse_str(source).first) for source in sources]
+		results = {}
+		def parse(i):
+			results[i] = repr(parse_str(sources[i]).first)
+		threads = [threading.Thread(target=parse, args=(i,))
+			for i in range(len(sources))]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual([results[i] for i in range(len(sources))], expected)
+
+	def test_error(self):
+		p = Parser('var a = 1;\nvar = 2;', 'b.js')
+		other = Parser('var b;')
+		try:
+			p.parse_program()
+		except JavaScriptSyntaxError, e:
+			self.assertEqual((e.filename, e.lineno, e.text),
+				('b.js', 1, 'var = 2;'))
+		else:
+			self.fail()
+		self.assertEqual(other.parse_program().vars, set(['b']))
+
+class Nodes(unittest.TestCase):
+	def test_fields(self):
+		program = parse_str('if (a) b(); else c;')
+		s = program.first[0].first
+		self.assertEqual(s.id, 'if')
+		self.assertFalse(hasattr(s, '__dict__'))
+		self.assertEqual((s.counter, s.catchblock), (None, None))
+		self.assertNotEqual(s.elseblock, None)
+		self.assertNotEqual(s.kind, program.first[0].kind)
+
+	def test_pickle(self):
+		program = parse_str('function f(x) { return x + 1; } f(2)')
+		self.assertEqual(run(program), 3)
+		copy = pickle.loads(pickle.dumps(program, 2))
+		self.assertEqual(repr(copy.first), repr(program.first))
+		self.assertEqual(copy.code, None)
+		self.assertEqual(run(copy), 3)
+
+class ParseFiles(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filenames = []
+		for i, source in enumerate(['var a = [1, 2]; a.length + 1',
+				'var a = 1;\nvar = 2;']):
+			filename = os.path.join(self.directory, '%d.js' % i)
+			open(filename, 'w').write(source)
+			self.filenames.append(filename)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_parse_files(self):
+		for workers in 1, 2:
+			(ok, ast, error), (bad, none, e) = \
+				parse_files(self.filenames, workers, ast=True)
+			self.assertEqual((ok, bad), tuple(self.filenames))
+			self.assertEqual((error, none), (None, None))
+			self.assertEqual(run(ast), 3)
+			self.assert_(isinstance(e, JavaScriptSyntaxError))
+			self.assertEqual((e.filename, e.lineno), (bad, 1))
+		self.assertEqual(parse_files(self.filenames[:1], 2)[0][1], None)
+
+	def test_missing_file(self):
+		missing = os.path.join(self.directory, 'missing.js')
+		for workers in 1, 2:
+			(filename, ast, e), ok = parse_files([missing,
+				self.filenames[0]], workers)
+			self.assert_(isinstance(e, IOError))
+			self.assertEqual(ok[2], None)
+		stderr, sys.stderr = sys.stderr, StringIO()
+		try:
+			status = main(['-j', '1', missing] + self.filenames)
+			output = sys.stderr.getvalue()
+		finally:
+			sys.stderr = stderr
+		self.assertEqual(status, 1)
+		self.assertEqual(output, '%s: No such file or directory\n%s:2: '
+			'Expected an identifier and instead saw \'=\'.\n' % (
+			missing, self.filenames[1]))
+
+	def test_bad_source(self):
+		# malformed escapes and deep nesting are syntax errors like others
+		bad = []
+		for i, source in enumerate(['var s = 1;\n"\\uZZZZ";',
+				'x = %s1%s;' % ('(' * 3000, ')' * 3000)]):
+			bad.append(os.path.join(self.directory, 'bad%d.js' % i))
+			open(bad[-1], 'w').write(source)
+		stderr, sys.stderr = sys.stderr, StringIO()
+		try:
+			status = main(['-j', '2', self.filenames[0]] + bad)
+			output = sys.stderr.getvalue()
+		finally:
+			sys.stderr = stderr
+		self.assertEqual(status, 1)
+		self.assertEqual(output, '%s:2: Bad escape sequence.\n'
+			'%s:1: Nested too deeply.\n' % tuple(bad))
+
+class Cache(unittest.TestCase):
+	def setUp(self):
+		parser.cache_directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(parser.cache_directory)
+		parser.cache_directory = None
+
+	def test_cache(self):
+		source = 'var a = {b: [1, 2]}; function f() { return a.b; } f()[1]'
+		program = parse_str(source)
+		path, = os.listdir(parser.cache_directory)
+		cached = parse_str(source)
+		self.assert_(cached is not program)
+		self.assertEqual(repr(cached.first), repr(program.first))
+		self.assertEqual(run(cached), 2)
+		open(os.path.join(parser.cache_directory, path), 'w').write('junk')
+		self.assertEqual(run(parse_str(source)), 2)
+		self.assertEqual(len(os.listdir(parser.cache_directory)), 1)
+
+class Stream(unittest.TestCase):
+	def test_parse_iter(self):
+		source = """var a = [];
+			function f(x) { var y = x; a.push(y); }
+			f(1); ;
+			for (var i = 2; i < 4; i++) f(i);
+			a.join()"""
+		programs = parse_iter(source)
+		program = programs.next()
+		self.assertEqual(program.vars, set(['a']))
+		self.assertEqual(program.functions, {})
+		program = programs.next()
+		self.assertEqual(program.vars, set())
+		self.assertEqual([name.value for name in program.functions], ['f'])
+		self.assertEqual([p.vars for p in programs], [set(), set(['i']), set()])
+		self.assertEqual(run(source, stream=True), '1,2,3')
+		self.assertRaises(JavaScriptSyntaxError, list, parse_iter('f(1); }'))
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Reentrant),
+		unittest.TestLoader().loadTestsFromTestCase(Nodes),
+		unittest.TestLoader().loadTestsFromTestCase(ParseFiles),
+		unittest.TestLoader().loadTestsFromTestCase(Cache),
+		unittest.TestLoader().loadTestsFromTestCase(Stream),
+		])
+	return suite
@@ -0,0 +1,52 @@
+import unittest
+from js.scheduler import Scheduler
+from js.interpreter import JavaScriptException, GlobalObject, \
+	BudgetExceeded, run
+
+class Round(unittest.TestCase):
+	def test_interleave(self):
+		scheduler = Scheduler(quota=10)
+		long = scheduler.spawn("""var n = 0;
+			function inc() { n++; }
+			while (n < 1000) inc();
+			n""")
+		short = scheduler.spawn("var s = 0; for (var i = 0; i < 5; i++) s += i; s")
+		failing = scheduler.spawn("null.x", quota=1)
+		finished = []
+		while scheduler.tasks:
+			task = scheduler.step()
+			if task.done:
+				finished.append(task)
+		self.assertEqual(finished, [short, failing, long])
+		self.assertEqual((long.value, short.value), (1000, 10))
+		self.assert_(isinstance(failing.error, JavaScriptException))
+		# each realm has its own globals
+		self.assertEqual(long.global_object['n'], 1000)
+		self.assert_('n' not in short.global_object)
+
+	def test_suspend(self):
+		scheduler = Scheduler(quota=3)
+		task = scheduler.spawn("var i = 0; do i++; while (i < 7); i")
+		slices = 0
+		while not task.step():
+			slices += 1
+		self.assertEqual((task.value, slices), (7, 2))
+
+	def test_budget(self):
+		# the budget is only in force during the task's own slices
+		scheduler = Scheduler(quota=10)
+		shared = GlobalObject()
+		endless = scheduler.spawn("while (true) {}", shared, steps=100)
+		counting = scheduler.spawn(
+			"for (var i = 0; i < 200; i++) {} i", shared)
+		scheduler.run()
+		self.assert_(isinstance(endless.error, BudgetExceeded))
+		self.assertEqual(counting.value, 200)
+		self.assertEqual(shared.budget, None)
+		self.assertEqual(run("var j = 0; while (j < 500) j++; j", shared), 500)
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Round),
+		])
+	return suite
@@ -33,11 +33,27 @@ class Substr(unittest.TestCase):
 		self.assertEqual(run("'test'.substr(3)"), "t")
 		self.assertEqual(run("'test'.substr()"), "test")
 
+class Concatenation(unittest.TestCase):
+	def test_long(self):
+		global_object = GlobalObject()
+		self.assertEqual(run(
+			"""var s = '', t = '';
+			for (var i = 0; i < 1000; i++) { s += i % 10; t = (i % 10) + t; }
+			s.length""", global_object), 1000)
+		s = ''.join(str(i % 10) for i in range(1000))
+		self.assertEqual(run("s", global_object), s)
+		self.assertEqual(run("t", global_object), s[::-1])
+		self.assertEqual(run("s.charAt(998) + t.charAt(0)", global_object),
+			'89')
+		self.assertEqual(run("s + '' === s && s < s + 'x'", global_object),
+			True)
+
 def suite():
 	suite = unittest.TestSuite([
 		unittest.TestLoader().loadTestsFromTestCase(String),
 		unittest.TestLoader().loadTestsFromTestCase(CharCodeAt),
 		unittest.TestLoader().loadTestsFromTestCase(Substr),
+		unittest.TestLoader().loadTestsFromTestCase(Concatenation),
 		])
 	return suite
 
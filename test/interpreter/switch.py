@@ -1,6 +1,7 @@
 import unittest
 from js.parser import JavaScriptSyntaxError
 from js.interpreter import run, GlobalObject
+import js.bytecode, js.transpiler
 
 class SwitchStatement(unittest.TestCase):
 	def test_switch_fallthrough(self):
@@ -197,6 +198,19 @@ case 1:
 		run(js, global_object)
 		self.assertEquals(run("se", global_object), 2)
 
+	def test_break_value(self):
+		# a break completes with the value of the statements before it
+		for js, value in (
+				("var s = 'a'; switch (s) { case s: 'yes'; break }", 'yes'),
+				("switch (1) { case 1: 'one'; case 2: 'two'; break; }", 'two'),
+				("var i = 0; while (1) { i++; 'x' + i; if (i == 2) break; }",
+					'x2'),
+				("for (var i = 0; i < 2; i++) { 'w'; { break; } }", 'w'),
+				("var i = 0; do { i++; 'y' + i; continue; } while (i < 3)",
+					'y3')):
+			for engine in 'tree', 'bytecode', 'python':
+				self.assertEqual(run(js, engine=engine), value)
+
 def suite():
 	suite = unittest.TestSuite([
 		unittest.TestLoader().loadTestsFromTestCase(SwitchStatement),
@@ -0,0 +1,92 @@
+import unittest
+from js.parser import parse_str
+from js.interpreter import run, GlobalObject, JavaScriptFunction
+from js.transpiler import transpile, PythonFunction
+
+def run_transpiled(js):
+	context = parse_str(js)
+	transpile(context)
+	return run(context, engine='python')
+
+class Transpile(unittest.TestCase):
+	def test_loops(self):
+		js = """function f(n) {
+				var s = 0;
+				for (var i = 0; i < n; i++) {
+					if (i % 3 == 0) continue;
+					s += i;
+				}
+				var j = 0;
+				do { s = s + 1; j++; } while (j < 2);
+				while (j) { j--; }
+				return s;
+			}
+			f(10)"""
+		self.assertEqual(run_transpiled(js), run(js))
+		self.assertEqual(run_transpiled(js), 29)
+
+	def test_recursion(self):
+		self.assertEqual(run_transpiled(
+			"function f(n) { return n < 2 ? n : f(n - 1) + f(n - 2); } f(12)"),
+			144)
+
+	def test_try(self):
+		js = """function f(x) {
+				try { if (x) throw 'boom'; return 'ok'; }
+				catch (e) { return e + '!'; }
+			}
+			f(true) + f(false)"""
+		self.assertEqual(run_transpiled(js), 'boom!ok')
+
+	def test_properties(self):
+		self.assertEqual(run_transpiled(
+			"""function f() { var p = {a: 1}; p.a += 2; p['b'] = p.a * 2;
+			return p.b && p.a || 0; } f()"""), 3)
+		self.assertEqual(run_transpiled(
+			"function P(a) { this.a = a; } new P(3).a"), 3)
+
+	def test_fallback(self):
+		context = parse_str("""
+			function a() { return arguments.length; }
+			function w(o) { with (o) { return x; } }
+			function l(x) { return x * 2; }""")
+		self.assertEqual(transpile(context), 1)
+		global_object = GlobalObject()
+		run(context, global_object, engine='python')
+		self.assertEqual(run("a(1, 2) + w({x: 3}) + l(2)", global_object), 9)
+		self.assertEqual(global_object['l'].__class__, PythonFunction)
+
+	def test_shared_tree(self):
+		# translating a program leaves other engines running it alone
+		program = parse_str("function f(x) { return x + 1; } f")
+		self.assertEqual(run(program, engine='python').__class__,
+			PythonFunction)
+		self.assertEqual(run(program, engine='tree').__class__,
+			JavaScriptFunction)
+		global_object = GlobalObject()
+		run(program, global_object, engine='python')
+		self.assertEqual(run("f(1)", global_object), 2)
+
+	def test_python_limits(self):
+		# functions CPython won't compile are left to the interpreter
+		nested_loops = 'function f() { var n = 0; %s n++; return n; } f()' % (
+			''.join('for (var i%d = 0; i%d < 1; i%d++)' % (i, i, i)
+				for i in range(22)))
+		nested_ifs = 'function f(x) { %s return 1; } f(1)' % (
+			'if (x) ' * 110)
+		continue_finally = """function f() {
+				var i = 0;
+				while (i < 3) { i++; try { } finally { continue } }
+				return i;
+			}
+			f()"""
+		for js, value in ((continue_finally, 3), (nested_loops, 1),
+				(nested_ifs, 1)):
+			self.assertEqual(transpile(parse_str(js)), 0)
+			self.assertEqual(run(js, engine='python'), value)
+
+def suite():
+	suite = unittest.TestSuite([
+		unittest.TestLoader().loadTestsFromTestCase(Transpile),
+		])
+	return suite